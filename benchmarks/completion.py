@@ -0,0 +1,118 @@
+#! python
+
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2012 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Completion matching benchmark.
+
+Builds a WordList (see autocomplete/wordlist.py) from the LilyPond commands
+in ly.words, filled up with generated identifiers to the requested number of
+entries (default: 5000), and then types a number of words character by
+character, matching the typed text after every keystroke.
+
+Reports the time needed to build the WordList and the average and maximum
+time needed to match, for typed prefixes, word parts and abbreviations.
+Like the completer does, at most 500 matches are returned.
+
+Usage:
+  python benchmarks/completion.py [number of entries [maximum matches, 0 for all]]
+
+Does not need PyQt4.
+
+"""
+
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import imp
+import itertools
+import os
+import random
+import sys
+import time
+
+import corpus
+
+import ly.words
+
+wordlist = imp.load_source('wordlist', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    '..', 'frescobaldi_app', 'autocomplete', 'wordlist.py'))
+
+
+# the texts typed, by kind of match
+typed = (
+    ('prefix', ('\\override', '\\relative', '\\markup', '\\time', '\\voiceOne')),
+    ('word part', ('\\signature', '\\stem', '\\down', '\\staff', '\\voice')),
+    ('abbreviation', ('\\dts', '\\ncdir', '\\sdn', '\\obs', '\\vone')),
+)
+
+
+def entries(count, seed=0):
+    """Returns a list of count entries: LilyPond commands and identifiers."""
+    words = set(itertools.chain(
+        ly.words.lilypond_keywords,
+        ly.words.lilypond_music_commands,
+        ly.words.articulations,
+        ly.words.ornaments,
+        ly.words.fermatas,
+        ly.words.instrument_scripts,
+        ly.words.repeat_scripts,
+        ly.words.markupcommands,
+        ly.words.contexts,
+    ))
+    rnd = random.Random(seed)
+    parts = ('violin', 'viola', 'cello', 'flute', 'oboe', 'horn', 'soprano',
+             'alto', 'tenor', 'bass', 'Music', 'Lyrics', 'Verse', 'Chords',
+             'Global', 'Dynamics', 'One', 'Two', 'Three', 'Part', 'Intro')
+    while len(words) < count:
+        words.add(rnd.choice(parts[:10]) + ''.join(rnd.sample(parts[10:], 2)))
+        words.add('{0}{1}'.format(rnd.choice(parts), rnd.randint(1, 10000)))
+    return sorted(words)[:count]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    items = entries(count)
+    start = time.time()
+    words = wordlist.WordList(items, lambda item: '\\' + item)
+    build = time.time() - start
+    print("{0} entries, built in {1:.1f} ms".format(len(words), build * 1000))
+    slowest = 0.0
+    for kind, texts in typed:
+        times = []
+        found = []
+        for text in texts:
+            for i in range(1, len(text) + 1):
+                start = time.time()
+                matches = words.match(text[:i], limit)
+                times.append(time.time() - start)
+            found.append(len(matches))
+        slowest = max(slowest, max(times))
+        print("{0:14} average {1:6.2f} ms, maximum {2:6.2f} ms, {3} matches".format(
+            kind, sum(times) / len(times) * 1000, max(times) * 1000,
+            ", ".join(map(str, found))))
+    print("slowest match: {0:.2f} ms ({1})".format(slowest * 1000,
+        "OK" if slowest < 0.01 else "slower than 10 ms"))
+
+
+if __name__ == '__main__':
+    main()
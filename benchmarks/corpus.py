@@ -0,0 +1,218 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2012 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Generates a reproducible corpus of LilyPond input for the benchmarks.
+
+The benchmark scripts in this directory are run from the toplevel
+Frescobaldi directory, e.g.:
+
+python benchmarks/highlighting.py
+
+"""
+
+from __future__ import unicode_literals
+
+import os
+import random
+import sys
+
+
+# make the frescobaldi_app modules available as toplevel modules
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'frescobaldi_app'))
+
+
+def music(rnd, measures):
+    """Returns a string with the specified number of measures of dense music."""
+    notes = 'c d e f g a b'.split()
+    octaves = ('', "'", "''", ',')
+    durations = ('', '4', '8', '16', '8.', '2')
+    articulations = ('', '', '', '-.', '->', '(', ')', '~', '\\p', '\\f', '-3')
+    lines = []
+    for m in range(measures):
+        items = []
+        for n in range(8):
+            note = rnd.choice(notes) + rnd.choice(('', 'is', 'es'))
+            if rnd.random() < 0.15:
+                note = '<{0} {1}>'.format(note, rnd.choice(notes) + rnd.choice(octaves))
+            else:
+                note += rnd.choice(octaves)
+            items.append(note + rnd.choice(durations) + rnd.choice(articulations))
+        lines.append('  ' + ' '.join(items) + ' |')
+    return '\n'.join(lines)
+
+
+def piano(measures=400, seed=0):
+    """Returns the text of a piano piece."""
+    rnd = random.Random(seed)
+    return '\n'.join((
+        '\\version "2.16.0"',
+        '\\header { title = "Piano piece" composer = "Anonymous" }',
+        'right = \\relative c\'\' {',
+        '  \\time 4/4 \\key g \\major',
+        music(rnd, measures),
+        '}',
+        'left = \\relative c {',
+        '  \\clef bass \\key g \\major',
+        music(rnd, measures),
+        '}',
+        '\\score {',
+        '  \\new PianoStaff <<',
+        '    \\new Staff \\right',
+        '    \\new Staff \\left',
+        '  >>',
+        '  \\layout { }',
+        '  \\midi { }',
+        '}',
+        ''))
+
+
+def orchestral(staves=24, measures=200, seed=0):
+    """Returns the text of a big orchestral score."""
+    rnd = random.Random(seed)
+    instruments = ('flute', 'oboe', 'clarinet', 'bassoon', 'horn', 'trumpet',
+        'trombone', 'tuba', 'timpani', 'violinI', 'violinII', 'viola',
+        'cello', 'contrabass')
+    names = [instruments[i % len(instruments)] + 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'[i // len(instruments)]
+             for i in range(staves)]
+    lines = ['\\version "2.16.0"',
+             '\\header { title = "Symphony" composer = "Anonymous" }',
+             'global = { \\time 3/4 \\key es \\major \\tempo "Allegro" 4 = 132 }']
+    for name in names:
+        lines.extend((
+            '{0} = \\relative c\' {{'.format(name),
+            '  \\global',
+            '  \\set Staff.instrumentName = #"{0}"'.format(name),
+            '  \\override Staff.TimeSignature #\'style = #\'numbered',
+            music(rnd, measures),
+            '  \\bar "|."',
+            '}'))
+    lines.extend(('\\score {', '  <<'))
+    for name in names:
+        lines.append('    \\new Staff \\with {{ midiInstrument = #"{0}" }} \\{0}'.format(name))
+    lines.extend(('  >>', '  \\layout {', '    \\context { \\Score',
+        '      \\override BarNumber #\'break-visibility = #end-of-line-invisible',
+        '    }', '  }', '}', ''))
+    return '\n'.join(lines)
+
+
+def lytex(fragments=200, seed=0):
+    """Returns the text of a LaTeX document with LilyPond fragments."""
+    rnd = random.Random(seed)
+    lines = ['\\documentclass[a4paper]{article}', '\\begin{document}']
+    for i in range(fragments):
+        lines.extend((
+            '\\section{{Example {0}}}'.format(i),
+            'The following fragment shows a melody in {0} measures.'.format(i % 8 + 1),
+            '\\begin{lilypond}[quote,fragment]',
+            '\\relative c\'\' {',
+            music(rnd, i % 8 + 1),
+            '}',
+            '\\end{lilypond}',
+            'Inline: \\lilypond[fragment]{c\'4 d\'8 e\'}.',
+            ''))
+    lines.extend(('\\end{document}', ''))
+    return '\n'.join(lines)
+
+
+def html(fragments=200, seed=0):
+    """Returns the text of a HTML document with LilyPond fragments."""
+    rnd = random.Random(seed)
+    lines = ['<html>', '<head><title>Examples</title></head>', '<body>']
+    for i in range(fragments):
+        lines.extend((
+            '<h2 class="example" id="ex{0}">Example {0}</h2>'.format(i),
+            '<p>The following fragment shows a melody &amp; chords.</p>',
+            '<lilypond fragment relative="2">',
+            music(rnd, i % 8 + 1),
+            '</lilypond>',
+            '<!-- generated example -->'))
+    lines.extend(('</body>', '</html>', ''))
+    return '\n'.join(lines)
+
+
+def texinfo(fragments=200, seed=0):
+    """Returns the text of a Texinfo document with LilyPond fragments."""
+    rnd = random.Random(seed)
+    lines = ['@node Top', '@top Examples', '@c generated examples']
+    for i in range(fragments):
+        lines.extend((
+            '@section Example {0}'.format(i),
+            'The following fragment shows a @emph{{melody}} in {0} measures.'.format(i % 8 + 1),
+            '@lilypond[quote,verbatim]',
+            '\\relative c\'\' {',
+            music(rnd, i % 8 + 1),
+            '}',
+            '@end lilypond',
+            ''))
+    lines.extend(('@bye', ''))
+    return '\n'.join(lines)
+
+
+def docbook(fragments=200, seed=0):
+    """Returns the text of a DocBook document with LilyPond fragments."""
+    rnd = random.Random(seed)
+    lines = ['<?xml version="1.0"?>', '<!DOCTYPE book>', '<book>']
+    for i in range(fragments):
+        lines.extend((
+            '<section><title>Example {0}</title>'.format(i),
+            '<programlisting language="lilypond">',
+            music(rnd, i % 8 + 1),
+            '</programlisting>',
+            '</section>'))
+    lines.extend(('</book>', ''))
+    return '\n'.join(lines)
+
+
+def scheme(functions=600, seed=0, lilypond=True):
+    """Returns the text of a Scheme-heavy library.
+    
+    If lilypond is True, a LilyPond file is returned with the functions
+    embedded, otherwise a plain Scheme file.
+    
+    """
+    rnd = random.Random(seed)
+    names = ('note', 'chord', 'music', 'grob', 'context', 'event', 'pitch', 'duration')
+    if lilypond:
+        lines = ['\\version "2.16.0"', '%% A generated library of Scheme functions', '']
+        prefix = '#'
+    else:
+        lines = [';; A generated library of Scheme functions', '']
+        prefix = ''
+    for i in range(functions):
+        name = '{0}-{1}-{2}'.format(rnd.choice(names), rnd.choice(names), i)
+        lines.extend((
+            prefix + '(define-public ({0} music #:optional (factor {1}))'.format(name, rnd.randint(1, 16)),
+            '  "Applies some transformation to @var{music}."',
+            '  (let loop ((elts (ly:music-property music \'elements))',
+            '             (count 0))',
+            '    (cond ((null? elts) count)',
+            '          ((ly:music? (car elts))',
+            '           (ly:music-set-property! (car elts) \'duration',
+            '             (ly:make-duration {0} {1} factor 1))'.format(rnd.randint(0, 4), rnd.randint(0, 2)),
+            '           (loop (cdr elts) (+ count 1)))',
+            '          (else (loop (cdr elts) count)))))  ; {0}'.format(name),
+            ''))
+        if lilypond:
+            lines.extend((
+                '{0}Function = #(define-music-function (parser location m) (ly:music?)'.format(name.replace('-', '')),
+                '  #{ \\once \\override NoteHead #\'color = #red $m #})',
+                ''))
+    return '\n'.join(lines)
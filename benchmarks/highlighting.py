@@ -0,0 +1,91 @@
+#! python
+
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2012 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Micro-benchmark for applying highlighting formats.
+
+Compares setting a format for every token with setting a format for every
+run of adjacent tokens that have the same format (HighlightFormats.runs()),
+and reports how many setFormat() calls are saved.
+
+Needs PyQt4, because the formats are read from the editor settings.
+
+"""
+
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import time
+
+import corpus
+
+import ly.lex
+import highlighter
+
+
+def lines(text):
+    """Returns a list of token tuples, one for every line, like the Highlighter."""
+    state = ly.lex.state('lilypond')
+    return [tuple(state.tokens(line)) for line in text.split('\n')]
+
+
+def per_token(formats, blocks):
+    """Returns the number of setFormat() calls setting a format for every token."""
+    calls = 0
+    for tokens in blocks:
+        for token in tokens:
+            if formats.format(token) is not None:
+                calls += 1
+    return calls
+
+
+def per_run(formats, blocks):
+    """Returns the number of setFormat() calls setting a format for every run."""
+    calls = 0
+    for tokens in blocks:
+        for run in formats.runs(tokens):
+            calls += 1
+    return calls
+
+
+def timed(func, *args):
+    """Returns the result of func(*args) and the time it took in msec."""
+    start = time.time()
+    result = func(*args)
+    return result, (time.time() - start) * 1000
+
+
+def main():
+    formats = highlighter.highlightFormats()
+    blocks = lines(corpus.piano(2000))
+    tokens = sum(map(len, blocks))
+    calls, t1 = timed(per_token, formats, blocks)
+    runs, t2 = timed(per_run, formats, blocks)
+    print("lines:               {0}".format(len(blocks)))
+    print("tokens:              {0}".format(tokens))
+    print("setFormat per token: {0} calls ({1:.1f} msec to resolve)".format(calls, t1))
+    print("setFormat per run:   {0} calls ({1:.1f} msec to resolve)".format(runs, t2))
+    print("calls saved:         {0} ({1:.1f}%)".format(
+        calls - runs, 100.0 * (calls - runs) / (calls or 1)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#! python
+
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2012 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Lexer throughput benchmark.
+
+Lexes a generated document for every mode in ly.lex.modes line by line
+(like the Highlighter does) and reports the number of tokens per second for
+every mode (the fastest of five runs).
+
+By default the benchmark is run twice, in separate processes: once with the
+word lists in the LilyPond token regular expressions compiled into prefix
+trees (ly.util.words2regexp(), the default) and once with the word lists
+simply joined with "|", to show the difference.
+
+Options:
+  --plain   only run with the word lists joined with "|"
+  --trie    only run with the word lists compiled into prefix trees
+
+Does not need PyQt4.
+
+"""
+
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import subprocess
+import sys
+import time
+
+import corpus
+
+import ly.util
+import ly.lex
+
+
+# the generated document to lex for every mode
+texts = {
+    'lilypond': lambda: corpus.piano(2000),
+    'scheme':   lambda: corpus.scheme(600, lilypond=False),
+    'latex':    lambda: corpus.lytex(200),
+    'html':     lambda: corpus.html(200),
+    'texinfo':  lambda: corpus.texinfo(200),
+    'docbook':  lambda: corpus.docbook(200),
+}
+
+
+def plain_words2regexp(words):
+    """Joins the words with "|" like it was done before words2regexp()."""
+    return "|".join(words)
+
+
+def lex(mode, text):
+    """Lexes the text line by line, returns the number of tokens."""
+    state = ly.lex.state(mode)
+    count = 0
+    for line in text.split('\n'):
+        for t in state.tokens(line):
+            count += 1
+    return count
+
+
+def run(variant, repeat=5):
+    """Runs the benchmark in this process and prints the results.
+
+    Every mode is lexed repeat times, the fastest run is reported.
+
+    """
+    if variant == 'plain':
+        ly.util.words2regexp = plain_words2regexp
+    for mode in sorted(ly.lex.modes):
+        text = texts.get(mode, texts['lilypond'])()
+        lex(mode, text[:1000])      # compile the patterns
+        elapsed = None
+        for i in range(repeat):
+            start = time.time()
+            count = lex(mode, text)
+            elapsed = min(elapsed or float('inf'), time.time() - start)
+        print("{0:6} {1:9} {2:7} tokens in {3:.3f} sec: {4:7.0f} tokens/sec".format(
+            variant, mode, count, elapsed, count / elapsed))
+
+
+def main():
+    if '--plain' in sys.argv:
+        run('plain')
+    elif '--trie' in sys.argv:
+        run('trie')
+    else:
+        for option in '--plain', '--trie':
+            subprocess.call([sys.executable, __file__, option])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+#! python
+
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2012 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Headless lexer benchmark suite.
+
+Lexes every document of the generated corpus line by line, like the
+Highlighter does: the tokens of every line are kept and the state at the end
+of every line is frozen in a Fridge.
+
+For every document it reports:
+  - the number of lines and tokens and the tokens per second
+  - the peak memory usage of the process (every document is lexed in a
+    separate process, so this is the peak while lexing that document)
+  - the number of distinct states in the Fridge
+  - the time spent in every Parser class (measured in a separate run, because
+    the bookkeeping slows down lexing)
+
+Usage:
+  python benchmarks/lexsuite.py [options] [document ...]
+
+Options:
+  --json FILE   also write the results to FILE in JSON format ("-" for
+                standard output), to compare runs across commits
+  --repeat N    lex every document N times and report the fastest run
+                (default: 3)
+  --list        list the names of the corpus documents and exit
+
+Does not need PyQt4.
+
+"""
+
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None     # not available on Windows
+
+import corpus
+
+import ly.lex
+import slexer
+
+
+# name, mode, function returning the text
+documents = (
+    ('piano',       'lilypond', lambda: corpus.piano(1000)),
+    ('orchestral',  'lilypond', lambda: corpus.orchestral(24, 200)),
+    ('schemelib',   'lilypond', lambda: corpus.scheme(600)),
+    ('scheme',      'scheme',   lambda: corpus.scheme(600, lilypond=False)),
+    ('lytex',       'latex',    lambda: corpus.lytex(200)),
+    ('html',        'html',     lambda: corpus.html(200)),
+    ('texinfo',     'texinfo',  lambda: corpus.texinfo(200)),
+    ('docbook',     'docbook',  lambda: corpus.docbook(200)),
+)
+
+
+def peak_memory():
+    """Returns the peak memory usage of this process in kilobytes, or None."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024   # bytes on Mac OS X
+    return peak
+
+
+def lex(mode, lines):
+    """Lexes the lines like the Highlighter does.
+
+    Returns the list of token tuples and the Fridge with the frozen states.
+
+    """
+    fridge = slexer.Fridge(ly.lex.State)
+    state = ly.lex.state(mode)
+    blocks = []
+    for line in lines:
+        blocks.append(tuple(state.tokens(line)))
+        fridge.freeze(state)
+    return blocks, fridge
+
+
+def parser_times(mode, lines):
+    """Returns a dictionary mapping Parser class names to the time spent in them.
+
+    The time needed to find a token is attributed to the parser that was
+    active when searching started.
+
+    """
+    times = {}
+    timer = time.time
+    state = ly.lex.state(mode)
+    for line in lines:
+        tokens = state.tokens(line)
+        while True:
+            name = state.parser().__class__.__name__
+            start = timer()
+            try:
+                next(tokens)
+            except StopIteration:
+                times[name] = times.get(name, 0.0) + timer() - start
+                break
+            times[name] = times.get(name, 0.0) + timer() - start
+    return times
+
+
+def run(name, repeat):
+    """Benchmarks the named document and returns a dictionary with the results."""
+    for n, mode, text in documents:
+        if n == name:
+            break
+    else:
+        raise ValueError("unknown document: {0}".format(name))
+    lines = text().split('\n')
+    lex(mode, lines[:100])    # import the mode and compile the patterns
+    fastest = None
+    for i in range(repeat):
+        start = time.time()
+        blocks, fridge = lex(mode, lines)
+        elapsed = time.time() - start
+        if fastest is None or elapsed < fastest:
+            fastest = elapsed
+    tokens = sum(map(len, blocks))
+    return {
+        'document': name,
+        'mode': mode,
+        'lines': len(lines),
+        'tokens': tokens,
+        'seconds': fastest,
+        'tokens_per_second': tokens / fastest if fastest else None,
+        'peak_memory_kb': peak_memory(),
+        'states': fridge.count(),
+        'parser_seconds': parser_times(mode, lines),
+    }
+
+
+def revision():
+    """Returns the current git revision of the source tree, or None."""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=open(os.devnull, 'w')).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(result):
+    """Prints the results for one document."""
+    print("{document} ({mode}): {lines} lines, {tokens} tokens in {seconds:.3f} sec, "
+          "{tokens_per_second:.0f} tokens/sec".format(**result))
+    if result['peak_memory_kb'] is not None:
+        print("  peak memory: {0} kB".format(result['peak_memory_kb']))
+    print("  states in fridge: {0}".format(result['states']))
+    times = result['parser_seconds']
+    for parser in sorted(times, key=times.get, reverse=True):
+        print("  {0:36} {1:8.3f} sec".format(parser, times[parser]))
+
+
+def option(args, name, default=None):
+    """Removes the option and its value from the args list, returns the value."""
+    if name in args:
+        i = args.index(name)
+        value = args[i+1]
+        del args[i:i+2]
+        return value
+    return default
+
+
+def main():
+    args = sys.argv[1:]
+    if '--list' in args:
+        for name, mode, text in documents:
+            print("{0:12} {1}".format(name, mode))
+        return
+    if '--child' in args:
+        # run in a separate process, print the result as JSON
+        args.remove('--child')
+        print(json.dumps(run(args[0], int(option(args, '--repeat', 3)))))
+        return
+    jsonfile = option(args, '--json')
+    repeat = option(args, '--repeat', '3')
+    names = args or [name for name, mode, text in documents]
+    results = []
+    for name in names:
+        output = subprocess.check_output(
+            [sys.executable, __file__, '--child', name, '--repeat', repeat])
+        result = json.loads(output.decode('utf-8'))
+        results.append(result)
+        if jsonfile != '-':
+            report(result)
+    if jsonfile:
+        data = {
+            'revision': revision(),
+            'python': sys.version.split()[0],
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'results': results,
+        }
+        if jsonfile == '-':
+            json.dump(data, sys.stdout, indent=2, sort_keys=True)
+            print()
+        else:
+            with open(jsonfile, 'w') as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
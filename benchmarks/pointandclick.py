@@ -0,0 +1,158 @@
+#! python
+
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2012 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Edit latency benchmark for the point and click links.
+
+Creates a document with a generated piano piece (default: 400 measures per
+hand) and a link to every note, like the textedit links in a PDF engraved by
+LilyPond. Then measures the time needed for typing (typing and deleting a
+word at random places) and for a large edit (adding an octave mark to every
+note with cursortools.Editor), in three situations:
+
+  no PDF        the document has no links
+  QTextCursors  a QTextCursor for every link, like BoundLinks used to do
+  BoundLinks    the positions of the links, kept up-to-date by BoundLinks
+
+Usage:
+  python benchmarks/pointandclick.py [measures]
+
+Needs PyQt4.
+
+"""
+
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import random
+import sys
+import time
+
+import corpus
+
+from PyQt4.QtCore import QRectF
+from PyQt4.QtGui import (
+    QApplication, QPlainTextDocumentLayout, QTextCursor, QTextDocument)
+
+import ly.lex
+import ly.lex.lilypond
+import cursortools
+from musicview import pointandclick
+
+
+def notes(text):
+    """Returns a list of (line, column, end column) tuples for every note.
+
+    The line numbers start at 1, like in textedit links.
+
+    """
+    state = ly.lex.state('lilypond')
+    result = []
+    for num, line in enumerate(text.split('\n'), 1):
+        for t in state.tokens(line):
+            if isinstance(t, ly.lex.lilypond.Note):
+                result.append((num, t.pos, t.end))
+    return result
+
+
+def document(text):
+    """Returns a QTextDocument with the text, laid out like in the editor."""
+    doc = QTextDocument()
+    doc.setDocumentLayout(QPlainTextDocumentLayout(doc))
+    doc.setPlainText(text)
+    return doc
+
+
+def typing(doc, places=20, seed=0):
+    """Types and deletes a word at some places, returns the average and maximum msec.
+
+    Every insertion and deletion of a character is timed separately.
+
+    """
+    rnd = random.Random(seed)
+    cursor = QTextCursor(doc)
+    times = []
+    for i in range(places):
+        cursor.setPosition(rnd.randrange(doc.characterCount() - 1))
+        for c in "legato":
+            start = time.time()
+            cursor.insertText(c)
+            times.append(time.time() - start)
+        for c in "legato":
+            start = time.time()
+            cursor.deletePreviousChar()
+            times.append(time.time() - start)
+    return sum(times) / len(times) * 1000, max(times) * 1000
+
+
+def bulk(doc, positions):
+    """Adds an octave mark after every note, returns the msec needed."""
+    start = time.time()
+    with cursortools.Editor() as e:
+        for line, column, end in positions:
+            c = QTextCursor(doc.findBlockByNumber(line - 1))
+            c.setPosition(c.position() + end)
+            e.insertText(c, "'")
+    return (time.time() - start) * 1000
+
+
+def main():
+    measures = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    app = QApplication(sys.argv)
+    text = corpus.piano(measures)
+    positions = notes(text)
+    dest = [(0, QRectF(0, 0, 1, 1))]
+    links = dict(((line, column), dest) for line, column, end in positions)
+    print("{0} lines, {1} links".format(text.count('\n') + 1, len(links)))
+
+    def no_pdf(doc):
+        return None
+
+    def cursors(doc):
+        result = []
+        for line, column in links:
+            c = QTextCursor(doc.findBlockByNumber(line - 1))
+            c.setPosition(c.position() + column)
+            result.append(c)
+        return result
+
+    def boundlinks(doc):
+        return pointandclick.BoundLinks(doc, links)
+
+    for name, bind in (
+            ("no PDF", no_pdf),
+            ("QTextCursors", cursors),
+            ("BoundLinks", boundlinks),
+            ):
+        doc = document(text)
+        start = time.time()
+        bound = bind(doc)
+        binding = (time.time() - start) * 1000
+        average, maximum = typing(doc)
+        large = bulk(doc, positions)
+        print("{0:13} bind {1:7.1f} ms, typing average {2:6.3f} ms, "
+              "maximum {3:6.3f} ms, edit every note {4:8.1f} ms".format(
+              name, binding, average, maximum, large))
+        del bound
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#! python
+
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2012 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Benchmark for scanning an include tree in the background.
+
+Writes a generated include tree to a temporary directory and scans all
+files with fileinfo.scan():
+
+  serial    one by one on the main thread, like the GUI thread would have
+            to do it, which blocks it for the time one file takes
+  thread    using the worker thread of the prescan module, while the main
+            thread wakes up every 10 msec, like an idle GUI event loop
+
+For both the total time is reported and the longest time the main thread
+could not run. The worker thread does not lex faster, it keeps the main
+thread free.
+
+Usage:
+  python benchmarks/prescan.py [number of files]
+
+Needs PyQt4, because fileinfo uses the factscache.
+
+"""
+
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import corpus
+
+import fileinfo
+import prescan
+
+
+def write_tree(directory, count):
+    """Writes count include files, returns the list of filenames."""
+    rnd = random.Random(0)
+    names = []
+    for i in range(count):
+        name = os.path.join(directory, 'part{0}.ily'.format(i))
+        includes = ''.join('\\include "part{0}.ily"\n'.format(j)
+                           for j in range(2 * i + 1, min(2 * i + 3, count)))
+        with open(name, 'w') as f:
+            f.write((includes + 'part{0} = \\relative c\'\' {{\n{1}\n}}\n'.format(
+                i, corpus.music(rnd, 200))).encode('utf-8'))
+        names.append(name)
+    return names
+
+
+def serial(names):
+    """Scans the files on the main thread, returns the total and the longest time."""
+    longest = 0
+    start = time.time()
+    for name in names:
+        t = time.time()
+        fileinfo.scan(name)
+        longest = max(longest, time.time() - t)
+    return time.time() - start, longest
+
+
+def thread(names, interval=0.01):
+    """Scans the files in the worker thread, returns the total and the longest stall.
+
+    The stall is the time the main thread woke up later than it wanted to.
+
+    """
+    worker = prescan.worker()
+    worker.apply(fileinfo.scan, (names[0],))  # start the worker
+    longest = 0
+    start = time.time()
+    result = worker.map_async(fileinfo.scan, names)
+    while not result.ready():
+        t = time.time()
+        time.sleep(interval)
+        longest = max(longest, time.time() - t - interval)
+    return time.time() - start, longest
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    directory = tempfile.mkdtemp()
+    try:
+        names = write_tree(directory, count)
+        results = [("serial", serial(names)), ("thread", thread(names))]
+    finally:
+        shutil.rmtree(directory)
+    print("files: {0}".format(count))
+    for name, (total, longest) in results:
+        print("{0:7} total {1:.3f} sec, main thread blocked at most {2:.1f} msec".format(
+            name, total, longest * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#! python
+
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2012 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Memory benchmark for the tokens stored by the Highlighter.
+
+Highlights a generated piano piece (default: 2000 measures per hand) with
+the tokens stored as tuples of Token objects and with compact tokens, and
+reports Highlighter.tokenMemory() and the time needed to highlight the
+document and to read the tokens of every block with tokeniter.tokens().
+
+Usage:
+  python benchmarks/tokenmemory.py [measures]
+
+Needs PyQt4.
+
+"""
+
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import sys
+import time
+
+import corpus
+
+from PyQt4.QtGui import QApplication, QPlainTextDocumentLayout, QTextDocument
+
+import cursortools
+import highlighter
+import tokeniter
+
+
+def measure(text, compact):
+    """Returns the token memory in bytes, and the msec to highlight and read the tokens."""
+    doc = QTextDocument()
+    doc.setDocumentLayout(QPlainTextDocumentLayout(doc))
+    h = highlighter.highlighter(doc)
+    h._background = False   # highlight everything at once
+    h._compact = compact
+    start = time.time()
+    doc.setPlainText(text)
+    highlighting = (time.time() - start) * 1000
+    start = time.time()
+    for block in cursortools.all_blocks(doc):
+        tokeniter.tokens(block)
+    reading = (time.time() - start) * 1000
+    return h.tokenMemory(), highlighting, reading
+
+
+def main():
+    measures = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    app = QApplication(sys.argv)
+    text = corpus.piano(measures)
+    print("{0} lines".format(text.count('\n') + 1))
+    for name, compact in (("tuples", False), ("compact", True)):
+        memory, highlighting, reading = measure(text, compact)
+        print("{0:8} {1:10} bytes, highlight {2:8.1f} ms, "
+              "read all tokens {3:7.1f} ms".format(
+              name, memory, highlighting, reading))
+
+
+if __name__ == '__main__':
+    main()
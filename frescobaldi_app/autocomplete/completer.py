@@ -24,19 +24,67 @@ The completer for Frescobaldi.
 from __future__ import unicode_literals
 
 import re
+import weakref
 
-from PyQt4.QtGui import QTextCursor
+from PyQt4.QtCore import Qt
+from PyQt4.QtGui import QCompleter, QTextCursor
 
 import app
+import listmodel
 import textformats
 import widgets.completer
 
+from . import wordlist
+
+
+# the maximum number of completions shown in the popup
+MAXMATCHES = 500
+
+
+_wordlists = weakref.WeakKeyDictionary()
+
+
+def words(model):
+    """Returns the WordList for the items of a ListModel, creating it only once.
+    
+    The completion texts are the items as displayed under the Qt.EditRole.
+    If the model has a weight attribute, it is used as the weight function
+    to order matches of the same rank.
+    
+    """
+    try:
+        return _wordlists[model]
+    except KeyError:
+        result = _wordlists[model] = wordlist.WordList(
+            model.items(), model.roleFunction(Qt.EditRole), getattr(model, 'weight', None))
+        return result
+
+
+class MatchModel(listmodel.ListModel):
+    """Displays the matching items of another ListModel."""
+    def __init__(self):
+        super(MatchModel, self).__init__([])
+    
+    def setMatches(self, model, items):
+        """Displays the items, using the role functions of the model."""
+        self._roles = model.roleFunctions()
+        self.setItems(items)
+    
+    def clear(self):
+        """Displays no items."""
+        self.setItems([])
+
 
 class Completer(widgets.completer.Completer):
     def __init__(self):
         super(Completer, self).__init__()
         self.setMaxVisibleItems(16)
         self.popup().setMinimumWidth(100)
+        # we filter and rank the completions ourselves
+        self.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self._source = None
+        self._matches = MatchModel()
+        self.setModel(self._matches)
         app.settingsChanged.connect(self.readSettings)
         self.readSettings()
     
@@ -53,10 +101,26 @@ class Completer(widgets.completer.Completer):
             if not model:
                 return
             self._pos = cursor.block().position() + pos
-            if self.model() != model:
-                self.setModel(model)
+            self._source = model
         cursor.setPosition(self._pos, QTextCursor.KeepAnchor)
         return cursor
+    
+    def setCompletionPrefix(self, text):
+        """Reimplemented to show the completions matching text, ranked."""
+        if self._source is None:
+            self._matches.clear()
+        else:
+            self._matches.setMatches(self._source,
+                words(self._source).matches(text, MAXMATCHES))
+        super(Completer, self).setCompletionPrefix(text)
+    
+    def insertCompletion(self, index):
+        """Reimplemented to replace the typed text, that may not be a prefix."""
+        text = self.completionModel().data(index, Qt.EditRole)
+        cursor = self.textCursor()
+        cursor.setPosition(cursor.position() - len(self.completionPrefix()),
+                           QTextCursor.KeepAnchor)
+        cursor.insertText(text)
 
     def analyzer(self):
         from . import analyzer
@@ -40,12 +40,53 @@ def doc(document):
     return DocumentDataSource.instance(document)
 
 
+_builtin = {
+    'score': lambda: completiondata.score,
+    'bookpart': lambda: completiondata.bookpart,
+    'book': lambda: completiondata.book,
+    'music': lambda: itertools.chain(
+        ly.words.lilypond_keywords,
+        ly.words.lilypond_music_commands,
+        ly.words.articulations,
+        ly.words.ornaments,
+        ly.words.fermatas,
+        ly.words.instrument_scripts,
+        ly.words.repeat_scripts),
+    'lyric': lambda: ('set stanza = ', 'set', 'override', 'markup', 'notemode'),
+}
+
+_builtin_cache = {}
+
+
+def builtin_commands(kind):
+    """Returns the frozenset of built-in commands for the kind of model.
+    
+    The kind is 'score', 'bookpart', 'book', 'music' or 'lyric'.
+    The set is created only once.
+    
+    """
+    try:
+        return _builtin_cache[kind]
+    except KeyError:
+        result = _builtin_cache[kind] = frozenset(_builtin[kind]())
+        return result
+
+
 class DocumentDataSource(plugin.DocumentPlugin):
+    def __init__(self, document):
+        self._models = {}   # kind: (names, model) for commands()
+    
     @util.keep
     def words(self):
-        """Returns the list of words in comments, markup etc."""
-        return listmodel.ListModel(
-            sorted(set(harvest.words(self.document()))))
+        """Returns the list of words in comments, markup etc.
+        
+        Matching words are ordered by the number of times they are used.
+        
+        """
+        counts = harvest.wordcounts(self.document())
+        model = listmodel.ListModel(sorted(counts))
+        model.weight = lambda word: counts.get(word, 0)
+        return model
 
     @util.keep
     def schemewords(self):
@@ -62,57 +103,57 @@ class DocumentDataSource(plugin.DocumentPlugin):
     @util.keep
     def markup(self, cursor):
         """Completes markup commands and normal text from the document."""
-        return listmodel.ListModel(
+        counts = harvest.wordcounts(self.document())
+        model = listmodel.ListModel(
             ['\\' + w for w in sorted(ly.words.markupcommands)]
             + [ '\\' + w for w in sorted(itertools.chain(
                 harvest.markup_commands(cursor),
                 harvest.include_markup_commands(cursor)))]
-            + sorted(set(harvest.words(self.document()))))
+            + sorted(counts))
+        model.weight = lambda word: counts.get(word, 0)
+        return model
 
-    @util.keep
     def scorecommands(self, cursor):
         """Stuff inside \\score { }. """
-        return listmodel.ListModel(sorted(set(itertools.chain(
-            completiondata.score,
-            harvest.include_identifiers(cursor),
-            harvest.names(cursor)))), display = util.command)
+        return self.commands('score', cursor)
     
-    @util.keep
     def bookpartcommands(self, cursor):
         """Stuff inside \\bookpart { }. """
-        return listmodel.ListModel(sorted(set(itertools.chain(
-            completiondata.bookpart,
-            harvest.include_identifiers(cursor),
-            harvest.names(cursor)))), display = util.command)
+        return self.commands('bookpart', cursor)
     
-    @util.keep
     def bookcommands(self, cursor):
         """Stuff inside \\book { }. """
-        return listmodel.ListModel(sorted(set(itertools.chain(
-            completiondata.book,
-            harvest.include_identifiers(cursor),
-            harvest.names(cursor)))), display = util.command)
+        return self.commands('book', cursor)
     
-    
-    @util.keep
     def musiccommands(self, cursor):
-        return listmodel.ListModel(sorted(set(itertools.chain(
-            ly.words.lilypond_keywords,
-            ly.words.lilypond_music_commands,
-            ly.words.articulations,
-            ly.words.ornaments,
-            ly.words.fermatas,
-            ly.words.instrument_scripts,
-            ly.words.repeat_scripts,
-            harvest.include_identifiers(cursor),
-            harvest.names(cursor)))), display = util.command)
+        return self.commands('music', cursor)
 
-    @util.keep
     def lyriccommands(self, cursor):
-        return listmodel.ListModel(sorted(set(itertools.chain(
-            ('set stanza = ', 'set', 'override', 'markup', 'notemode'),
+        return self.commands('lyric', cursor)
+    
+    def commands(self, kind, cursor):
+        """Returns a model with the built-in commands and the defined names.
+        
+        The names are those defined in the document until the cursor and in
+        the included files. The model is reused as long as the names don't
+        change, so its word list (see completer.words()) is built only once.
+        
+        """
+        names = frozenset(itertools.chain(
             harvest.include_identifiers(cursor),
-            harvest.names(cursor)))), display = util.command)
+            harvest.names(cursor)))
+        models = self._models
+        try:
+            model_names, model = models[kind]
+        except KeyError:
+            pass
+        else:
+            if model_names == names:
+                return model
+        model = listmodel.ListModel(sorted(names | builtin_commands(kind)),
+            display = util.command)
+        models[kind] = names, model
+        return model
 
     def includenames(self, cursor, directory=None):
         """Finds files relative to the directory of the cursor's document.
@@ -23,14 +23,14 @@ Harvest strings from document for autocompletion purposes.
 
 from __future__ import unicode_literals
 
-import itertools
 import re
 
 import documentinfo
-import fileinfo
+import symbolindex
 import tokeniter
 import ly.lex.lilypond
 import ly.lex.scheme
+import ly.parse
 
 
 def tokens(cursor):
@@ -42,48 +42,96 @@ def tokens(cursor):
         block = block.next()
 
 
+def blocksymbols(block, pending=()):
+    """Returns the symbols defined in the block, see documentinfo.parsefacts().
+    
+    Every symbol is a (kind, token) tuple, where kind is 'name' for the name
+    of an assignment, 'markup' for a markup command definition and 'scheme'
+    for a scheme word.
+    
+    A markup command definition may continue in the next blocks: pending are
+    the unfinished definitions of the previous block.
+    Returns a tuple (symbols, pending).
+    
+    """
+    tokens = tokeniter.tokens(block)
+    symbols = []
+    for t in tokens[:2]:
+        if type(t) is ly.lex.lilypond.Name:
+            symbols.append(('name', t))
+            break
+    markup, pending = documentinfo.parsefacts(tokens, pending, _markup_command,
+        (ly.lex.scheme.Word, ly.lex.lilypond.Name))
+    symbols.extend(markup)
+    symbols.extend(('scheme', t) for t in tokens if type(t) is ly.lex.scheme.Word)
+    return tuple(symbols), pending
+
+
+def _markup_command(token, tokens):
+    """Returns a ('markup', name) symbol if token starts a markup command definition."""
+    name = ly.parse.markup_command(token, tokens)
+    if name:
+        return 'markup', name
+
+
+class Symbols(documentinfo.BlockFacts):
+    """Keeps the symbols defined in every block of a document.
+    
+    Only changed blocks are examined again, and the symbols defined before a
+    block are found using a binary search on the block numbers.
+    
+    """
+    attribute = 'symbols'
+    
+    def blockfacts(self, block, pending):
+        return blocksymbols(block, pending)
+
+
+def symbols(document):
+    """Returns the Symbols instance for the document."""
+    return Symbols.instance(document)
+
+
 def names(cursor):
     """Harvests names from assignments until the cursor."""
-    end = cursor.block()
-    block = cursor.document().firstBlock()
-    while block.isValid() and block != end:
-        for t in tokeniter.tokens(block)[:2]:
-            if type(t) is ly.lex.lilypond.Name:
-                yield t
-                break
-        block = block.next()
+    return symbols(cursor.document()).facts('name', cursor.blockNumber())
 
 
 def markup_commands(cursor):
     """Harvest markup command definitions until the cursor."""
-    return ly.parse.markup_commands(itertools.chain.from_iterable(tokens(cursor)))
+    return symbols(cursor.document()).facts('markup', cursor.blockNumber())
 
     
 def schemewords(document):
     """Harvests all schemewords from the document."""
-    for t in tokeniter.all_tokens(document):
-        if type(t) is ly.lex.scheme.Word:
-            yield t
+    return symbols(document).facts('scheme')
+
+
+def includeargs(cursor):
+    """Harvests the arguments of include commands until the cursor."""
+    facts = documentinfo.BlockFacts.instance(cursor.document())
+    return list(facts.facts('include', cursor.blockNumber()))
 
 
 def include_identifiers(cursor):
     """Harvests identifier definitions from included files."""
-    includeargs = ly.parse.includeargs(itertools.chain.from_iterable(tokens(cursor)))
-    dinfo = documentinfo.info(cursor.document())
-    fname = cursor.document().url().toLocalFile()
-    files = fileinfo.includefiles(fname, dinfo.includepath(), includeargs)
-    return itertools.chain.from_iterable(fileinfo.FileInfo.info(f).names()
-                                         for f in files)
+    return include_symbols(cursor, 'names')
 
 
 def include_markup_commands(cursor):
     """Harvest markup command definitions from included files."""
-    includeargs = ly.parse.includeargs(itertools.chain.from_iterable(tokens(cursor)))
+    return include_symbols(cursor, 'markup_commands')
+
+
+def include_symbols(cursor, kind):
+    """Returns the symbols of the given kind defined in included files.
+    
+    See the symbolindex module.
+    
+    """
     dinfo = documentinfo.info(cursor.document())
     fname = cursor.document().url().toLocalFile()
-    files = fileinfo.includefiles(fname, dinfo.includepath(), includeargs)
-    return itertools.chain.from_iterable(fileinfo.FileInfo.info(f).markup_commands()
-                                         for f in files)
+    return symbolindex.index().tree(fname, dinfo.includepath(), includeargs(cursor), kind)
     
 
 _words = re.compile(r'\w{5,}|\w{2,}(?:[:-]\w+)+').finditer
@@ -91,10 +139,71 @@ _word_types = (
     ly.lex.String, ly.lex.Comment, ly.lex.Unparsed,
     ly.lex.lilypond.MarkupWord, ly.lex.lilypond.LyricText)
 
-def words(document):
-    """Harvests words from strings, lyrics, markup and comments."""
-    for t in tokeniter.all_tokens(document):
+def blockwords(block):
+    """Yields the words in strings, lyrics, markup and comments in the block."""
+    for t in tokeniter.tokens(block):
         if isinstance(t, _word_types):
             for m in _words(t):
                 yield m.group()
 
+
+class Words(documentinfo.BlockFacts):
+    """Counts the words in strings, lyrics, markup and comments of a document.
+    
+    The facts of a block are the tuple of the words in it. The words are
+    shared between the blocks, and the number of times every word is used in
+    the document is updated when blocks change, so the memory used is
+    proportional to the number of different words.
+    
+    """
+    attribute = 'words'
+    
+    def __init__(self, document):
+        super(Words, self).__init__(document)
+        self._counts = {}
+        self._words = {}
+    
+    def blockfacts(self, block, pending):
+        shared = self._words
+        return tuple(shared.get(w, w) for w in blockwords(block)), ()
+    
+    def factsAdded(self, words):
+        counts = self._counts
+        for w in words:
+            if w in counts:
+                counts[w] += 1
+            else:
+                counts[w] = 1
+                self._words[w] = w
+    
+    def factsRemoved(self, words):
+        counts = self._counts
+        for w in words:
+            counts[w] -= 1
+            if not counts[w]:
+                del counts[w]
+                del self._words[w]
+    
+    def counts(self):
+        """Returns a dictionary with all the words and their count."""
+        self.update()
+        return dict(self._counts)
+
+
+def wordcounts(document):
+    """Returns a dictionary with the words in the document and their count.
+    
+    The words are harvested from strings, lyrics, markup and comments.
+    
+    """
+    return Words.instance(document).counts()
+
+
+def words(document):
+    """Harvests words from strings, lyrics, markup and comments.
+    
+    Yields the different words, the most used first.
+    
+    """
+    counts = wordcounts(document)
+    return iter(sorted(counts, key=counts.get, reverse=True))
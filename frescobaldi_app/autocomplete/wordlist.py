@@ -0,0 +1,153 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2011 - 2012 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Ranked matching of completions.
+
+A WordList keeps the completion texts sorted case-insensitively, so that the
+texts starting with the typed text are found using a binary search. All texts
+are also joined in one string, so that the texts matching at a word boundary,
+or containing the typed characters in order, are found by one regular
+expression search over all texts.
+
+The matches are ranked: first the texts starting with the typed text, then
+the texts having a word starting with it, and then the texts containing its
+characters in the same order.
+
+This module does not use Qt.
+
+"""
+
+from __future__ import unicode_literals
+
+import bisect
+import re
+
+
+# the start of every part of a text, e.g. 'a' and 'T' in "\\aTempo"
+_boundaries = re.compile(r'(?<=[\W_])(?=[^\W_])|(?<=[^\W_A-Z])(?=[A-Z])', re.UNICODE)
+
+# leading non-word characters of a typed text, these must match literally
+_leading = re.compile(r'[\W_]*', re.UNICODE)
+
+
+def _marked(text):
+    """Returns the text in lower case with a NUL character before every part."""
+    return '\0' + _boundaries.sub('\0', text).lower()
+
+
+class WordList(object):
+    """A sorted list of completion texts that can be matched quickly.
+
+    The items are the objects the completion texts are made from, the text
+    function returns the completion text for an item. If a weight function
+    is given, the matches of the same rank are ordered by descending weight
+    of their items (e.g. the number of times a word is used).
+
+    """
+    def __init__(self, items, text=None, weight=None):
+        items = list(items)
+        self._weight = weight
+        texts = [text(item) for item in items] if text else items
+        order = sorted(range(len(items)), key=lambda i: (texts[i].lower(), texts[i]))
+        self.items = [items[i] for i in order]
+        self.texts = [texts[i] for i in order]
+        self._keys = [t.lower() for t in self.texts]
+        self._plain = '\n'.join(self._keys)
+        self._plainStarts = self._starts(self._keys)
+        marked = list(map(_marked, self.texts))
+        self._marked = '\n'.join(marked)
+        self._markedStarts = self._starts(marked)
+
+    def __len__(self):
+        return len(self.items)
+
+    @staticmethod
+    def _starts(keys):
+        """Returns the list of positions of the keys in the joined string."""
+        starts = []
+        pos = 0
+        for key in keys:
+            starts.append(pos)
+            pos += len(key) + 1
+        return starts
+
+    def prefix(self, text):
+        """Returns the range of the indices of the texts starting with text."""
+        key = text.lower()
+        start = bisect.bisect_left(self._keys, key)
+        end = bisect.bisect_left(self._keys, key + '\uffff', start)
+        return range(start, end)
+
+    def match(self, text, limit=None):
+        """Returns the list of the indices of the texts matching text, ranked.
+
+        The comparison is case-insensitive. Leading non-word characters in
+        text (like a backslash) must match literally, the rest is matched at
+        the start of the text, at the start of a word part, or as a subsequence.
+
+        If limit is given, at most limit indices are returned, which bounds the
+        time needed for very short texts.
+
+        """
+        result = self._ranked(self.prefix(text))[:limit]
+        key = text.lower()
+        lead = _leading.match(key).group()
+        rest = key[len(lead):]
+        if not rest or (limit and len(result) >= limit):
+            return result
+        found = set(result)
+        # texts having a word part that starts with the rest
+        boundary = []
+        for m in re.finditer('\0' + re.escape(rest), self._marked):
+            i = bisect.bisect_right(self._markedStarts, m.start()) - 1
+            if i not in found and self._keys[i].startswith(lead):
+                found.add(i)
+                boundary.append(i)
+                if limit and len(result) + len(boundary) >= limit:
+                    break
+        result.extend(self._ranked(boundary))
+        if limit and len(result) >= limit:
+            return result
+        # texts containing the characters in order, without backtracking
+        pattern = ['^', re.escape(lead)]
+        for c in rest:
+            c = re.escape(c)
+            pattern.append('[^{0}\n]*{0}'.format(c))
+        subsequence = []
+        for m in re.finditer(''.join(pattern), self._plain, re.M):
+            i = bisect.bisect_right(self._plainStarts, m.start()) - 1
+            if i not in found:
+                subsequence.append(i)
+                if limit and len(result) + len(subsequence) >= limit:
+                    break
+        result.extend(self._ranked(subsequence))
+        return result
+
+    def _ranked(self, indices):
+        """(Internal) Returns the list of indices, ordered by weight if desired."""
+        if self._weight is None:
+            return list(indices)
+        items, weight = self.items, self._weight
+        return sorted(indices, key=lambda i: -weight(items[i]))
+
+    def matches(self, text, limit=None):
+        """Returns the list of the items matching text, ranked. See match()."""
+        items = self.items
+        return [items[i] for i in self.match(text, limit)]
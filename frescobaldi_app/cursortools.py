@@ -25,6 +25,7 @@ from __future__ import unicode_literals
 
 import contextlib
 
+from PyQt4.QtCore import QPoint
 from PyQt4.QtGui import QTextBlock, QTextBlockUserData, QTextCursor
 
 
@@ -231,6 +232,34 @@ def previous_blank(block):
                     return b
 
 
+def visible_range(edit):
+    """Returns the range (start, end) of the text visible in a Q(Plain)TextEdit.
+    
+    The range consists of whole blocks.
+    
+    """
+    first = edit.cursorForPosition(QPoint(0, 0)).block()
+    rect = edit.viewport().rect()
+    last = edit.cursorForPosition(rect.bottomRight()).block()
+    return first.position(), last.position() + last.length()
+
+
+def replace_ranges(cursor, edits):
+    """Replaces ranges of text in the cursor's document, as one undo step.
+    
+    edits is a list of (start, end, text) tuples, sorted on start position,
+    that should not overlap. The edits are applied from the last to the first,
+    using the given cursor, so no QTextCursor is created per edit, and the
+    positions of the earlier edits remain valid.
+    
+    """
+    with compress_undo(cursor):
+        for start, end, text in reversed(edits):
+            cursor.setPosition(end)
+            cursor.setPosition(start, QTextCursor.KeepAnchor)
+            cursor.insertText(text)
+
+
 def data(block):
     """Get the block's QTextBlockUserData, creating it if necessary.""" 
     data = block.userData()
@@ -276,21 +305,16 @@ class Editor(object):
             # otherwise inserts would move the cursor for adjacent edits.
             # We could also just start with the first, but that would require
             # all cursors to update their position during the process, which
-            # notably slows down large edits (as there are already many cursors
-            # used by the point and click feature).
+            # notably slows down large edits (as there may already be many
+            # cursors in the document).
             # We could also use QTextCursor.keepPositionOnInsert but that is
             # only available in the newest PyQt4 versions.
             edits = [(cursor.selectionStart(), cursor.selectionEnd(), text)
                       for cursor, text in self.edits]
             edits.sort(key=lambda e: e[0]) # dont reorder edits at same startpos
-            edits.reverse()
             cursor = self.edits[0][0]
             del self.edits[:]
-            with compress_undo(cursor):
-                for start, end, text in edits:
-                    cursor.setPosition(end)
-                    cursor.setPosition(start, QTextCursor.KeepAnchor)
-                    cursor.insertText(text)
+            replace_ranges(cursor, edits)
         
     def __exit__(self, exc_type, exc_val, exc_tb):
         if exc_type is None:
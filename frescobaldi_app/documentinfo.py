@@ -32,17 +32,31 @@ import weakref
 from PyQt4.QtCore import QSettings, QUrl
 
 import ly.lex.lilypond
+import ly.lex.scheme
 import ly.parse
 import ly.pitch
 import app
 import fileinfo
+import includegraph
 import cursortools
+import highlighter
+import positionlist
 import tokeniter
 import plugin
 import variables
 
 
-__all__ = ['info', 'mode']
+__all__ = ['info', 'mode', 'guessmode']
+
+
+# how many characters from the start of a document are used to guess its mode
+_GUESS_LENGTH = 10000
+
+# above this number of changed block ranges, they are merged into one
+_MAX_RANGES = 50
+
+# an unfinished command with more tokens is not continued in the next block
+_MAX_PENDING = 100
 
 
 def info(document):
@@ -55,6 +69,166 @@ def mode(document, guess=True):
     return info(document).mode(guess)
 
 
+def guessmode(document):
+    """Returns the mode guessed from the start of the text of the document.
+    
+    Only the first _GUESS_LENGTH characters (not counting leading whitespace)
+    are inspected, and the result is cached until the document changes in
+    that part. Can be used for any QTextDocument.
+    
+    """
+    return ModeGuesser.instance(document).mode()
+
+
+def blockfacts(block, pending=()):
+    """Returns the facts found in the tokens of the block, see parsefacts().
+    
+    Every fact is a two-tuple (kind, value), where kind is one of:
+    
+    'version':  the argument of a \\version command
+    'include':  the argument of an \\include command
+    'output':   a tuple (type, argument) like ly.parse.outputargs() yields
+    'language': the pitch language set by \\language or \\include
+    'staffsize': the global staff size, as an integer
+    
+    The argument of a command may continue in the next blocks: pending are
+    the unfinished commands of the previous block.
+    Returns a tuple (facts, pending).
+    
+    """
+    tokens = tokeniter.tokens(block)
+    facts, pending = parsefacts(tokens, pending, _blockfact, (
+        ly.lex.lilypond.Keyword, ly.lex.lilypond.Command, ly.lex.scheme.Word))
+    # pitch language
+    try:
+        i = tokens.index('\\language')
+    except ValueError:
+        try:
+            i = tokens.index('\\include')
+        except ValueError:
+            i = None
+    if i is not None and isinstance(tokens[i], ly.lex.lilypond.Keyword):
+        for t in tokens[i+1:]:
+            if isinstance(t, ly.lex.Space) or t == '"':
+                continue
+            lang = t[:-3] if t.endswith('.ly') else t[:]
+            if lang in ly.pitch.pitchInfo:
+                facts.append(('language', lang))
+                break
+    # global staff size
+    try:
+        i = tokens.index('set-global-staff-size')
+    except ValueError:
+        pass
+    else:
+        try:
+            facts.append(('staffsize', int(tokens[i+2], 10)))
+        except (IndexError, ValueError):
+            pass
+    return tuple(facts), pending
+
+
+def _blockfact(t, tokens):
+    """Returns the fact for a \\version, \\include or output command, or None."""
+    if isinstance(t, ly.lex.lilypond.Keyword):
+        if t == '\\version':
+            return 'version', ly.parse.version(itertools.chain((t,), tokens))
+        elif t == '\\include':
+            arg = _argument(tokens, (ly.lex.Space, ly.lex.Comment))
+            if arg is not None:
+                return 'include', arg
+    elif ((isinstance(t, ly.lex.lilypond.Command)
+           and t in ('\\bookOutputName', '\\bookOutputSuffix'))
+          or (isinstance(t, ly.lex.scheme.Word) and t == 'output-suffix')):
+        arg = _argument(tokens, (ly.lex.lilypond.SchemeStart,
+                                 ly.lex.Space, ly.lex.Comment))
+        if arg is not None:
+            return 'output', ("name" if t == '\\bookOutputName' else "suffix", arg)
+
+
+class TokenStream(object):
+    """Iterates over the tokens from index, remembers if it ran out of them."""
+    def __init__(self, tokens, index=0):
+        self._tokens = tokens
+        self._index = index
+        self.exhausted = False
+    
+    def __iter__(self):
+        return self
+    
+    def next(self):
+        try:
+            token = self._tokens[self._index]
+        except IndexError:
+            self.exhausted = True
+            raise StopIteration
+        self._index += 1
+        return token
+    
+    __next__ = next
+
+
+def parsefacts(tokens, pending, parse, classes):
+    """Finds facts in the tokens of a block, continuing unfinished ones.
+    
+    parse(token, stream) is called for every token that is an instance of
+    classes, with a TokenStream yielding the tokens after it, and returns a
+    fact or None. If parse() ran out of tokens, the token and the tokens after
+    it are pending: parsing continues with the tokens of the next block
+    (separated by a newline).
+    
+    pending is the tuple of pending token tuples of the previous block.
+    Returns the list of facts and the tuple of the new pending token tuples.
+    
+    """
+    facts, unfinished = [], []
+    def run(tokens, index):
+        stream = TokenStream(tokens, index + 1)
+        fact = parse(tokens[index], stream)
+        if stream.exhausted:
+            if len(tokens) - index < _MAX_PENDING:
+                unfinished.append(tokens[index:])
+        elif fact is not None:
+            facts.append(fact)
+    if pending:
+        newline = (ly.lex.Space('\n', 0),)
+        for p in pending:
+            run(p + newline + tokens, 0)
+    for i, t in enumerate(tokens):
+        if isinstance(t, classes):
+            run(tokens, i)
+    return facts, tuple(unfinished)
+
+
+def _argument(tokens, skip):
+    """Returns the contents of the string that follows, skipping skip instances.
+    
+    Returns None if the first other token does not start a string.
+    
+    """
+    for t in tokens:
+        if not isinstance(t, skip):
+            if t == '"':
+                return ''.join(itertools.takewhile(lambda t: t != '"', tokens))
+            return
+
+
+def _tokenkey(block):
+    """Returns the object holding the stored tokens of the block, or None.
+    
+    When the block is lexed again, a new object is stored.
+    
+    """
+    data = block.userData()
+    try:
+        return data.tokens
+    except AttributeError:
+        try:
+            return data.packed
+        except AttributeError:
+            pass
+
+
 def resetoncontentschanged(func):
     """Caches a value until the document emits the contentsChanged signal.
     
@@ -78,6 +252,275 @@ def resetoncontentschanged(func):
     return wrapper
 
 
+class ModeGuesser(plugin.DocumentPlugin):
+    """Guesses the mode of a document and caches it. See guessmode()."""
+    def __init__(self, document):
+        self._mode = None
+        self._end = 0
+        self._revision = document.revision()
+        document.contentsChange.connect(self.slotContentsChange)
+    
+    def slotContentsChange(self, position, removed, added):
+        """Called if the document changes, forgets the mode if needed.
+        
+        Changes that do not alter the text (the highlighter reports new
+        formatting as a change with as many characters removed as added, but
+        does not increase the document's revision) are ignored.
+        
+        """
+        revision = self.document().revision()
+        if removed == added and revision == self._revision:
+            return
+        self._revision = revision
+        if position <= self._end:
+            self._mode = None
+    
+    def mode(self):
+        """Returns the guessed mode."""
+        if self._mode is None:
+            self._mode = ly.lex.guessMode(self.text())
+        return self._mode
+    
+    def text(self):
+        """Returns the text at the start of the document to guess the mode from.
+        
+        Leading blank lines are skipped, and only whole lines are returned.
+        Also records the position of the end of the text.
+        
+        """
+        block = self.document().firstBlock()
+        while block.isValid() and block.next().isValid() and not block.text().strip():
+            block = block.next()
+        lines = []
+        length = 0
+        while block.isValid() and length < _GUESS_LENGTH:
+            text = block.text()
+            lines.append(text)
+            length += len(text) + 1
+            self._end = block.position() + block.length()
+            block = block.next()
+        return '\n'.join(lines)
+
+
+class BlockFacts(plugin.DocumentPlugin):
+    """Keeps the facts found by blockfacts() for every block of a document.
+    
+    Only the blocks that were changed (and the blocks following them that the
+    highlighter lexed again because the lexer state changed) are examined
+    again when the facts are requested, so the cost of a query is proportional
+    to the size of the edits since the previous query.
+    
+    The commands that are not finished at the end of a block are stored in
+    its user data as well; when they change, the next block is examined again.
+    Blocks the highlighter lexes again later (because lexing them was deferred)
+    are also examined again.
+    
+    Subclasses can keep other facts by overriding blockfacts() and the name of
+    the attribute used in the block's user data. They can keep track of all
+    facts by implementing factsAdded() and factsRemoved().
+    
+    """
+    # the user data attribute that stores the tokens the facts were found in
+    attribute = 'facts'
+    
+    def __init__(self, document):
+        self._numbers = None    # sorted numbers of the blocks having facts
+        self._facts = []        # the facts of those blocks
+        self._ranges = []       # ranges (first, last) of changed block numbers
+        self._count = 0
+        self._revision = document.revision()
+        document.contentsChange.connect(self.slotContentsChange)
+        highlighter.highlighter(document).relexed.connect(self.slotRelexed)
+        variables.manager(document).changed.connect(self.reset)
+    
+    def reset(self):
+        """Forgets all facts; the whole document is examined on the next query.
+        
+        Called when the document variables (e.g. the mode) change.
+        
+        """
+        for facts in self._facts:
+            self.factsRemoved(facts)
+        self._numbers = None
+        self._facts = []
+        self._ranges = []
+    
+    def slotContentsChange(self, position, removed, added):
+        """Called if the document changes, keeps the block numbers up-to-date.
+        
+        The facts of the changed blocks are forgotten, the numbers of the
+        blocks after them are shifted. Formatting changes by the highlighter
+        (that do not increase the document's revision) are ignored.
+        
+        """
+        doc = self.document()
+        revision = doc.revision()
+        if removed == added and revision == self._revision:
+            return
+        self._revision = revision
+        if self._numbers is None:
+            return
+        count = doc.blockCount()
+        first = doc.findBlock(position).blockNumber()
+        last = doc.findBlock(position + added).blockNumber()
+        if first == -1:
+            first = count - 1
+        if last == -1:
+            last = count - 1
+        delta, self._count = count - self._count, count
+        oldlast = last - delta  # the last changed block number before the change
+        numbers = self._numbers
+        i = numbers.bisect_left(first)
+        j = numbers.bisect_right(oldlast)
+        for facts in self._facts[i:j]:
+            self.factsRemoved(facts)
+        del self._facts[i:j]
+        numbers.replace(i, j)
+        numbers.shift(i, delta)
+        ranges = positionlist.change_ranges(
+            self._ranges, max(first - 1, 0), oldlast, last)
+        if len(ranges) > _MAX_RANGES:
+            ranges = [(min(r[0] for r in ranges), max(r[1] for r in ranges))]
+        self._ranges = ranges
+    
+    def slotRelexed(self, first, last):
+        """Called when the highlighter lexed deferred blocks again.
+        
+        The tokens of those blocks may have changed without a change of the
+        text, so they are examined again.
+        
+        """
+        if self._numbers is None:
+            return
+        ranges = self._ranges
+        if ranges and ranges[-1][0] <= first <= ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], last))
+        elif len(ranges) < _MAX_RANGES:
+            ranges.append((first, last))
+        else:
+            self._ranges = [(min(first, min(r[0] for r in ranges)),
+                             max(last, max(r[1] for r in ranges)))]
+    
+    def update(self):
+        """Examines the changed blocks. Called by facts()."""
+        doc = self.document()
+        if self._numbers is None:
+            self._count = doc.blockCount()
+            self._ranges = []
+            numbers, self._facts = [], []
+            pending = ()
+            for block in cursortools.all_blocks(doc):
+                facts, pending = self._examine(block, pending)
+                if facts:
+                    self.factsAdded(facts)
+                    numbers.append(block.blockNumber())
+                    self._facts.append(facts)
+            self._numbers = positionlist.PositionList(numbers)
+        # getting the tokens may lex deferred blocks, adding new ranges
+        while self._ranges:
+            ranges, self._ranges = self._ranges, []
+            self._update(ranges)
+    
+    def _update(self, ranges):
+        """Examines the blocks in the ranges of changed block numbers."""
+        doc = self.document()
+        numbers = self._numbers
+        for first, last in sorted(ranges):
+            block = doc.findBlockByNumber(first)
+            pending = self._pending(block.previous())
+            while block.isValid() and (block.blockNumber() <= last
+                                       or self._relexed(block)
+                                       or highlighter.postponed(block)
+                                       or self._continued(block) != pending):
+                n = block.blockNumber()
+                i = numbers.bisect_left(n)
+                present = i < len(numbers) and numbers[i] == n
+                if present:
+                    self.factsRemoved(self._facts[i])
+                facts, pending = self._examine(block, pending)
+                if facts:
+                    self.factsAdded(facts)
+                if present:
+                    if facts:
+                        self._facts[i] = facts
+                    else:
+                        del self._facts[i]
+                        numbers.replace(i, i + 1)
+                elif facts:
+                    self._facts.insert(i, facts)
+                    numbers.insert(i, n)
+                block = block.next()
+    
+    def blockfacts(self, block, pending):
+        """Returns the facts of the block, by default using blockfacts().
+        
+        pending are the unfinished commands of the previous block.
+        Returns a tuple (facts, pending), see parsefacts().
+        
+        """
+        return blockfacts(block, pending)
+    
+    def factsAdded(self, facts):
+        """Called when the facts of a block are found. The default does nothing."""
+        pass
+    
+    def factsRemoved(self, facts):
+        """Called when the facts of a block are forgotten. The default does nothing."""
+        pass
+    
+    def _examine(self, block, pending):
+        """Returns the facts and the pending commands of the block.
+        
+        Remembers which tokens were examined and the pending commands at the
+        start and the end of the block.
+        
+        """
+        data = cursortools.data(block)
+        setattr(data, self.attribute + 'Continued', pending)
+        facts, pending = self.blockfacts(block, pending)
+        setattr(data, self.attribute + 'Key', _tokenkey(block))
+        setattr(data, self.attribute + 'Pending', pending)
+        return facts, pending
+    
+    def _continued(self, block):
+        """Returns the pending commands the block was examined with."""
+        return getattr(block.userData(), self.attribute + 'Continued', ())
+    
+    def _pending(self, block):
+        """Returns the pending commands at the end of the block when it was examined."""
+        return getattr(block.userData(), self.attribute + 'Pending', ())
+    
+    def _relexed(self, block):
+        """Returns True if the block may have been lexed again since it was examined.
+        
+        Empty token lists can't be distinguished, so True is returned for those.
+        
+        """
+        key = _tokenkey(block)
+        return not key or getattr(block.userData(), self.attribute + 'Key', None) is not key
+    
+    def facts(self, kind, end=None):
+        """Yields the values of the facts of the given kind, in document order.
+        
+        If end is given, only the blocks with a number lower than end are used.
+        
+        """
+        self.update()
+        facts = self._facts
+        if end is not None:
+            facts = itertools.islice(facts, self._numbers.bisect_left(end))
+        for blockfacts in facts:
+            for k, value in blockfacts:
+                if k == kind:
+                    yield value
+    
+    def first(self, kind, default=None):
+        """Returns the value of the first fact of the given kind, or default."""
+        for value in self.facts(kind):
+            return value
+        return default
+
+
 class DocumentInfo(plugin.DocumentPlugin):
     """Computes and caches various information about a Document."""
     def mode(self, guess=True):
@@ -96,9 +539,8 @@ class DocumentInfo(plugin.DocumentPlugin):
         if mode in ly.lex.modes:
             return mode
         if guess:
-            return ly.lex.guessMode(self.document().toPlainText())
+            return guessmode(self.document())
     
-    @resetoncontentschanged
     def version(self):
         """Returns the LilyPond version if set in the document, as a tuple of ints.
         
@@ -107,12 +549,13 @@ class DocumentInfo(plugin.DocumentPlugin):
         Then, if the document is not a LilyPond document, it simply searches for a
         \\version command string, possibly embedded in a comment.
         
-        The version is cached until the documents contents change.
+        The version is found using the facts index, which is kept up-to-date
+        per block.
         
         """
         mkver = lambda strings: tuple(map(int, strings))
         
-        version = ly.parse.version(tokeniter.all_tokens(self.document()))
+        version = BlockFacts.instance(self.document()).first('version')
         if version:
             return mkver(re.findall(r"\d+", version))
         # look at document variables
@@ -121,51 +564,28 @@ class DocumentInfo(plugin.DocumentPlugin):
             return mkver(re.findall(r"\d+", version))
         # parse whole document for non-lilypond documents
         if self.mode() != "lilypond":
-            m = re.search(r'\\version\s*"(\d+\.\d+(\.\d+)*)"', self.document().toPlainText())
-            if m:
-                return mkver(m.group(1).split('.'))
+            version = self._textVersion()
+            if version:
+                return mkver(version.split('.'))
+    
+    @resetoncontentschanged
+    def _textVersion(self):
+        """Returns the version string found in the plain text of the document."""
+        m = re.search(r'\\version\s*"(\d+\.\d+(\.\d+)*)"', self.document().toPlainText())
+        if m:
+            return m.group(1)
     
     def versionString(self):
         """Returns the version of the document as a string, or an empty string."""
         return '.'.join(map(str, self.version() or ()))
     
-    @resetoncontentschanged
     def pitchLanguage(self):
         """Returns the pitchname language used in the document, if defined."""
-        languages = ly.pitch.pitchInfo.keys()
-        for block in cursortools.all_blocks(self.document()):
-            tokens = tokeniter.tokens(block)
-            try:
-                i = tokens.index('\\language')
-            except ValueError:
-                try:
-                    i = tokens.index('\\include')
-                except ValueError:
-                    continue
-            if isinstance(tokens[i], ly.lex.lilypond.Keyword):
-                for t in tokens[i+1:]:
-                    if isinstance(t, ly.lex.Space):
-                        continue
-                    elif t == '"':
-                        continue
-                    lang = t[:-3] if t.endswith('.ly') else t[:]
-                    if lang in languages:
-                        return lang
+        return BlockFacts.instance(self.document()).first('language')
     
-    @resetoncontentschanged
     def globalStaffSize(self, default=20):
         """Returns the global staff size, if set, else the default value."""
-        for block in cursortools.all_blocks(self.document()):
-            tokens = tokeniter.tokens(block)
-            try:
-                i = tokens.index('set-global-staff-size')
-            except ValueError:
-                continue
-            try:
-                return int(tokens[i+2], 10)
-            except (IndexError, ValueError):
-                pass
-        return default
+        return BlockFacts.instance(self.document()).first('staffsize', default)
     
     def master(self):
         """Returns the master filename for the document, if it exists."""
@@ -219,14 +639,13 @@ class DocumentInfo(plugin.DocumentPlugin):
         
         return filename, mode_, includepath
     
-    @resetoncontentschanged
     def includeargs(self):
         """Returns a list of \\include arguments in our document.
         
         See ly.parse.includeargs().
         
         """
-        return list(ly.parse.includeargs(tokeniter.all_tokens(self.document())))
+        return list(BlockFacts.instance(self.document()).facts('include'))
 
     def includefiles(self):
         """Returns a set of filenames that are included by the given document.
@@ -237,7 +656,8 @@ class DocumentInfo(plugin.DocumentPlugin):
         relative to the including file, and if that still yields no file, relative
         to the directories in the includepath().
         
-        This method uses caching for both the document contents and the other files.
+        This method uses caching for both the document contents and the other files,
+        the included files are looked up using the shared include graph.
         
         """
         filename = self.master()
@@ -247,17 +667,15 @@ class DocumentInfo(plugin.DocumentPlugin):
             if not filename:
                 return set()
             includeargs = self.includeargs()
-        files = fileinfo.includefiles(filename, self.includepath(), includeargs)
-        return files
+        return includegraph.graph().includefiles(filename, self.includepath(), includeargs)
 
-    @resetoncontentschanged
     def outputargs(self):
         """Returns a list of output arguments in our document.
         
         See ly.parse.outputargs().
         
         """
-        return list(ly.parse.outputargs(tokeniter.all_tokens(self.document())))
+        return list(BlockFacts.instance(self.document()).facts('output'))
         
     def basenames(self):
         """Returns a list of basenames that our document is expected to create.
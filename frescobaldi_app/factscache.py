@@ -0,0 +1,184 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2012 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Persistent cache of facts about files, such as included library files.
+
+The facts (e.g. the include arguments or the defined names) that FileInfo
+computes by lexing a file are stored on disk, so that unchanged files do not
+need to be lexed again in a next session.
+
+The facts of a file are stored under its filename, together with the size,
+the mtime and a hash of the contents. If size and mtime are unchanged, the
+facts are used directly; otherwise they are used only if the hash of the
+contents is unchanged.
+
+The cache is saved when the application quits, and is discarded when the
+Frescobaldi version changes.
+
+"""
+
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import os
+import time
+
+from PyQt4.QtGui import QDesktopServices
+
+import app
+import info
+
+
+__all__ = ['facts', 'changed', 'stored', 'store']
+
+
+# the maximum number of files to store facts for
+MAXFILES = 2000
+
+# bump this if the stored facts change
+FORMAT = 1
+
+
+_files = None
+_changed = False
+
+
+def filename():
+    """Returns the name of the file the cache is stored in."""
+    path = QDesktopServices.storageLocation(QDesktopServices.DataLocation)
+    return os.path.join(path, 'filefacts.json')
+
+
+def load():
+    """Loads the cache, if not already done."""
+    global _files
+    if _files is not None:
+        return
+    _files = {}
+    app.aboutToQuit.connect(save)
+    try:
+        with open(filename()) as f:
+            d = json.load(f)
+    except (IOError, OSError, ValueError):
+        return
+    if isinstance(d, dict) and d.get('version') == [info.version, FORMAT]:
+        _files = d.get('files') or {}
+
+
+def save():
+    """Saves the cache, if it was changed."""
+    global _changed
+    if not _changed:
+        return
+    files = _files
+    if len(files) > MAXFILES:
+        recent = sorted(files, key=lambda f: files[f]['used'], reverse=True)
+        files = dict((f, files[f]) for f in recent[:MAXFILES])
+    path = filename()
+    temp = path + '.tmp'
+    try:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(temp, 'w') as f:
+            json.dump({'version': [info.version, FORMAT], 'files': files}, f)
+        if os.name == 'nt' and os.path.exists(path):
+            os.remove(path)
+        os.rename(temp, path)
+    except (IOError, OSError):
+        return
+    _changed = False
+
+
+def digest(text):
+    """Returns a hash of the text (a unicode string)."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def facts(filename, text):
+    """Returns the dictionary with the stored facts for the file.
+
+    The text should be the current contents of the file. If the file has
+    changed, an empty dictionary is returned, which you can fill with the
+    facts you compute. Call changed() after adding facts, so the cache is saved.
+
+    The values must be storable as JSON (tuples are returned as lists).
+
+    """
+    global _changed
+    load()
+    try:
+        st = os.stat(filename)
+    except (IOError, OSError):
+        return {}
+    entry = _files.get(filename)
+    if entry is None or entry['size'] != st.st_size or entry['mtime'] != st.st_mtime:
+        h = digest(text)
+        if entry is None or entry['hash'] != h:
+            entry = _files[filename] = {'hash': h, 'facts': {}}
+        entry['size'] = st.st_size
+        entry['mtime'] = st.st_mtime
+        _changed = True
+    # not saved by itself, only used to drop the least recently used files
+    entry['used'] = int(time.time())
+    return entry['facts']
+
+
+def changed():
+    """Marks the cache as changed, so it is saved on exit."""
+    global _changed
+    _changed = True
+
+
+def stored(filename):
+    """Returns the stored facts if the size and mtime of the file are unchanged.
+    
+    Returns None if there are no facts stored for the file, or when it may
+    have changed. This function does not read the file.
+    
+    """
+    load()
+    entry = _files.get(filename)
+    if entry:
+        try:
+            st = os.stat(filename)
+        except (IOError, OSError):
+            return
+        if entry['size'] == st.st_size and entry['mtime'] == st.st_mtime:
+            return entry['facts']
+
+
+def store(filename, size, mtime, hash, facts):
+    """Stores the facts for the file, which had the given size, mtime and hash.
+    
+    This is used to store facts that were computed elsewhere, e.g. in another
+    process by fileinfo.scan().
+    
+    """
+    global _changed
+    load()
+    _files[filename] = {
+        'hash': hash,
+        'size': size,
+        'mtime': mtime,
+        'used': int(time.time()),
+        'facts': facts,
+    }
+    _changed = True
@@ -19,11 +19,18 @@
 
 """
 Caches information about files, and checks the mtime upon request.
+
+The cache can be bounded by the total size of the cached files, the least
+recently used entries are then removed first. The mtime of a file is checked
+at most once every ttl seconds; call invalidate() when a file is known to have
+changed (e.g. when a file system watcher says so).
 """
 
 from __future__ import unicode_literals
 
+import itertools
 import os
+import time
 
 
 class FileCache(object):
@@ -31,28 +38,75 @@ class FileCache(object):
     
     Has __setitem__, __getitem__, __delitem__, clear etc. methods like a dict.
     
+    If maxsize is given, it is the maximum total size in bytes of the files
+    whose information is cached. (The size of the file is used as an
+    approximation of the memory the information takes.) When the cache grows
+    larger, the least recently used entries are removed.
+    
+    The mtime of a file is not checked again within ttl seconds after the
+    previous check.
+    
     """
-    def __init__(self):
-        self._cache = {}
+    def __init__(self, maxsize=None, ttl=2.0):
+        self._cache = {}    # filename: (mtime, size, checked, value, used)
+        self._counter = itertools.count() # increases on every access
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
         
     def __getitem__(self, filename):
-        mtime, value = self._cache[filename]
         try:
-            if mtime == os.path.getmtime(filename):
-                return value
-        except (IOError, OSError):
-            pass
-        del self._cache[filename]
-        raise KeyError
+            mtime, size, checked, value, used = self._cache[filename]
+        except KeyError:
+            self.misses += 1
+            raise
+        now = time.time()
+        if now - checked >= self._ttl:
+            try:
+                valid = mtime == os.path.getmtime(filename)
+            except (IOError, OSError):
+                valid = False
+            if not valid:
+                del self[filename]
+                self.misses += 1
+                raise KeyError(filename)
+            checked = now
+        # mark as the most recently used
+        self._cache[filename] = (mtime, size, checked, value, next(self._counter))
+        self.hits += 1
+        return value
     
     def __setitem__(self, filename, value):
         try:
-            self._cache[filename] = (os.path.getmtime(filename), value)
+            st = os.stat(filename)
         except (IOError, OSError):
-            pass
+            return
+        self.invalidate(filename)
+        self._cache[filename] = (st.st_mtime, st.st_size, time.time(), value,
+                                 next(self._counter))
+        self._size += st.st_size
+        if self._maxsize is not None and self._size > self._maxsize:
+            self._evict()
     
     def __delitem__(self, filename):
-        del self._cache[filename]
+        self._size -= self._cache.pop(filename)[1]
+    
+    def _evict(self):
+        """Removes the least recently used entries until the cache fits maxsize.
+        
+        The most recently used entry is always kept.
+        
+        """
+        entries = sorted(self._cache.items(), key=lambda item: item[1][4])
+        for filename, entry in entries[:-1]:
+            if self._size <= self._maxsize:
+                break
+            del self._cache[filename]
+            self._size -= entry[1]
+            self.evictions += 1
         
     def __contains__(self, filename):
         try:
@@ -61,6 +115,13 @@ class FileCache(object):
         except KeyError:
             return False
     
+    def invalidate(self, filename):
+        """Removes the entry for the filename, if present."""
+        try:
+            del self[filename]
+        except KeyError:
+            pass
+    
     def filenames(self):
         """Yields filenames that are still valid in the cache."""
         for filename in list(self._cache):
@@ -72,5 +133,25 @@ class FileCache(object):
                 
     def clear(self):
         self._cache.clear()
-
+        self._size = 0
+    
+    def size(self):
+        """Returns the total size in bytes of the files in the cache."""
+        return self._size
+    
+    def stats(self):
+        """Returns a dictionary with statistics about the cache.
+        
+        The keys are 'hits', 'misses', 'evictions', 'count' (the number of
+        entries), 'size' (the total size in bytes) and 'maxsize'.
+        
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'count': len(self._cache),
+            'size': self._size,
+            'maxsize': self._maxsize,
+        }
 
@@ -25,20 +25,26 @@ from __future__ import unicode_literals
 
 import functools
 import itertools
+import json
 import os
 import re
 
 import ly.parse
 import ly.lex
+import factscache
 import filecache
 import cachedproperty
 import util
 import variables
 
 
+# the maximum total size in bytes of the files FileInfo instances are cached for
+CACHE_SIZE = 16 * 1024 * 1024
+
+
 class FileInfo(object):
     """Caches information about files."""
-    _cache = filecache.FileCache()
+    _cache = filecache.FileCache(CACHE_SIZE)
     
     @classmethod
     def info(cls, filename):
@@ -48,6 +54,16 @@ class FileInfo(object):
             info = cls._cache[filename] = cls(filename)
         return info
     
+    @classmethod
+    def invalidate(cls, filename):
+        """Forgets the cached information about the file, e.g. when it changed."""
+        cls._cache.invalidate(filename)
+    
+    @classmethod
+    def stats(cls):
+        """Returns a dictionary with statistics about the cache, see FileCache.stats()."""
+        return cls._cache.stats()
+    
     def __init__(self, filename):
         self.filename = filename
         self._tokens = []
@@ -59,6 +75,25 @@ class FileInfo(object):
         with open(self.filename) as f:
             return util.decode(f.read())
     
+    @cachedproperty.cachedproperty(depends=text)
+    def facts(self):
+        """The dictionary with facts about the file that is stored across sessions.
+        
+        See the factscache module.
+        
+        """
+        return factscache.facts(self.filename, self.text())
+    
+    def _fact(self, name, compute):
+        """(Internal) Returns the named fact, computing and storing it if needed."""
+        facts = self.facts()
+        try:
+            return facts[name]
+        except KeyError:
+            value = facts[name] = compute()
+            factscache.changed()
+            return value
+    
     @cachedproperty.cachedproperty(depends=text)
     def variables(self):
         """A dictionary with variables defined in the text."""
@@ -105,6 +140,12 @@ class FileInfo(object):
         \\version command string, possibly embedded in a comment.
         
         """
+        version = self._fact('version', self._version)
+        if version:
+            return tuple(version)
+    
+    def _version(self):
+        """(Internal) Computes the version, see version()."""
         mkver = lambda strings: tuple(map(int, strings))
         version = ly.parse.version(self.tokens())
         if version:
@@ -121,16 +162,21 @@ class FileInfo(object):
     @cachedproperty.cachedproperty(depends=mode)
     def includeargs(self):
         """The list of arguments of \\include commands in the given file."""
-        return list(ly.parse.includeargs(self.tokens()))
+        return self._fact('includeargs', lambda: list(ly.parse.includeargs(self.tokens())))
 
     @cachedproperty.cachedproperty(depends=mode)
     def outputargs(self):
         """The list of arguments of \\bookOutputName, \\bookOutputSuffix etc."""
-        return list(ly.parse.outputargs(self.tokens()))
+        return [tuple(arg) for arg in self._fact('outputargs',
+            lambda: list(ly.parse.outputargs(self.tokens())))]
 
     @cachedproperty.cachedproperty(depends=mode)
     def names(self):
         """The list of LilyPond identifiers that the file defines."""
+        return self._fact('names', self._names)
+    
+    def _names(self):
+        """(Internal) Computes the names, see names()."""
         maybe_name = True
         result = []
         for t in self.tokens():
@@ -147,7 +193,30 @@ class FileInfo(object):
     @cachedproperty.cachedproperty(depends=mode)
     def markup_commands(self):
         """The list of markup commands the file defines."""
-        return list(ly.parse.markup_commands(self.tokens()))
+        return self._fact('markup_commands', lambda: list(ly.parse.markup_commands(self.tokens())))
+
+
+def scan(filename):
+    """Reads and lexes the file and returns its facts, without using any cache.
+    
+    Returns a tuple (filename, size, mtime, hash, facts) that can be given to
+    factscache.store(). The facts dictionary contains the facts FileInfo
+    stores, as plain strings and lists.
+    
+    This function is run in a worker thread by the prescan module.
+    
+    """
+    st = os.stat(filename)  # before reading, so a later change is noticed
+    info = FileInfo(filename)
+    info.facts = {}
+    info.version()
+    info.includeargs()
+    info.outputargs()
+    info.names()
+    info.markup_commands()
+    facts = dict((name, json.loads(json.dumps(value)))
+                 for name, value in info.facts().items())
+    return filename, st.st_size, st.st_mtime, factscache.digest(info.text()), facts
 
 
 def textmode(text, guess=True):
@@ -24,7 +24,12 @@ about a document's contents.
 
 from __future__ import unicode_literals
 
+import array
+import sys
+import time
+import weakref
 
+from PyQt4.QtCore import QPoint, QSettings, QTimer, pyqtSignal
 from PyQt4.QtGui import (
     QSyntaxHighlighter, QTextBlockUserData, QTextCursor, QTextDocument)
 
@@ -34,6 +39,8 @@ import ly.lex.lilypond
 import ly.lex.scheme
 import ly.lex.html
 import ly.lex.texinfo
+import ly.lex.latex
+import ly.lex.docbook
 
 import app
 import cursortools
@@ -52,6 +59,32 @@ def highlighter(document):
     return Highlighter.instance(document)
 
 
+def _viewCreated(view):
+    """Register a new View, so its visible blocks are highlighted first."""
+    highlighter(view.document()).addView(view)
+
+app.viewCreated.connect(_viewCreated)
+
+
+def deferred(block):
+    """Return True if the stored tokens of the block may be outdated.
+    
+    This is the case when lexing the block or a block before it was deferred.
+    
+    """
+    return block.blockNumber() >= highlighter(block.document())._lexPending
+
+
+def postponed(block):
+    """Return True if lexing the block was postponed, it will be lexed again.
+    
+    This is the case when the block was deferred, or when the state of the
+    previous block changed when it was lexed again.
+    
+    """
+    return getattr(block.userData(), 'postponed', False)
+
+
 def highlightFormats():
     """Return the global HighlightFormats instance."""
     global _highlightFormats
@@ -63,22 +96,137 @@ def highlightFormats():
 
 
 def _resetHighlightFormats():
-    """Remove the global HighlightFormats instance, so it's recreated next time."""
+    """Recreate the global HighlightFormats instance if the formats changed.
+    
+    If they changed, the new formats are re-applied to all documents.
+    
+    """
     global _highlightFormats
     try:
-        del _highlightFormats
+        old = _highlightFormats
     except NameError:
-        pass
+        return
+    _highlightFormats = HighlightFormats(textformats.formatData('editor'))
+    if _highlightFormats != old:
+        for h in Highlighter.instances():
+            h.reformat()
 
 app.settingsChanged.connect(_resetHighlightFormats, -100) # before all others
 
 
+# the default time (msec) to spend highlighting at once
+_slice_budget = 20
+
+# the minimum number of frozen states before unused ones are released
+_collect_minimum = 256
+
+# the number of blocks to keep the tokens of, if tokens are stored compact
+_unpacked_cache_size = 32
+
+# lines of at least this length are lexed using checkpoints
+_long_line = 4096
+
+# the minimal distance (in characters) between checkpoints in a long line
+_checkpoint_interval = 1024
+
+# the distance a checkpoint must be away from changed text to be used
+_checkpoint_margin = 64
+
+# all token classes stored in a compact token array, and their index
+_packed_classes = []
+_packed_class_ids = {}
+
+
+def _pack(tokens):
+    """Return an array of (class id, start, end) triples for the tokens."""
+    ids = _packed_class_ids
+    packed = array.array(str('i'))
+    for t in tokens:
+        cls = t.__class__
+        try:
+            i = ids[cls]
+        except KeyError:
+            i = ids[cls] = len(_packed_classes)
+            _packed_classes.append(cls)
+        packed.extend((i, t.pos, t.end))
+    return packed
+
+
+def _common_prefix(a, b):
+    """Return the length of the common prefix of the strings a and b."""
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix(a, b, maximum):
+    """Return the length of the common suffix of a and b, at most maximum."""
+    lo, hi, la, lb = 0, maximum, len(a), len(b)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[la-mid:la-lo] == b[lb-mid:lb-lo]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _unpack(packed, text):
+    """Return the tuple of tokens from the array created by _pack()."""
+    classes = _packed_classes
+    return tuple(classes[packed[i]](text[packed[i+1]:packed[i+2]], packed[i+1])
+                 for i in range(0, len(packed), 3))
+
+
+_class_ids_cache = {}
+
+
+def _class_ids(classes):
+    """Return the set of packed class ids of the subclasses of classes.
+
+    The set is kept up-to-date when new classes are packed.
+
+    """
+    try:
+        count, ids = _class_ids_cache[classes]
+    except KeyError:
+        count, ids = 0, set()
+    if count < len(_packed_classes):
+        ids.update(i for i in range(count, len(_packed_classes))
+                   if issubclass(_packed_classes[i], classes))
+        _class_ids_cache[classes] = len(_packed_classes), ids
+    return ids
+
+
 # when highlighting, don't test all the Token base classes
 _token_mro_slice = slice(1, -len(ly.lex.Token.__mro__))
 
 
+def _token_classes(cls=ly.lex.Token):
+    """Yield all (direct and indirect) subclasses of the Token class."""
+    seen = set()
+    todo = [cls]
+    while todo:
+        for c in todo.pop().__subclasses__():
+            if c not in seen:
+                seen.add(c)
+                todo.append(c)
+                yield c
+
+
 class HighlightFormats(object):
-    """Manages a dictionary with all highlightformats coupled to token types."""
+    """Manages a dictionary with all highlightformats coupled to token types.
+    
+    The format for every Token class is resolved once on construction, and
+    equal formats are represented by the same QTextCharFormat object, so runs()
+    can merge adjacent tokens by simply comparing the formats' identity.
+    
+    """
     def __init__(self, data):
         """Initialize ourselves with a TextFormatData instance."""
         self._formats = d = {}
@@ -144,16 +292,37 @@ class HighlightFormats(object):
         d[ly.lex.texinfo.EscapeChar] = data.textFormat('texinfo', 'escapechar')
         d[ly.lex.texinfo.Verbatim] = data.textFormat('texinfo', 'verbatim')
         d[ly.lex.texinfo.Comment] = data.textFormat('texinfo', 'comment')
+        
+        # keep the defined formats, to be able to compare
+        self._defined = dict(d)
+        
+        # use one instance for equal formats, and None for empty formats
+        unique = []
+        for cls, f in d.items():
+            if not f.propertyCount():
+                d[cls] = None
+                continue
+            for u in unique:
+                if u == f:
+                    d[cls] = u
+                    break
+            else:
+                unique.append(f)
+        
+        # resolve the format of all known token classes once
+        for cls in _token_classes():
+            self.format(cls)
     
     def format(self, token):
         """Return the format defined in the formats dictionary for the token class.
         
+        The token may also be a Token class.
         Returns None if no format is defined.
         Returned values are cached to improve the lookup speed.
         
         """
         d = self._formats
-        cls = token.__class__
+        cls = token if isinstance(token, type) else token.__class__
         try:
             return d[cls]
         except KeyError:
@@ -167,6 +336,34 @@ class HighlightFormats(object):
                 f = None
             d[cls] = f
             return f
+    
+    def runs(self, tokens):
+        """Yield (pos, end, format) tuples for the tokens that have a format.
+        
+        Adjacent tokens that have the same format are merged in one run.
+        
+        """
+        d, format = self._formats, self.format
+        current, start, end = None, 0, 0
+        for t in tokens:
+            try:
+                f = d[t.__class__]
+            except KeyError:
+                f = format(t)
+            if f is current and t.pos == end:
+                end = t.end
+                continue
+            if current is not None:
+                yield start, end, current
+            current, start, end = f, t.pos, t.end
+        if current is not None:
+            yield start, end, current
+    
+    def __eq__(self, other):
+        return self._defined == other._defined
+    
+    def __ne__(self, other):
+        return not self == other
 
         
 class Highlighter(QSyntaxHighlighter, plugin.Plugin):
@@ -177,17 +374,48 @@ class Highlighter(QSyntaxHighlighter, plugin.Plugin):
     - initializes whether highlighting is enabled from the document's metainfo
     - picks the mode from the variables if they specify that
     
-    The Highlighter automatically re-reads the highlighting settings if they
-    are changed.
+    The Highlighter automatically re-applies the highlighting formats if they
+    are changed, using the tokens stored in the blocks (without lexing again).
+    
+    When background highlighting is enabled (the default), Qt is allowed to
+    spend only a limited time (the slice budget) highlighting blocks at once.
+    The remaining blocks are deferred and processed in slices of the same
+    duration from the event loop, the blocks that are visible in a View first.
+    The progress() signal is emitted after every slice. When deferred blocks
+    are lexed later, their tokens change without a change of the text; the
+    relexed() signal is emitted then with the range of those block numbers.
+    
+    Use tokeniter.tokens() and tokeniter.state() to get the tokens of blocks;
+    those lex deferred blocks on demand.
+    
+    If compact tokens are enabled in the preferences, the tokens of a
+    block are stored as an array of (class id, start, end) integers, and Token
+    instances are only created when tokens() is called.  Use tokenMemory() to
+    see the memory used by the stored tokens.
     
     """
+    progress = pyqtSignal(int, int) # blocks done, total number of blocks
+    relexed = pyqtSignal(int, int)  # first, last block lexed again later
+    
     def __init__(self, document):
         QSyntaxHighlighter.__init__(self, document)
         self._fridge = ly.lex.Fridge()
-        app.settingsChanged.connect(self.rehighlight)
+        self._collectThreshold = _collect_minimum
         self._initialState = None
         self._highlighting = True
         self._mode = None
+        self._views = []
+        self._pending = 0
+        self._lexPending = 0
+        self._burstEnd = None
+        self._formatOnly = False
+        self._finishing = False
+        self._generation = 0
+        self._unpacked = []
+        self._backgroundTimer = QTimer(singleShot=True, timeout=self._backgroundSlice)
+        document.contentsChange.connect(self._contentsChange)
+        app.settingsChanged.connect(self.readSettings)
+        self.readSettings()
         self.initializeDocument()
     
     def initializeDocument(self):
@@ -206,6 +434,22 @@ class Highlighter(QSyntaxHighlighter, plugin.Plugin):
             document.loaded.connect(self._resetHighlighting)
             self._mode = documentinfo.mode(document, False)
             variables.manager(document).changed.connect(self._variablesChange)
+    
+    def readSettings(self):
+        """Read the background highlighting settings."""
+        s = QSettings()
+        s.beginGroup("highlighting")
+        self._background = s.value("background", True) not in (False, "false")
+        try:
+            budget = int(s.value("slice_budget", _slice_budget))
+        except (TypeError, ValueError):
+            budget = _slice_budget
+        self._budget = max(1, budget) / 1000.0
+        self._compact = s.value("compact_tokens", False) in (True, "true")
+        if not self._background and self._backgroundTimer.isActive():
+            # finish pending work now
+            self._backgroundTimer.stop()
+            self._process()
         
     def _variablesChange(self):
         """Called whenever the variables have changed. Checks the mode."""
@@ -217,39 +461,421 @@ class Highlighter(QSyntaxHighlighter, plugin.Plugin):
     def _resetHighlighting(self):
         """Switch highlighting on or off depending on saved metainfo."""
         self.setHighlighting(metainfo.info(self.document()).highlighting)
-        
+    
+    def _contentsChange(self, position, removed, added):
+        """(Internal) Keeps the numbers of the first pending blocks up-to-date."""
+        block = self.document().findBlock(position)
+        if block.isValid():
+            self._pending = min(self._pending, block.blockNumber())
+            self._lexPending = min(self._lexPending, block.blockNumber())
+    
     def highlightBlock(self, text):
         """Called by Qt when the highlighting of the current line needs updating."""
-        # find the state of the previous line
-        prev = self.previousBlockState()
+        data = cursortools.data(self.currentBlock())
+        if self._formatOnly:
+            # already lexed: only apply the formats
+            tokens = self._stored(data, text)
+            self.setCurrentBlockState(self.currentBlockState())
+        else:
+            # find the state of the previous line
+            prev = self.previousBlockState()
+            block = self.currentBlock()
+            if postponed(block.previous()) or self._timeUp():
+                return self._defer(data)
+            tokens, userState = self._lex(prev, text, data)
+            self._store(data, tokens)
+            if self._finishing or postponed(block):
+                # not caused by a change of the text: tell the tokens changed
+                data.postponed = False
+                self.relexed.emit(block.blockNumber(), block.blockNumber())
+            self.setCurrentBlockState(userState)
+        data.formatted = self._generation
+        self._applyFormats(tokens)
+    
+    def _applyFormats(self, tokens):
+        """(Internal) Apply the highlighting formats of the tokens, if desired."""
+        if self._highlighting:
+            setFormat = self.setFormat
+            for pos, end, f in highlightFormats().runs(tokens):
+                setFormat(pos, end - pos, f)
+    
+    def _store(self, data, tokens):
+        """(Internal) Store the tokens in the block's user data."""
+        if self._compact:
+            data.packed = _pack(tokens)
+            try:
+                del data.tokens
+            except AttributeError:
+                pass
+        else:
+            data.tokens = tokens
+            try:
+                del data.packed
+            except AttributeError:
+                pass
+    
+    def _stored(self, data, text):
+        """(Internal) Return the tokens stored in the block's user data."""
+        try:
+            return data.tokens
+        except AttributeError:
+            pass
+        packed = data.packed
+        for entry in self._unpacked:
+            if entry[0] is packed:
+                return entry[1]
+        tokens = _unpack(packed, text)
+        self._unpacked.insert(0, (packed, tokens))
+        del self._unpacked[_unpacked_cache_size:]
+        return tokens
+    
+    def tokens(self, block):
+        """Return the tokens of the block as a tuple, lexing it if needed.
+        
+        To get the tokens please use tokeniter.tokens() instead of this method.
+        
+        """
+        self.lexBlocks(block)
+        try:
+            return self._stored(block.userData(), block.text())
+        except AttributeError:
+            return ()
+
+    def spans(self, block, classes):
+        """Return the ranges of the tokens of the given classes in the block.
+
+        classes is a class or tuple of classes as for isinstance(). Returns a
+        list of (start, end) positions in the block; adjacent tokens are
+        combined into one range. Packed tokens are not unpacked for this.
+
+        To get the spans please use tokeniter.spans() instead of this method.
+
+        """
+        self.lexBlocks(block)
+        data = block.userData()
+        tokens = getattr(data, 'tokens', None)
+        if tokens is not None:
+            ranges = ((t.pos, t.end) for t in tokens if isinstance(t, classes))
+        else:
+            packed = getattr(data, 'packed', None)
+            if not packed:
+                return []
+            ids = _class_ids(classes)
+            ranges = ((packed[i+1], packed[i+2])
+                      for i in range(0, len(packed), 3) if packed[i] in ids)
+        result = []
+        for start, end in ranges:
+            if result and result[-1][1] == start:
+                result[-1] = (result[-1][0], end)
+            else:
+                result.append((start, end))
+        return result
+
+    def tokenMemory(self):
+        """Return the approximate number of bytes used by the stored tokens."""
+        size = 0
+        getsizeof = sys.getsizeof
+        for block in cursortools.all_blocks(self.document()):
+            data = block.userData()
+            tokens = getattr(data, 'tokens', None)
+            if tokens is not None:
+                size += getsizeof(tokens) + sum(map(getsizeof, tokens))
+            else:
+                packed = getattr(data, 'packed', None)
+                if packed is not None:
+                    size += getsizeof(packed)
+        return size
+    
+    def _lex(self, prev, text, data):
+        """(Internal) Lex text, starting with the state stored under prev.
+        
+        The data is the block's user data, used to store lexer checkpoints
+        for long lines.
+        Returns the tuple of tokens and the user state to store in the block.
+        
+        """
         state = self._fridge.thaw(prev)
         blank = not state and (not text or text.isspace())
         if not state:
             state = self.initialState()
-
-        # collect and save the tokens
-        tokens = tuple(state.tokens(text))
-        cursortools.data(self.currentBlock()).tokens = tokens
-        
+        if len(text) >= _long_line and not blank:
+            tokens, state = self._lexLong(state, text, data)
+        else:
+            if getattr(data, 'checkpoints', None):
+                del data.checkpoints, data.text, data.endstate
+            tokens = tuple(state.tokens(text))
         # if blank thus far, keep the highlighter coming back
         # because the parsing state is not yet known; else save the state
-        self.setCurrentBlockState(prev - 1 if blank else self._fridge.freeze(state))
+        return tokens, prev - 1 if blank else self._freeze(state)
+    
+    def _lexLong(self, state, text, data):
+        """(Internal) Lex a long line, re-using the tokens of the previous run.
         
-        # apply highlighting if desired
-        if self._highlighting:
-            setFormat = lambda f: self.setFormat(token.pos, len(token), f)
-            formats = highlightFormats()
-            for token in tokens:
-                f = formats.format(token)
-                if f:
-                    setFormat(f)
+        After whitespace tokens (that are never the default token of a parser)
+        at least _checkpoint_interval characters apart, the offset, the token
+        index and the frozen state are stored in the user data.
+        
+        If the line was lexed before starting in the same state, lexing starts
+        at the last checkpoint before the changed text, and stops as soon as
+        the state at a checkpoint after the changed text is the same as before.
+        
+        Returns the tuple of tokens and the State at the end of the line.
+        
+        """
+        start = state.freeze()
+        tokens, checkpoints, pos = [], [(0, 0, start)], 0
+        old, oldtokens, resume, delta = None, (), {}, 0
+        if getattr(data, 'checkpoints', None) and data.checkpoints[0][2] == start:
+            old = data.text
+            oldtokens = self._stored(data, old)
+            prefix = _common_prefix(old, text)
+            suffix = _common_suffix(old, text, min(len(old), len(text)) - prefix)
+            delta = len(text) - len(old)
+            for checkpoint in data.checkpoints[1:]:
+                offset = checkpoint[0]
+                if offset + _checkpoint_margin <= prefix:
+                    checkpoints.append(checkpoint)
+                elif offset >= len(old) - suffix + _checkpoint_margin:
+                    resume[offset + delta] = checkpoint
+            pos, index, frozen = checkpoints[-1]
+            tokens.extend(oldtokens[:index])
+            state = ly.lex.State.thaw(frozen)
+        next_checkpoint = pos + _checkpoint_interval
+        for t in state.tokens(text, pos):
+            tokens.append(t)
+            if isinstance(t, ly.lex.Space):
+                if t.end in resume and state.freeze() == resume[t.end][2]:
+                    # the state reconverged, use the remaining old tokens
+                    offset, index, frozen = resume[t.end]
+                    rest = oldtokens[index:]
+                    if delta:
+                        rest = (r.__class__(r, r.pos + delta) for r in rest)
+                    tokens.extend(rest)
+                    diff = len(tokens) - len(oldtokens)
+                    checkpoints.extend((o + delta, i + diff, f)
+                        for o, i, f in data.checkpoints if o + delta >= t.end)
+                    state = ly.lex.State.thaw(data.endstate)
+                    break
+                elif t.end >= next_checkpoint:
+                    checkpoints.append((t.end, len(tokens), state.freeze()))
+                    next_checkpoint = t.end + _checkpoint_interval
+        data.checkpoints = checkpoints
+        data.text = text
+        data.endstate = state.freeze()
+        return tuple(tokens), state
+    
+    def _timeUp(self):
+        """(Internal) Return True if highlighting a block should be deferred."""
+        if not self._background:
+            return False
+        now = time.time()
+        if self._burstEnd is None:
+            # Qt starts highlighting a range of blocks, until we're back in the
+            # event loop blocks can be highlighted during the slice budget
+            self._burstEnd = now + self._budget
+            QTimer.singleShot(0, self._endBurst)
+            return False
+        return now > self._burstEnd
+    
+    def _endBurst(self):
+        """(Internal) Called from the event loop after Qt highlighted blocks."""
+        self._burstEnd = None
+    
+    def _defer(self, data):
+        """(Internal) Defer lexing and highlighting the current block.
+        
+        The tokens of the previous run are kept, so the block keeps its old
+        highlighting until it is lexed again (tokeniter.tokens() knows they
+        are outdated), and checkpoints of a long line can be re-used.
+        
+        The block also keeps its old state, so Qt does not go on highlighting
+        the following blocks. When lexing the block later changes its state,
+        the next block is postponed in turn.
+        
+        """
+        try:
+            tokens = self._stored(data, self.currentBlock().text())
+        except AttributeError:
+            pass
+        else:
+            self._applyFormats(tokens)
+        data.postponed = True
+        self.setCurrentBlockState(self.currentBlockState())
+        number = self.currentBlock().blockNumber()
+        self._pending = min(self._pending, number)
+        self._lexPending = min(self._lexPending, number)
+        self._backgroundTimer.start()
+    
+    def _unlexed(self, block):
+        """(Internal) Return True if the block has not been lexed yet."""
+        return block.userState() == -1 or postponed(block)
+    
+    def _unfinished(self, block):
+        """(Internal) Return True if the block still needs lexing or highlighting."""
+        return self._unlexed(block) or getattr(
+            block.userData(), 'formatted', self._generation) != self._generation
+    
+    def _nextUnfinished(self, block):
+        """(Internal) Return the first unfinished block, starting at block."""
+        while block.isValid() and not self._unfinished(block):
+            block = block.next()
+        return block
+    
+    def lexBlocks(self, block, deadline=None):
+        """Make sure the block and all blocks before it have been lexed.
+        
+        Blocks that were deferred are lexed (but not highlighted) now.
+        If a deadline (a time.time() value) is given, returns False when it was
+        reached before all blocks were lexed; otherwise returns True.
+        
+        """
+        if not block.isValid() or block.blockNumber() < self._lexPending:
+            return True
+        end = block.blockNumber()
+        block = self.document().findBlockByNumber(self._lexPending)
+        relexed = []
+        try:
+            while block.isValid() and block.blockNumber() <= end:
+                if self._unlexed(block):
+                    if deadline is not None and time.time() > deadline:
+                        self._lexPending = block.blockNumber()
+                        return False
+                    if postponed(block):
+                        relexed.append(block.blockNumber())
+                    data = cursortools.data(block)
+                    tokens, userState = self._lex(
+                        block.previous().userState(), block.text(), data)
+                    self._store(data, tokens)
+                    data.formatted = None
+                    data.postponed = False
+                    if userState != block.userState():
+                        # the following block was lexed with the old state
+                        if block.next().isValid():
+                            cursortools.data(block.next()).postponed = True
+                        block.setUserState(userState)
+                    self._pending = min(self._pending, block.blockNumber())
+                    self._backgroundTimer.start()
+                block = block.next()
+        finally:
+            if relexed:
+                self.relexed.emit(relexed[0], relexed[-1])
+        self._lexPending = end + 1
+        return True
+    
+    def _backgroundSlice(self):
+        """(Internal) Lex and highlight a part of the pending blocks."""
+        self._process(time.time() + self._budget)
+    
+    def _process(self, deadline=None):
+        """(Internal) Lex and highlight pending blocks, the visible ones first.
+        
+        If a deadline (a time.time() value) is given, stops when it is reached,
+        and schedules the next background slice.
         
+        """
+        document = self.document()
+        self._burstEnd = deadline
+        timeLeft = lambda: deadline is None or time.time() < deadline
+        try:
+            # first the visible blocks
+            for block, last in self._visibleBlocks():
+                end = last.blockNumber()
+                while block.isValid() and block.blockNumber() <= end and timeLeft():
+                    if self._unfinished(block):
+                        if not self.lexBlocks(block.previous(), deadline):
+                            break
+                        self._finishBlock(block)
+                    block = block.next()
+            block = self._nextUnfinished(document.findBlockByNumber(self._pending))
+            self._pending = block.blockNumber() if block.isValid() else document.blockCount()
+            while block.isValid() and timeLeft():
+                self._finishBlock(block)
+                block = self._nextUnfinished(block.next())
+        finally:
+            self._burstEnd = None
+        block = self._nextUnfinished(document.findBlockByNumber(self._pending))
+        if block.isValid():
+            self._pending = block.blockNumber()
+            self._backgroundTimer.start()
+        else:
+            self._pending = document.blockCount()
+        # all blocks before the first unfinished one have been lexed
+        self._lexPending = max(self._lexPending, self._pending)
+        self.progress.emit(self._pending, document.blockCount())
+    
+    def _finishBlock(self, block):
+        """(Internal) Lex and highlight the block, or only apply the formats."""
+        if self._unlexed(block):
+            self._finishing = True
+            try:
+                self.rehighlightBlock(block)
+            finally:
+                self._finishing = False
+        else:
+            self._formatOnly = True
+            try:
+                self.rehighlightBlock(block)
+            finally:
+                self._formatOnly = False
+    
+    def reformat(self):
+        """Re-apply the highlighting formats to all blocks, without lexing them.
+        
+        With background highlighting enabled this is done in slices, the
+        visible blocks first.
+        
+        """
+        self._generation += 1
+        self._pending = 0
+        if self._background:
+            self._backgroundTimer.start()
+        else:
+            self._process()
+    
+    def addView(self, view):
+        """Register a View showing our document; its visible blocks go first."""
+        self._views.append(weakref.ref(view))
+        view.verticalScrollBar().valueChanged.connect(self._viewScrolled)
+    
+    def _viewScrolled(self):
+        """(Internal) Called when a View is scrolled; highlights it soon if needed."""
+        if self._pending < self.document().blockCount():
+            self._backgroundTimer.start()
+    
+    def _visibleBlocks(self):
+        """(Internal) Yield the first and last visible block of every visible View."""
+        views = [ref() for ref in self._views]
+        self._views = [weakref.ref(view) for view in views if view]
+        for view in views:
+            if view and view.isVisible():
+                first = view.cursorForPosition(QPoint(0, 0)).block()
+                bottom = QPoint(0, view.viewport().height())
+                yield first, view.cursorForPosition(bottom).block()
+    
+    def _freeze(self, state):
+        """(Internal) Freeze the state, releasing unused states if there are many."""
+        if self._fridge.count() >= self._collectThreshold:
+            self.collectStates()
+        return self._fridge.freeze(state)
+    
+    def collectStates(self):
+        """Release the frozen states that are not used by any block anymore."""
+        used = set(block.userState() for block in cursortools.all_blocks(self.document()))
+        if self._initialState is not None:
+            used.add(self._initialState)
+        self._fridge.collect(used)
+        self._collectThreshold = max(_collect_minimum, self._fridge.count() * 2)
+    
+    def stateCount(self):
+        """Return the number of frozen parser states currently stored."""
+        return self._fridge.count()
+    
     def setHighlighting(self, enable):
         """Enable or disable highlighting."""
         changed = enable != self._highlighting
         self._highlighting = enable
         if changed:
-            self.rehighlight()
+            self.reformat()
             
     def isHighlighting(self):
         """Return whether highlighting is active."""
@@ -258,7 +884,7 @@ class Highlighter(QSyntaxHighlighter, plugin.Plugin):
     def state(self, block):
         """Return a thawn ly.lex.State() object at the beginning of the QTextBlock.
         
-        This assumes the highlighter has already run through the whole document.
+        This assumes the blocks before the block have already been lexed.
         To get the state info please use tokeniter.state() instead of this method.
         
         """
@@ -272,7 +898,7 @@ class Highlighter(QSyntaxHighlighter, plugin.Plugin):
     def initialState(self):
         """Return the initial State for this document."""
         if self._initialState is None:
-            mode = self._mode or ly.lex.guessMode(self.document().toPlainText())
+            mode = self._mode or documentinfo.guessmode(self.document())
             return ly.lex.state(mode)
         return self._fridge.thaw(self._initialState)
 
@@ -303,12 +929,10 @@ def highlight(document, formats=None, state=None):
     cursor = QTextCursor(document)
     block = document.firstBlock()
     while block.isValid():
-        for token in state.tokens(block.text()):
-            f = formats.format(token)
-            if f:
-                cursor.setPosition(block.position() + token.pos)
-                cursor.setPosition(block.position() + token.end, QTextCursor.KeepAnchor)
-                cursor.setCharFormat(f)
+        for pos, end, f in formats.runs(state.tokens(block.text())):
+            cursor.setPosition(block.position() + pos)
+            cursor.setPosition(block.position() + end, QTextCursor.KeepAnchor)
+            cursor.setCharFormat(f)
         block = block.next()
 
 
@@ -0,0 +1,249 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2012 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+A graph of included files, shared by all documents.
+
+The arguments of \\include commands are resolved to filenames only once.
+The files that were read and the directories that were searched are watched
+using a QFileSystemWatcher, and only the affected parts of the graph are
+forgotten when they change.
+
+Use graph() to get the global IncludeGraph instance.
+
+"""
+
+from __future__ import unicode_literals
+
+import os
+
+from PyQt4.QtCore import QFileSystemWatcher
+
+import fileinfo
+import signals
+import util
+
+
+__all__ = ['graph', 'IncludeGraph']
+
+
+_graph = None
+
+
+def graph():
+    """Returns the global IncludeGraph instance."""
+    global _graph
+    if _graph is None:
+        _graph = IncludeGraph()
+    return _graph
+
+
+class IncludeGraph(object):
+    """Keeps track of which files include which other files.
+
+    Included files are searched relative to the including file, relative to
+    the master file and then in the include path, like fileinfo.includefiles()
+    does. Because the master file directory and the include path influence
+    the result, the edges of the graph are stored per (filename, context),
+    where the context is a tuple (master directory, include path).
+
+    The changed() signal is emitted when parts of the graph were forgotten
+    because files or directories changed on disk: with the filename of which
+    the edges were forgotten, or with None when a directory changed (which
+    may change the edges of any file). The fileChanged() signal is emitted
+    with the filename when a watched file changed.
+
+    """
+    changed = signals.Signal()
+    fileChanged = signals.Signal()
+
+    def __init__(self):
+        self._resolved = {}     # (directory, arg, context): filename or None
+        self._lookups = {}      # directory: set of keys of _resolved
+        self._users = {}        # key of _resolved: set of nodes that used it
+        self._edges = {}        # node: tuple of included filenames
+        self._reverse = {}      # filename: set of nodes that include it
+        self._nodes = {}        # filename: set of nodes for that filename
+        self._watcher = QFileSystemWatcher()
+        self._watcher.fileChanged.connect(self.slotFileChanged)
+        self._watcher.directoryChanged.connect(self.slotDirectoryChanged)
+        self._watchedFiles = set()
+        self._watchedDirectories = set()
+
+    def includes(self, filename, include_path=()):
+        """Returns a tuple with the filenames the file directly includes.
+
+        The filename itself is used as master file.
+
+        """
+        return self._includes((filename, self._context(filename, include_path)))
+
+    def includedby(self, filename):
+        """Returns the set of filenames that are known to include the filename.
+
+        Only files that have been looked at by the graph (i.e. the files
+        included by the documents that were asked for) are considered.
+
+        """
+        return set(node[0] for node in self._reverse.get(filename, ()))
+
+    def includefiles(self, filename, include_path=(), initial_args=None):
+        """Returns a set of filenames that are included by the given filename.
+
+        See fileinfo.includefiles(), which this method replaces.
+        The filename is not scanned if initial_args is given, which is useful
+        for documents that have been modified in the editor.
+
+        """
+        context = self._context(filename, include_path)
+        if initial_args is None:
+            if not filename:
+                return set()
+            todo = list(self._includes((filename, context)))
+        else:
+            todo = list(self._targets(None, context[0], initial_args, context))
+        files = set()
+        while todo:
+            path = todo.pop()
+            if path not in files:
+                files.add(path)
+                todo.extend(self._includes((path, context)))
+        return files
+
+    def resolve(self, includer, args, filename, include_path=()):
+        """Returns a tuple with the filenames the include arguments refer to.
+
+        The includer is the file containing the include arguments (which are
+        not read again), the filename is the master file. The includer is
+        watched and its edges are stored like those of the other methods.
+
+        """
+        return self._includes((includer, self._context(filename, include_path)), args)
+
+    def _context(self, filename, include_path):
+        """(Internal) Returns the context tuple for the (master) filename."""
+        return (os.path.dirname(filename) if filename else None, tuple(include_path))
+
+    def _includes(self, node, args=None):
+        """(Internal) Returns the included files for the node, from the cache if possible.
+
+        If args is given, the file is not read to get the include arguments.
+
+        """
+        try:
+            return self._edges[node]
+        except KeyError:
+            pass
+        filename, context = node
+        self._watchFile(filename)
+        self._nodes.setdefault(filename, set()).add(node)
+        if args is None:
+            args = fileinfo.FileInfo.info(filename).includeargs()
+        targets = self._edges[node] = self._targets(node, os.path.dirname(filename), args, context)
+        for path in targets:
+            self._reverse.setdefault(path, set()).add(node)
+        return targets
+
+    def _targets(self, node, directory, args, context):
+        """(Internal) Resolves the include args, returns a tuple of filenames.
+
+        If node is not None, it is recorded as depending on the results.
+
+        """
+        targets = []
+        for arg in args:
+            key = (directory, arg, context)
+            if node:
+                self._users.setdefault(key, set()).add(node)
+            path = self._resolve(key)
+            if path:
+                targets.append(path)
+        return tuple(util.uniq(targets))
+
+    def _resolve(self, key):
+        """(Internal) Returns the filename an include argument refers to, or None."""
+        try:
+            return self._resolved[key]
+        except KeyError:
+            pass
+        directory, arg, (basedir, include_path) = key
+        result = None
+        for d in util.uniq(d for d in (directory, basedir) + include_path if d):
+            path = os.path.join(d, arg)
+            parent = os.path.dirname(path)
+            self._watchDirectory(parent if os.path.isdir(parent) else d)
+            self._lookups.setdefault(parent, set()).add(key)
+            self._lookups.setdefault(d, set()).add(key)
+            if os.path.isfile(path):
+                result = path
+                break
+        self._resolved[key] = result
+        return result
+
+    def _watchFile(self, filename):
+        """(Internal) Starts watching the file, if not already done."""
+        if filename not in self._watchedFiles and os.path.isfile(filename):
+            self._watchedFiles.add(filename)
+            self._watcher.addPath(filename)
+
+    def _watchDirectory(self, directory):
+        """(Internal) Starts watching the directory, if not already done."""
+        if directory not in self._watchedDirectories and os.path.isdir(directory):
+            self._watchedDirectories.add(directory)
+            self._watcher.addPath(directory)
+
+    def _forget(self, node):
+        """(Internal) Forgets the edges of the node."""
+        targets = self._edges.pop(node, None)
+        if targets is not None:
+            for path in targets:
+                nodes = self._reverse.get(path)
+                if nodes:
+                    nodes.discard(node)
+                    if not nodes:
+                        del self._reverse[path]
+            return True
+        return False
+
+    def slotFileChanged(self, filename):
+        """Called when a watched file changes, forgets its edges."""
+        # the file may have been replaced, it is watched again when needed
+        self._watchedFiles.discard(filename)
+        self._watcher.removePath(filename)
+        fileinfo.FileInfo.invalidate(filename)
+        self.fileChanged(filename)
+        forgotten = False
+        for node in self._nodes.pop(filename, ()):
+            forgotten = self._forget(node) or forgotten
+        if forgotten:
+            self.changed(filename)
+
+    def slotDirectoryChanged(self, directory):
+        """Called when a watched directory changes, forgets resolved arguments."""
+        self._watchedDirectories.discard(directory)
+        self._watcher.removePath(directory)
+        forgotten = False
+        for d in list(self._lookups):
+            if d == directory or d.startswith(os.path.join(directory, '')):
+                for key in self._lookups.pop(d):
+                    self._resolved.pop(key, None)
+                    for node in self._users.pop(key, ()):
+                        forgotten = self._forget(node) or forgotten
+        if forgotten:
+            self.changed(None)
@@ -53,7 +53,7 @@ class ListModel(QAbstractListModel):
         display, tooltip and icon may be functions that extract the data from an item
         for the respective role (DisplayRole, ToolTipRole or DecorationRole).
         
-        The original data can be found in the _data attribute.
+        The original data is returned by items().
         
         """
         super(ListModel, self).__init__(parent)
@@ -70,6 +70,24 @@ class ListModel(QAbstractListModel):
         if icon:
             self._roles[Qt.DecorationRole] = icon
     
+    def items(self):
+        """Returns the data list given on construction or to setItems()."""
+        return self._data
+    
+    def setItems(self, data):
+        """Replaces the data list, resetting the model."""
+        self.beginResetModel()
+        self._data = data
+        self.endResetModel()
+    
+    def roleFunction(self, role):
+        """Returns the function set for the Qt.ItemDataRole, or None."""
+        return self._roles.get(role)
+    
+    def roleFunctions(self):
+        """Returns a new dictionary mapping the Qt.ItemDataRoles to their function."""
+        return dict(self._roles)
+    
     def setRoleFunction(self, role, function):
         """Sets a function that returns a value for a Qt.ItemDataRole.
         
@@ -25,6 +25,7 @@ from __future__ import unicode_literals
 
 import itertools
 
+from .. import util
 from . import _token
 from . import Parser, FallthroughParser
 
@@ -221,7 +222,7 @@ class Articulation(_token.Token):
     @_token.patternproperty
     def rx():
         from .. import words
-        return r"\\({0})(?![A-Za-z])".format("|".join(itertools.chain(
+        return r"\\({0})(?![A-Za-z])".format(util.words2regexp(itertools.chain(
             words.articulations,
             words.ornaments,
             words.fermatas,
@@ -309,7 +310,7 @@ class Keyword(_token.Item):
     @_token.patternproperty
     def rx():
         from .. import words
-        return r"\\({0})(?![A-Za-z])".format("|".join(words.lilypond_keywords))
+        return r"\\({0})(?![A-Za-z])".format(util.words2regexp(words.lilypond_keywords))
 
 
 class VoiceSeparator(Delimiter):
@@ -324,7 +325,7 @@ class Command(_token.Item):
     @_token.patternproperty
     def rx():
         from .. import words
-        return r"\\({0})(?![A-Za-z])".format("|".join(words.lilypond_music_commands))
+        return r"\\({0})(?![A-Za-z])".format(util.words2regexp(words.lilypond_music_commands))
     
 
 class Specifier(_token.Token):
@@ -452,14 +453,14 @@ class RepeatSpecifier(Specifier):
     @_token.patternproperty
     def rx():
         from .. import words
-        return r"\b({0})(?![A-Za-z])".format("|".join(words.repeat_types))
+        return r"\b({0})(?![A-Za-z])".format(util.words2regexp(words.repeat_types))
     
 
 class RepeatStringSpecifier(String, Specifier):
     @_token.patternproperty
     def rx():
         from .. import words
-        return r'"({0})"'.format("|".join(words.repeat_types))
+        return r'"({0})"'.format(util.words2regexp(words.repeat_types))
     
 
 class RepeatCount(IntegerValue, _token.Leaver):
@@ -521,7 +522,7 @@ class ClefSpecifier(Specifier):
     @_token.patternproperty
     def rx():
         from .. import words
-        return r"\b({0})\b".format("|".join(words.clefs_plain))
+        return r"\b({0})\b".format(util.words2regexp(words.clefs_plain))
     
     def update_state(self, state):
         state.leave()
@@ -611,49 +612,49 @@ class ContextName(_token.Token):
     @_token.patternproperty
     def rx():
         from .. import words
-        return r"\b({0})\b".format("|".join(words.contexts))
+        return r"\b({0})\b".format(util.words2regexp(words.contexts))
     
 
 class BackSlashedContextName(ContextName):
     @_token.patternproperty
     def rx():
         from .. import words
-        return r"\\({0})\b".format("|".join(words.contexts))
+        return r"\\({0})\b".format(util.words2regexp(words.contexts))
     
     
 class GrobName(_token.Token):
     @_token.patternproperty
     def rx():
         from .. import data
-        return r"\b({0})\b".format("|".join(data.grobs()))
+        return r"\b({0})\b".format(util.words2regexp(data.grobs()))
 
 
 class ContextProperty(_token.Token):
     @_token.patternproperty
     def rx():
         from .. import data
-        return r"\b({0})\b".format("|".join(data.context_properties()))
+        return r"\b({0})\b".format(util.words2regexp(data.context_properties()))
 
 
 class PaperVariable(Variable):
     @_token.patternproperty
     def rx():
         from .. import words
-        return r"\b({0})\b".format("|".join(words.papervariables))
+        return r"\b({0})\b".format(util.words2regexp(words.papervariables))
 
 
 class HeaderVariable(Variable):
     @_token.patternproperty
     def rx():
         from .. import words
-        return r"\b({0})\b".format("|".join(words.headervariables))
+        return r"\b({0})\b".format(util.words2regexp(words.headervariables))
 
 
 class LayoutVariable(Variable):
     @_token.patternproperty
     def rx():
         from .. import words
-        return r"\b({0})\b".format("|".join(words.layoutvariables))
+        return r"\b({0})\b".format(util.words2regexp(words.layoutvariables))
 
 
 class Chord(_token.Token):
@@ -84,24 +84,33 @@ def version(tokens):
 def markup_commands(tokens):
     """Yield markup command definition names."""
     for t in tokens:
-        # find #(define-markup-command construction
-        if t == 'define-markup-command' and isinstance(t, lex.scheme.Word):
-            for t in itertools.islice(tokens, 5):
-                if isinstance(t, lex.scheme.Word):
-                    yield t
-                    break
-        # or find blabla = \markup { ... } construction
-        elif isinstance(t, lex.lilypond.Name):
-            source = itertools.islice(tokens, 4)
-            for t1 in source:
-                if t1 == "=":
-                    for t1 in source:
-                        if t1 == '\\markup':
-                            yield t
-                            break
-                        elif not isinstance(t1, lex.Space):
-                            break
-                elif not isinstance(t1, lex.Space):
-                    break
+        name = markup_command(t, tokens)
+        if name:
+            yield name
+
+
+def markup_command(token, tokens):
+    """Returns the name of the markup command defined starting with token, or None.
+    
+    The token stream tokens should yield the tokens following token.
+    
+    """
+    # find #(define-markup-command construction
+    if token == 'define-markup-command' and isinstance(token, lex.scheme.Word):
+        for t in itertools.islice(tokens, 5):
+            if isinstance(t, lex.scheme.Word):
+                return t
+    # or find blabla = \markup { ... } construction
+    elif isinstance(token, lex.lilypond.Name):
+        source = itertools.islice(tokens, 4)
+        for t in source:
+            if t == "=":
+                for t in source:
+                    if t == '\\markup':
+                        return token
+                    elif not isinstance(t, lex.Space):
+                        return
+            elif not isinstance(t, lex.Space):
+                return
 
 
@@ -23,6 +23,7 @@ Utility functions.
 
 from __future__ import unicode_literals
 
+import re
 import string
 
 
@@ -111,3 +112,42 @@ def mkid(*args):
     return "".join(result)
 
 
+
+
+def words2regexp(words):
+    """Returns a regular expression string that matches any of the words.
+    
+    The words are combined in a prefix tree, so that the regular expression
+    engine does not need to try every word in turn, which is much faster for
+    large word lists.  Of words starting with the same characters, the longest
+    possible word is matched.  The expression contains no capturing groups.
+    
+    """
+    tree = {}
+    for word in words:
+        node = tree
+        for c in word:
+            node = node.setdefault(c, {})
+        node[''] = {}
+    
+    def build(node):
+        chars, alternatives = [], []
+        for c in sorted(node):
+            if c:
+                if list(node[c]) == ['']:
+                    chars.append(re.escape(c))
+                else:
+                    alternatives.append(re.escape(c) + build(node[c]))
+        if len(chars) == 1:
+            alternatives.append(chars[0])
+        elif chars:
+            alternatives.append('[{0}]'.format(''.join(chars)))
+        if '' in node:
+            if len(alternatives) == 1 and chars:
+                return alternatives[0] + '?'
+            return '(?:{0})?'.format('|'.join(alternatives))
+        elif len(alternatives) == 1:
+            return alternatives[0]
+        return '(?:{0})'.format('|'.join(alternatives))
+    
+    return build(tree) if tree else '(?!)'
@@ -137,6 +137,7 @@ def main():
     import matcher          # matches braces etc in active text window
     import progress         # creates progress bar in view space
     import autocomplete     # auto-complete input
+    import prescan          # scan include trees of loaded documents
     
     if app.qApp.isSessionRestored():
         # Restore session, we are started by the session manager
@@ -35,6 +35,7 @@ import qpopplerview
 
 import app
 import util
+import positionlist
 import scratchdir
 import ly.lex
 import tokeniter
@@ -122,8 +123,8 @@ class Links(object):
         """Binds the given filename to the given document.
         
         When the document disappears, the binding is removed automatically.
-        While a document is bound, textedit links are stored as QTextCursors,
-        so they keep their position even if the user changes the document.
+        While a document is bound, the positions of the textedit links are
+        kept up-to-date, even if the user changes the document.
         
         """
         if filename not in self._docs:
@@ -143,6 +144,7 @@ class Links(object):
         else:
             return
         del self._docs[filename]
+        b.release()
     
     def cursor(self, link, load=False):
         """Returns the destination of a link as a QTextCursor of the destination document.
@@ -175,30 +177,90 @@ class Links(object):
 
 
 class BoundLinks(object):
-    """Stores links as QTextCursors for a document."""
+    """Stores the positions of the links in a document.
+    
+    Instead of a QTextCursor for every link (which Qt would all need to update
+    on every change), the positions are stored in a PositionList, which is
+    adjusted when the document changes. Call release() (or just drop the
+    BoundLinks) to stop following the changes.
+    
+    """
     def __init__(self, doc, links):
-        """Creates QTextCursor instances for every link, keeps a reference to the document."""
+        """Computes the positions of the links, keeps a reference to the document."""
         self.document = doc
-        # make a sorted list of cursors with their [(pageNum, linkArea) ...] destinations list
-        self._cursor_dict = d = {}              # mapping from (line, col) to QTextCursor
-        self._cursors = cursors = []            # sorted list of the cursors
+        # make a sorted list of positions with their [(pageNum, linkArea) ...] destinations list
+        self._indices = d = {}                  # mapping from (line, col) to index
+        positions = []                          # sorted list of the positions
         self._destinations = destinations = []  # corresponding list of destinations
+        self._revision = doc.revision()
         for pos, dest in sorted(links.items()):
             line, column = pos
             b = doc.findBlockByNumber(line - 1)
             if b.isValid():
-                c = d[pos] = QTextCursor(doc)
-                c.setPosition(b.position() + column)
-                cursors.append(c)
+                d[pos] = len(positions)
+                positions.append(b.position() + min(column, b.length() - 1))
                 destinations.append(dest)
+        self._positions = positionlist.PositionList(positions)
+        def contentsChange(position, removed, added, selfref=weakref.ref(self)):
+            self = selfref()
+            if self:
+                self.slotContentsChange(position, removed, added)
+        doc.contentsChange.connect(contentsChange)
+        self._slot = contentsChange
+    
+    def __del__(self):
+        self.release()
+    
+    def release(self):
+        """Disconnects from the document, the positions are not updated anymore."""
+        if self._slot:
+            try:
+                self.document.contentsChange.disconnect(self._slot)
+            except (TypeError, RuntimeError):
+                pass # already disconnected, or the document was deleted
+            self._slot = None
+    
+    def slotContentsChange(self, position, removed, added):
+        """Called when the document changes, moves the positions like QTextCursors would.
         
+        Formatting changes by the highlighter (that do not increase the
+        document's revision) are ignored.
+        
+        """
+        revision = self.document.revision()
+        if removed == added and revision == self._revision:
+            return
+        self._revision = revision
+        self._positions.change(position, removed, added)
+    
+    def position(self, index):
+        """Returns the position of the link at the index."""
+        return self._positions[index]
+    
+    def positions(self):
+        """Returns a new sorted list of the positions of the links."""
+        return self._positions.positions()
+    
     def cursor(self, line, column):
-        """Returns the QTextCursor for the give line/col."""
-        return self._cursor_dict.get((line, column))
+        """Returns a QTextCursor for the given line/col, or None if there is no link."""
+        index = self._indices.get((line, column))
+        if index is not None:
+            c = QTextCursor(self.document)
+            c.setPosition(self.position(index))
+            return c
     
     def cursors(self):
-        """Returns the list of cursors, sorted on cursor position."""
-        return self._cursors
+        """Returns a list of new cursors, sorted on cursor position.
+        
+        Creates a QTextCursor for every link, so use positions() if possible.
+        
+        """
+        result = []
+        for pos in self.positions():
+            c = QTextCursor(self.document)
+            c.setPosition(pos)
+            result.append(c)
+        return result
         
     def destinations(self):
         """Returns the list of destinations.
@@ -223,24 +285,17 @@ class BoundLinks(object):
         points to the _ending_ point of a slur, beam or phrasing slur.
         
         """
-        cursors = self._cursors
+        position = self.position
         
         def findlink(pos):
-            # binary search in list of cursors
-            lo, hi = 0, len(cursors)
-            while lo < hi:
-                mid = (lo + hi) // 2
-                if pos < cursors[mid].position():
-                    hi = mid
-                else:
-                    lo = mid + 1
-            return lo - 1
+            # binary search in the positions
+            return self._positions.bisect_right(pos) - 1
         
         if cursor.hasSelection():
             end = findlink(cursor.selectionEnd() - 1)
             if end >= 0:
                 start = findlink(cursor.selectionStart())
-                if start < 0 or cursors[start].position() < cursor.selectionStart():
+                if start < 0 or position(start) < cursor.selectionStart():
                     start += 1
                 if start <= end:
                     return slice(start, end+1)
@@ -250,12 +305,12 @@ class BoundLinks(object):
         if index < 0:
             return # before all other links
         
-        cur2 = cursors[index]
-        if cur2.position() < cursor.position():
+        pos2 = position(index)
+        if pos2 < cursor.position():
             # is the cursor at an ending token like a slur end?
             prevcol = -1
-            if cur2.block() == cursor.block():
-                prevcol = cur2.position() - cur2.block().position()
+            if cursor.block().contains(pos2):
+                prevcol = pos2 - cursor.block().position()
             col = cursor.position() - cursor.block().position()
             found = False
             tokens = tokeniter.Runner(cursor.block(), True)
@@ -279,9 +334,9 @@ class BoundLinks(object):
                         break
             if found:
                 index = findlink(tokens.block.position() + token.pos)
-                if index < 0 or cursors[index].block() != tokens.block:
+                if index < 0 or not tokens.block.contains(position(index)):
                     return
-            elif cur2.block() != cursor.block():
+            elif not cursor.block().contains(pos2):
                 return False
         # highlight it!
         return slice(index, index+1)
@@ -0,0 +1,263 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2012 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Sorted lists of positions (or block numbers) and ranges that can be shifted
+cheaply.
+
+When a document changes, all positions after the change move by the same
+amount. Instead of changing all those positions, the PositionList stores
+the positions from an index on (the split) relative to an offset (the delta).
+Shifting the positions from an index on only needs to change the positions
+between the old and the new split, which makes a series of nearby edits
+cheap.
+
+This module does not depend on Qt.
+
+"""
+
+from __future__ import unicode_literals
+
+import bisect
+
+
+class PositionList(object):
+    """A sorted list of integers, of which the tail can be shifted cheaply.
+
+    Indexing, len() and iterating work like with a list. Use bisect_left()
+    and bisect_right() to search, shift() to move the positions from an index
+    on, and replace() to change, delete or insert positions. change() moves
+    the positions after a change of the document.
+
+    """
+    def __init__(self, positions=()):
+        self._positions = list(positions)
+        self._split = 0     # the positions from here on are relative
+        self._delta = 0     # to this offset
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __getitem__(self, index):
+        p = self._positions[index]
+        if index < 0:
+            index += len(self._positions)
+        return p + self._delta if index >= self._split else p
+
+    def __iter__(self):
+        return iter(self.positions())
+
+    def __repr__(self):
+        return '<{0} {1!r}>'.format(type(self).__name__, self.positions())
+
+    def positions(self):
+        """Returns a new list with all the positions."""
+        split, delta = self._split, self._delta
+        return self._positions[:split] + [p + delta for p in self._positions[split:]]
+
+    def _move(self, index):
+        """(Internal) Makes the positions from index on relative to the offset."""
+        positions, split, delta = self._positions, self._split, self._delta
+        if delta:
+            if index > split:
+                positions[split:index] = [p + delta for p in positions[split:index]]
+            elif index < split:
+                positions[index:split] = [p - delta for p in positions[index:split]]
+        self._split = index
+
+    def bisect_left(self, pos):
+        """Returns the index of the first position >= pos."""
+        positions, split = self._positions, self._split
+        if split and positions[split - 1] >= pos:
+            return bisect.bisect_left(positions, pos, 0, split)
+        return bisect.bisect_left(positions, pos - self._delta, split)
+
+    def bisect_right(self, pos):
+        """Returns the index of the first position > pos."""
+        positions, split = self._positions, self._split
+        if split and positions[split - 1] > pos:
+            return bisect.bisect_right(positions, pos, 0, split)
+        return bisect.bisect_right(positions, pos - self._delta, split)
+
+    def shift(self, index, delta):
+        """Adds delta to all positions from index on.
+
+        The list must remain sorted.
+
+        """
+        self._move(index)
+        self._delta += delta
+
+    def replace(self, start, end, positions=()):
+        """Replaces the positions[start:end] with the given positions.
+
+        Use an empty sequence to delete positions. The list must remain sorted.
+
+        """
+        self._move(start)
+        delta = self._delta
+        self._positions[start:end] = [p - delta for p in positions]
+
+    def insert(self, index, pos):
+        """Inserts the position at index. The list must remain sorted."""
+        self.replace(index, index, (pos,))
+
+    def change(self, position, removed, added):
+        """Moves the positions after a change of the document.
+
+        Positions inside the removed text move to the end of the added text,
+        like the positions of QTextCursors.
+
+        """
+        first = self.bisect_left(position)
+        last = self.bisect_left(position + removed)
+        if last > first:
+            self.replace(first, last, [position + added] * (last - first))
+        self.shift(last, added - removed)
+
+
+def change_ranges(ranges, first, oldlast, last):
+    """Returns a new list of (first, last) ranges of block numbers after a change.
+
+    The blocks first to oldlast (inclusive) were replaced by the blocks first
+    to last. The ranges after the change are shifted, the ranges touching it
+    are merged with it, and the range (first, last) is added as the first.
+
+    """
+    delta = last - oldlast
+    changed = [first, last]
+    result = [None]
+    for start, end in ranges:
+        if end < first:
+            result.append((start, end))
+        elif start > oldlast:
+            result.append((start + delta, end + delta))
+        else:
+            changed[0] = min(changed[0], start)
+            changed[1] = max(changed[1], end + delta)
+    result[0] = tuple(changed)
+    return result
+
+
+class RangeList(object):
+    """A sorted list of (start, end) ranges, of which the tail can be shifted cheaply.
+
+    The starts are kept in a PositionList, the lengths in a list, so that
+    shifting the ranges does not need to change the lengths. The ranges may
+    overlap. Indexing, len() and iterating yield (start, end) tuples.
+
+    When the document changes, call adjust() to move the ranges like the
+    selections of QTextCursors would move, or discard() to remove the ranges
+    that are touched by the change.
+
+    """
+    def __init__(self, ranges=()):
+        ranges = sorted(ranges)
+        self._starts = PositionList(start for start, end in ranges)
+        self._lengths = [end - start for start, end in ranges]
+        self._maxlength = max(self._lengths or [0])
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def __getitem__(self, index):
+        start = self._starts[index]
+        return start, start + self._lengths[index]
+
+    def __iter__(self):
+        return iter(self.ranges())
+
+    def __repr__(self):
+        return '<{0} {1!r}>'.format(type(self).__name__, self.ranges())
+
+    def ranges(self, start=0, end=None):
+        """Returns a new list with the (start, end) tuples that touch the given region.
+
+        By default all ranges are returned.
+
+        """
+        starts, lengths = self._starts, self._lengths
+        if start <= 0 and end is None:
+            return [(s, s + l) for s, l in zip(starts, lengths)]
+        first = starts.bisect_left(start - self._maxlength)
+        last = len(starts) if end is None else starts.bisect_right(end)
+        result = []
+        for i in range(first, last):
+            s = starts[i]
+            e = s + lengths[i]
+            if e >= start:
+                result.append((s, e))
+        return result
+
+    def bisect_left(self, pos):
+        """Returns the index of the first range starting at or after pos."""
+        return self._starts.bisect_left(pos)
+
+    def bisect_right(self, pos):
+        """Returns the index of the first range starting after pos."""
+        return self._starts.bisect_right(pos)
+
+    def remove(self, start, end):
+        """Removes the ranges[start:end]."""
+        self._starts.replace(start, end)
+        del self._lengths[start:end]
+
+    def adjust(self, position, removed, added):
+        """Moves the ranges after a change of the document.
+
+        Positions inside the removed text move to the end of the added text,
+        like the positions of QTextCursors.
+
+        """
+        starts, lengths = self._starts, self._lengths
+        end = position + removed
+        delta = added - removed
+        # the ranges that end in or after the change, but start before it
+        first = starts.bisect_left(position)
+        for i in range(starts.bisect_left(position - self._maxlength), first):
+            s = starts[i]
+            e = s + lengths[i]
+            if e >= position:
+                lengths[i] = max(e, end) + delta - s
+                self._maxlength = max(self._maxlength, lengths[i])
+        # the ranges that start in the change
+        last = starts.bisect_left(end)
+        new = position + added
+        lengths[first:last] = [max(starts[i] + lengths[i], end) + delta - new
+                               for i in range(first, last)]
+        starts.change(position, removed, added)
+
+    def discard(self, position, removed, added):
+        """Removes the ranges touched by a change and moves the ranges after it.
+
+        A range is touched if it overlaps the removed text, or if text is
+        inserted inside it. Returns the number of removed ranges.
+
+        """
+        starts, lengths = self._starts, self._lengths
+        first = starts.bisect_right(position - self._maxlength)
+        last = starts.bisect_left(position + removed)
+        keep = [i for i in range(first, last) if starts[i] + lengths[i] <= position]
+        count = last - first - len(keep)
+        if count:
+            starts.replace(first, last, [starts[i] for i in keep])
+            lengths[first:last] = [lengths[i] for i in keep]
+            last = first + len(keep)
+        starts.shift(last, added - removed)
+        return count
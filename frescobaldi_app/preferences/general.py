@@ -51,6 +51,8 @@ class GeneralPrefs(preferences.GroupsPage):
         layout.addWidget(StartSession(self))
         layout.addStretch(0)
         layout.addWidget(SavingDocument(self))
+        layout.addStretch(0)
+        layout.addWidget(Performance(self))
 
 
 class General(preferences.Group):
@@ -248,3 +250,72 @@ class SavingDocument(preferences.Group):
         s.setValue("basedir", self.basedir.path())
 
 
+class Performance(preferences.Group):
+    def __init__(self, page):
+        super(Performance, self).__init__(page)
+        
+        grid = QGridLayout()
+        self.setLayout(grid)
+        
+        def changed():
+            self.changed.emit()
+            self.budget.setEnabled(self.background.isChecked())
+        
+        self.background = QCheckBox(toggled=changed)
+        grid.addWidget(self.background, 0, 0, 1, 3)
+        
+        self.budgetLabel = QLabel()
+        self.budget = QSpinBox(minimum=1, maximum=1000, valueChanged=self.changed)
+        self.budgetLabel.setBuddy(self.budget)
+        grid.addWidget(self.budgetLabel, 1, 0)
+        grid.addWidget(self.budget, 1, 1)
+        
+        self.compact = QCheckBox(toggled=self.changed)
+        grid.addWidget(self.compact, 2, 0, 1, 3)
+        
+        self.prescan = QCheckBox(toggled=self.changed)
+        grid.addWidget(self.prescan, 3, 0, 1, 3)
+        
+        grid.setColumnStretch(2, 1)
+        app.translateUI(self)
+        
+    def translateUI(self):
+        self.setTitle(_("Performance"))
+        self.background.setText(_("Highlight large documents in the background"))
+        self.background.setToolTip(_(
+            "If checked, the parts of a document that are not visible "
+            "are highlighted a bit at a time, so the editor keeps responding."))
+        self.budgetLabel.setText(_("Time to highlight at once:"))
+        self.budget.setSuffix(_(" msec"))
+        self.compact.setText(_("Store the tokens of the highlighter compactly"))
+        self.compact.setToolTip(_(
+            "If checked, the highlighter uses less memory for large documents, "
+            "at the cost of some speed."))
+        self.prescan.setText(_("Scan included files in the background"))
+        self.prescan.setToolTip(_(
+            "If checked, the files a document includes are read when the "
+            "document is loaded, so completion and the symbol index don't "
+            "need to read them later."))
+        
+    def loadSettings(self):
+        s = QSettings()
+        s.beginGroup("highlighting")
+        self.background.setChecked(s.value("background", True) not in (False, "false"))
+        try:
+            budget = int(s.value("slice_budget", 20))
+        except (TypeError, ValueError):
+            budget = 20
+        self.budget.setValue(budget)
+        self.budget.setEnabled(self.background.isChecked())
+        self.compact.setChecked(s.value("compact_tokens", False) in (True, "true"))
+        s.endGroup()
+        self.prescan.setChecked(s.value("prescan_includes", True) not in (False, "false"))
+        
+    def saveSettings(self):
+        s = QSettings()
+        s.beginGroup("highlighting")
+        s.setValue("background", self.background.isChecked())
+        s.setValue("slice_budget", self.budget.value())
+        s.setValue("compact_tokens", self.compact.isChecked())
+        s.endGroup()
+        s.setValue("prescan_includes", self.prescan.isChecked())
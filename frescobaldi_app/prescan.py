@@ -0,0 +1,150 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2012 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Scans the include tree of a file in the background.
+
+When a document is loaded, the files it includes (recursively) are read and
+lexed by a worker thread, using fileinfo.scan(). The facts are stored in the
+factscache as the results arrive, so FileInfo does not need to lex the files
+anymore on the GUI thread.
+
+Files whose facts are already in the factscache (and that did not change) are
+not scanned again.
+
+This does not make scanning faster: the files are lexed one by one, in the
+same time it would take on the GUI thread, but the GUI stays responsive
+meanwhile. A thread is used and not a pool of processes, because forking the
+running GUI process is not safe. One thread is enough: Python runs only one
+thread at a time, so more threads would not make scanning faster.
+
+"""
+
+from __future__ import unicode_literals
+
+from multiprocessing.pool import ThreadPool
+
+from PyQt4.QtCore import QSettings, QTimer
+
+import app
+import documentinfo
+import factscache
+import fileinfo
+import includegraph
+import signals
+import symbolindex
+
+
+_worker = None
+_running = set()
+
+
+def worker():
+    """Returns the background worker thread, as a ThreadPool with one thread.
+    
+    Use its apply_async() method to run a function in the background.
+    
+    """
+    global _worker
+    if _worker is None:
+        _worker = ThreadPool(1)
+        app.aboutToQuit.connect(_worker.terminate)
+    return _worker
+
+
+def prescan(filename, include_path=()):
+    """Starts scanning the include tree of filename in the background.
+
+    Returns the Prescan instance, which is kept alive until it has finished.
+
+    """
+    p = Prescan(filename, include_path)
+    _running.add(p)
+    p.finished.connect(lambda files: _running.discard(p))
+    p.start()
+    return p
+
+
+class Prescan(object):
+    """Scans the include tree of a file, using the worker thread.
+
+    The finished() signal is emitted with the set of found filenames when done.
+
+    """
+    finished = signals.Signal()
+
+    def __init__(self, filename, include_path=()):
+        self.filename = filename
+        self._include_path = include_path
+        self._files = set()
+        self._pending = []      # AsyncResult objects
+        self._timer = QTimer(interval=50, timeout=self._poll)
+
+    def start(self):
+        """Starts scanning."""
+        self._found(self.filename)
+        self._timer.start()
+
+    def files(self):
+        """Returns the set of filenames found until now."""
+        return self._files
+
+    def _found(self, filename):
+        """(Internal) Called for every file in the tree, scans it if needed."""
+        if filename in self._files:
+            return
+        self._files.add(filename)
+        facts = factscache.stored(filename)
+        if facts is not None and 'includeargs' in facts:
+            self._includes(filename, facts['includeargs'])
+        else:
+            self._pending.append(worker().apply_async(fileinfo.scan, (filename,)))
+
+    def _includes(self, filename, includeargs):
+        """(Internal) Resolves the include arguments of the file."""
+        for path in includegraph.graph().resolve(filename,
+                includeargs, self.filename, self._include_path):
+            self._found(path)
+
+    def _poll(self):
+        """(Internal) Handles the results that have arrived."""
+        for result in [r for r in self._pending if r.ready()]:
+            self._pending.remove(result)
+            try:
+                self._scanned(*result.get())
+            except (IOError, OSError, ValueError):
+                pass
+        if not self._pending:
+            self._timer.stop()
+            self.finished(self._files)
+
+    def _scanned(self, filename, size, mtime, hash, facts):
+        """(Internal) Stores the facts of a scanned file and follows its includes."""
+        factscache.store(filename, size, mtime, hash, facts)
+        self._includes(filename, facts['includeargs'])
+
+
+def _documentLoaded(document):
+    """Starts prescanning the include tree of a loaded local document."""
+    filename = document.url().toLocalFile()
+    if filename and QSettings().value("prescan_includes", True) not in (False, "false"):
+        p = prescan(filename, documentinfo.info(document).includepath())
+        p.finished.connect(symbolindex.index().add)
+
+app.documentLoaded.connect(_documentLoaded)
@@ -18,15 +18,18 @@
 # See http://www.gnu.org/licenses/ for more information.
 
 """
-Manages the progress bar in the status bar of ViewSpaces.
+Manages the progress bars in the status bar of ViewSpaces.
 """
 
 from __future__ import unicode_literals
 
+import weakref
+
 from PyQt4.QtCore import Qt, QTimeLine, QTimer
 from PyQt4.QtGui import QProgressBar
 
 import app
+import highlighter
 import plugin
 import jobmanager
 import metainfo
@@ -70,4 +73,42 @@ class ProgressBar(plugin.ViewSpacePlugin):
                 metainfo.info(document).buildtime = job.elapsed()
 
 
+class HighlightProgress(plugin.ViewSpacePlugin):
+    """A progress bar showing the background highlighting of a document."""
+    def __init__(self, viewSpace):
+        self._highlighter = lambda: None
+        bar = self._bar = QProgressBar(textVisible=False)
+        bar.setMaximumHeight(14)
+        bar.setMaximumWidth(100)
+        viewSpace.status.layout().addWidget(bar)
+        bar.hide()
+        viewSpace.viewChanged.connect(self.viewChanged)
+        app.translateUI(self)
+    
+    def translateUI(self):
+        self._bar.setToolTip(_("Highlighting..."))
+    
+    def viewChanged(self, view):
+        old = self._highlighter()
+        if old:
+            try:
+                old.progress.disconnect(self.showProgress)
+            except (RuntimeError, TypeError):
+                pass    # the document was closed
+        h = highlighter.highlighter(view.document())
+        h.progress.connect(self.showProgress)
+        self._highlighter = weakref.ref(h)
+        self._bar.hide()
+    
+    def showProgress(self, done, total):
+        """Shows the number of highlighted blocks, hides the bar when done."""
+        if done < total:
+            self._bar.setMaximum(total)
+            self._bar.setValue(done)
+            self._bar.show()
+        else:
+            self._bar.hide()
+
+
 app.viewSpaceCreated.connect(ProgressBar.instance)
+app.viewSpaceCreated.connect(HighlightProgress.instance)
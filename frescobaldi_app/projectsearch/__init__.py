@@ -0,0 +1,44 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2012 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Find and replace in all files of the project.
+"""
+
+from __future__ import unicode_literals
+
+from PyQt4.QtCore import Qt
+
+import panel
+
+
+class ProjectSearch(panel.Panel):
+    """A dockwidget to search and replace in all open documents and included files."""
+    def __init__(self, mainwindow):
+        super(ProjectSearch, self).__init__(mainwindow)
+        self.hide()
+        mainwindow.addDockWidget(Qt.BottomDockWidgetArea, self)
+
+    def translateUI(self):
+        self.setWindowTitle(_("Find in Project"))
+        self.toggleViewAction().setText(_("Find in &Project"))
+
+    def createWidget(self):
+        from . import widget
+        return widget.Widget(self)
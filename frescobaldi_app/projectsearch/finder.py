@@ -0,0 +1,271 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2012 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Searches and replaces in all files of a project.
+
+The project consists of the open documents and the files included by the
+master file of the current document. Open documents are searched on the GUI
+thread, the other files are read and searched by the worker thread of the
+prescan module.
+
+"""
+
+from __future__ import unicode_literals
+
+import codecs
+import collections
+import os
+import re
+
+from PyQt4.QtCore import QTimer
+from PyQt4.QtGui import QTextCursor
+
+import app
+import cursortools
+import documentinfo
+import prescan
+import signals
+import util
+
+
+# a match: line number, column and length of the match, and the text of the line
+Match = collections.namedtuple('Match', 'line column length text')
+
+
+def project(document):
+    """Returns the documents and the filenames to search for the document.
+
+    The documents are all open documents, the filenames are the master file
+    and the files it includes (recursively), except those that are open.
+
+    """
+    documents = list(app.documents)
+    opened = set(d.url().toLocalFile() for d in documents)
+    info = documentinfo.info(document)
+    filenames = set(info.includefiles())
+    master = info.master()
+    if master:
+        filenames.add(master)
+    return documents, sorted(filenames - opened)
+
+
+def search_text(text, pattern, flags=0):
+    """Returns the list of Match tuples for the pattern in the text."""
+    matches = []
+    line = 0
+    linestart = 0   # position of the start of the line
+    for m in re.finditer(pattern, text, flags):
+        start = m.start()
+        line += text.count('\n', linestart, start)
+        linestart = text.rfind('\n', 0, start) + 1
+        lineend = text.find('\n', start)
+        if lineend == -1:
+            lineend = len(text)
+        matches.append(Match(line, start - linestart, m.end() - start,
+                             text[linestart:lineend]))
+    return matches
+
+
+def normalize(text):
+    """Returns the text with normalized newlines, like in a document.
+
+    Also returns the first newline found in the text ('\n' if there is none),
+    so that it can be used again when writing the text.
+
+    """
+    m = re.search(r'\r\n?|\n', text)
+    newline = m.group() if m else '\n'
+    return text.replace('\r\n', '\n').replace('\r', '\n'), newline
+
+
+def read(filename):
+    """Returns the text of the file, its encoding and byte order mark.
+
+    The encoding is the one util.encode() should use if the text has no coding
+    variable. The byte order mark is an empty string if there is none.
+
+    """
+    with open(filename, 'rb') as f:
+        data = f.read()
+    text = util.decode(data)
+    for bom in (codecs.BOM_UTF8, codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE):
+        if data.startswith(bom):
+            return text, 'utf-8' if bom == codecs.BOM_UTF8 else None, bom
+    try:
+        data.decode('utf-8')
+    except UnicodeError:
+        return text, 'latin1', b''
+    return text, 'utf-8', b''
+
+
+def search_file(filename, pattern, flags=0):
+    """Reads the file and returns a tuple (filename, matches).
+
+    matches is a list of Match tuples, or None if the file could not be read.
+    Newlines are normalized, like in a document.
+    This function is run in the worker thread.
+
+    """
+    try:
+        text = read(filename)[0]
+    except (IOError, OSError):
+        return filename, None
+    return filename, search_text(normalize(text)[0], pattern, flags)
+
+
+def replace_file(filename, pattern, flags, replacement):
+    """Replaces all matches of the pattern in the file on disk.
+
+    The newlines are normalized like in search_file(), so the pattern matches
+    the same text; the file is written with the newline it used.
+    The new text is written to a temporary file in the same directory, which
+    then replaces the file, so the file is never left half-written.
+    Returns a tuple (filename, count); count is None if the file could not be
+    read or written (UTF-16 files are not changed).
+    This function is run in the worker thread.
+
+    """
+    try:
+        text, encoding, bom = read(filename)
+        if not encoding:
+            return filename, None
+        text, newline = normalize(text)
+        text, count = re.compile(pattern, flags).subn(replacement, text)
+        if count:
+            if newline != '\n':
+                text = text.replace('\n', newline)
+            temp = filename + '.frescobaldi-replace'
+            with open(temp, 'wb') as f:
+                f.write(bom + util.encode(text, encoding))
+            try:
+                os.chmod(temp, os.stat(filename).st_mode)
+                if os.name == 'nt':
+                    os.remove(filename)
+                os.rename(temp, filename)
+            except (IOError, OSError):
+                os.remove(temp)
+                raise
+    except (IOError, OSError, re.error):
+        return filename, None
+    return filename, count
+
+
+def replace_document(document, pattern, flags, replacement):
+    """Replaces all matches in the document, as one undo step.
+
+    The matches are replaced from the last to the first (see
+    cursortools.replace_ranges()), the text between them is not touched.
+    Returns the number of replacements.
+
+    """
+    text = document.toPlainText()
+    edits = []
+    for m in re.finditer(pattern, text, flags):
+        try:
+            edits.append((m.start(), m.end(), m.expand(replacement)))
+        except re.error:
+            return 0
+    if edits:
+        cursortools.replace_ranges(QTextCursor(document), edits)
+    return len(edits)
+
+
+class Finder(object):
+    """Searches or replaces in open documents and files, in the background.
+
+    The found() signal is emitted for every searched document or file with
+    the document or filename and the list of Match tuples.
+    The replaced() signal is emitted with the document or filename and the
+    number of replacements, or None if a file could not be changed.
+    The finished() signal is emitted when all documents and files are done.
+
+    """
+    found = signals.Signal()
+    replaced = signals.Signal()
+    finished = signals.Signal()
+
+    def __init__(self, documents, filenames, pattern, flags=0):
+        self._documents = list(documents)
+        self._filenames = list(filenames)
+        self._pattern = pattern
+        self._flags = flags
+        self._replacement = None
+        self._pending = []      # AsyncResult objects
+        self._timer = QTimer(interval=20, timeout=self._poll)
+
+    def search(self):
+        """Starts searching."""
+        self._start(search_file, (self._pattern, self._flags))
+
+    def replace(self, replacement):
+        """Starts replacing all matches with the replacement text.
+
+        Each open document is changed in one undoable edit block, the other
+        files are changed on disk.
+
+        """
+        self._replacement = replacement
+        self._start(replace_file, (self._pattern, self._flags, replacement))
+
+    def stop(self):
+        """Stops; the results that did not arrive yet are discarded."""
+        self._timer.stop()
+        self._documents = []
+        self._filenames = []
+        self._pending = []
+
+    def isRunning(self):
+        """Returns True if the search or replace is not finished."""
+        return self._timer.isActive()
+
+    def _start(self, function, args):
+        """(Internal) Hands the files to the worker thread and starts polling."""
+        worker = prescan.worker()
+        self._pending = [worker.apply_async(function, (filename,) + args)
+                         for filename in self._filenames]
+        self._filenames = []
+        self._timer.start()
+
+    def _poll(self):
+        """(Internal) Handles the results that arrived and one document or file."""
+        for result in [r for r in self._pending if r.ready()]:
+            self._pending.remove(result)
+            try:
+                self._result(*result.get())
+            except (IOError, OSError):
+                pass
+        if self._documents:
+            doc = self._documents.pop(0)
+            if self._replacement is None:
+                self.found(doc, search_text(doc.toPlainText(), self._pattern, self._flags))
+            else:
+                self.replaced(doc, replace_document(doc, self._pattern, self._flags, self._replacement))
+        if not self._pending and not self._documents:
+            self._timer.stop()
+            self.finished()
+
+    def _result(self, filename, result):
+        """(Internal) Emits the result for a file."""
+        if self._replacement is None:
+            if result is not None:
+                self.found(filename, result)
+        else:
+            self.replaced(filename, result)
+
@@ -0,0 +1,251 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2012 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+The Find in Project widget.
+"""
+
+from __future__ import unicode_literals
+
+import re
+
+from PyQt4.QtCore import *
+from PyQt4.QtGui import *
+
+import app
+import icons
+import util
+
+from . import finder
+
+
+class Widget(QWidget):
+    def __init__(self, tool):
+        super(Widget, self).__init__(tool)
+        self._finder = None
+        self._items = {}    # document or filename: QTreeWidgetItem
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(layout)
+
+        grid = QGridLayout()
+        layout.addLayout(grid)
+
+        self.searchLabel = QLabel()
+        self.searchEntry = QLineEdit()
+        self.searchLabel.setBuddy(self.searchEntry)
+        self.caseCheck = QCheckBox(checked=True)
+        self.regexCheck = QCheckBox()
+        self.findButton = QPushButton(clicked=self.slotFind)
+
+        self.replaceLabel = QLabel()
+        self.replaceEntry = QLineEdit()
+        self.replaceLabel.setBuddy(self.replaceEntry)
+        self.replaceAllButton = QPushButton(clicked=self.slotReplaceAll)
+        self.stopButton = QPushButton(clicked=self.slotStop, enabled=False)
+
+        grid.addWidget(self.searchLabel, 0, 0)
+        grid.addWidget(self.searchEntry, 0, 1)
+        grid.addWidget(self.caseCheck, 0, 2)
+        grid.addWidget(self.regexCheck, 0, 3)
+        grid.addWidget(self.findButton, 0, 4)
+        grid.addWidget(self.replaceLabel, 1, 0)
+        grid.addWidget(self.replaceEntry, 1, 1)
+        grid.addWidget(self.stopButton, 1, 3)
+        grid.addWidget(self.replaceAllButton, 1, 4)
+
+        self.status = QLabel()
+        layout.addWidget(self.status)
+
+        self.results = QTreeWidget(headerHidden=True)
+        self.results.itemActivated.connect(self.slotItemActivated)
+        layout.addWidget(self.results)
+
+        self.searchEntry.returnPressed.connect(self.slotFind)
+        app.documentClosed.connect(self.slotDocumentClosed)
+        app.translateUI(self)
+
+    def translateUI(self):
+        self.searchLabel.setText(_("Search:"))
+        self.caseCheck.setText(_("&Case"))
+        self.caseCheck.setToolTip(_("Case Sensitive"))
+        self.regexCheck.setText(_("&Regex"))
+        self.regexCheck.setToolTip(_("Regular Expression"))
+        self.findButton.setText(_("&Find"))
+        self.replaceLabel.setText(_("Replace:"))
+        self.replaceAllButton.setText(_("Replace &All"))
+        self.stopButton.setText(_("&Stop"))
+
+    def mainwindow(self):
+        return self.parentWidget().mainwindow()
+
+    def pattern(self):
+        """Returns the search pattern and re flags, or None if there is no valid pattern."""
+        text = self.searchEntry.text()
+        if not text:
+            return
+        flags = re.MULTILINE | re.UNICODE
+        if not self.caseCheck.isChecked():
+            flags |= re.IGNORECASE
+        if not self.regexCheck.isChecked():
+            text = re.escape(text)
+        try:
+            re.compile(text, flags)
+        except re.error:
+            self.status.setText(_("Invalid regular expression."))
+            return
+        return text, flags
+
+    def replacement(self):
+        """Returns the replacement text to use with the pattern."""
+        text = self.replaceEntry.text()
+        if not self.regexCheck.isChecked():
+            text = text.replace('\\', '\\\\')
+        return text
+
+    def start(self, pattern, flags, replacing=False):
+        """Stops a running search and returns a new Finder for the current project."""
+        self.slotStop()
+        self._replacing = replacing
+        self.results.clear()
+        self._items = {}
+        self._count = 0
+        documents, filenames = finder.project(self.mainwindow().currentDocument())
+        self._finder = f = finder.Finder(documents, filenames, pattern, flags)
+        f.finished.connect(self.slotFinished)
+        self.stopButton.setEnabled(True)
+        return f
+
+    def slotFind(self):
+        """Searches the project."""
+        p = self.pattern()
+        if p:
+            f = self.start(*p)
+            f.found.connect(self.slotFound)
+            self.status.setText(_("Searching..."))
+            f.search()
+
+    def slotReplaceAll(self):
+        """Replaces all matches in the project, after asking for confirmation."""
+        p = self.pattern()
+        if not p:
+            return
+        filenames = finder.project(self.mainwindow().currentDocument())[1]
+        if filenames and QMessageBox.question(self, app.caption(_("Replace All")),
+            _("Do you want to replace all occurrences in the open documents "
+              "and in {count} files that are not open?\n\n"
+              "The files that are not open are changed on disk, "
+              "this can't be undone.").format(count=len(filenames)),
+            QMessageBox.Yes | QMessageBox.Cancel) != QMessageBox.Yes:
+            return
+        f = self.start(*p, replacing=True)
+        f.replaced.connect(self.slotReplaced)
+        self.status.setText(_("Replacing..."))
+        f.replace(self.replacement())
+
+    def slotStop(self):
+        """Stops a running search or replace."""
+        if self._finder and self._finder.isRunning():
+            self._finder.stop()
+            self.slotFinished()
+
+    def slotFinished(self):
+        self.stopButton.setEnabled(False)
+        files = len(self._items)
+        if not self._replacing:
+            self.status.setText(_("{count} matches in {files} files.").format(
+                count=self._count, files=files))
+        else:
+            self.status.setText(_("{count} replacements in {files} files.").format(
+                count=self._count, files=files))
+
+    def fileItem(self, target):
+        """Returns a new toplevel item for the document or filename."""
+        item = self._items[target] = QTreeWidgetItem(self.results)
+        item.target = target
+        if isinstance(target, basestring):
+            item.setText(0, util.homify(target))
+            item.setIcon(0, icons.get('text-plain'))
+        else:
+            item.setText(0, target.documentName())
+            item.setIcon(0, icons.get('document-edit'))
+            if target.url().toLocalFile():
+                item.setToolTip(0, util.homify(target.url().toLocalFile()))
+        return item
+
+    def slotFound(self, target, matches):
+        """Adds the matches of a document or file to the results."""
+        if not matches:
+            return
+        item = self.fileItem(target)
+        for m in matches:
+            child = QTreeWidgetItem(item)
+            child.match = m
+            child.setText(0, "{0}: {1}".format(m.line + 1, m.text.strip()))
+        item.setText(0, "{0} ({1})".format(item.text(0), len(matches)))
+        item.setExpanded(True)
+        self._count += len(matches)
+
+    def slotReplaced(self, target, count):
+        """Adds the number of replacements in a document or file to the results."""
+        if count == 0:
+            return
+        item = self.fileItem(target)
+        if count is None:
+            item.setText(0, _("{name} (could not be changed)").format(name=item.text(0)))
+        else:
+            item.setText(0, "{0} ({1})".format(item.text(0), count))
+            self._count += count
+
+    def slotDocumentClosed(self, doc):
+        """Keeps the results of a closed document by its filename."""
+        item = self._items.pop(doc, None)
+        if item:
+            filename = doc.url().toLocalFile()
+            item.target = filename or None
+            if filename:
+                self._items[filename] = item
+
+    def slotItemActivated(self, item):
+        """Shows the document of the item and selects its match."""
+        match = getattr(item, 'match', None)
+        if match:
+            item = item.parent()
+        target = item.target
+        if target is None:
+            return
+        mainwindow = self.mainwindow()
+        if isinstance(target, basestring):
+            doc = mainwindow.openUrl(QUrl.fromLocalFile(target))
+            if not doc:
+                return
+        else:
+            doc = target
+        mainwindow.setCurrentDocument(doc)
+        if match:
+            block = doc.findBlockByNumber(match.line)
+            if block.isValid():
+                cursor = QTextCursor(block)
+                pos = block.position() + match.column
+                cursor.setPosition(min(pos, block.position() + block.length() - 1))
+                cursor.setPosition(min(pos + match.length, doc.characterCount() - 1),
+                                   QTextCursor.KeepAnchor)
+                mainwindow.currentView().setTextCursor(cursor)
+        mainwindow.currentView().setFocus()
@@ -24,9 +24,12 @@ Finds out which files are created by running the engraver.
 from __future__ import unicode_literals
 
 import itertools
+import fnmatch
 import glob
 import os
 
+from PyQt4.QtCore import QFileSystemWatcher
+
 import app
 import documentinfo
 import jobmanager
@@ -42,15 +45,37 @@ def results(document):
 @app.jobStarted.connect
 def _init_basenames(document):
     results(document).saveDocumentInfo()
-    
+
+
+# Forget the cached directory listings when a job has finished
+def _refresh(document):
+    results(document).refresh()
+
+app.jobFinished.connect(_refresh, -100) # before all others, that list the files
+
 
 
 class Results(plugin.DocumentPlugin):
-    """Can be queried to get the files created by running the engraver (LilyPond) on our document."""
+    """Can be queried to get the files created by running the engraver (LilyPond) on our document.
+    
+    The listings of the directories the files are searched in are cached, so
+    querying the files does not need to list the directories again. Only the
+    mtimes of the few files found are read. The listings are forgotten when a
+    job finishes, when the document is saved, and when a directory changes
+    (using a file system watcher).
+    
+    The mtimes are not cached: a file system watcher on a directory does not
+    notice it when an existing file is overwritten, e.g. by running LilyPond
+    outside Frescobaldi.
+    
+    """
     def __init__(self, document):
         self._jobfile = None
         self._basenames = None
+        self._listings = {}
+        self._watcher = None
         document.saved.connect(self.forgetDocumentInfo)
+        document.saved.connect(self.refresh)
         
     def saveDocumentInfo(self):
         """Takes over some vital information from a DocumentInfo instance.
@@ -102,13 +127,11 @@ class Results(plugin.DocumentPlugin):
         """
         jobfile = self.jobfile()
         if jobfile:
-            files = util.files(self.basenames(), extension)
+            files = self._files(self.basenames(), extension)
             if newer:
-                try:
-                    mtime = os.path.getmtime(jobfile)
-                    files = filter(lambda fname: os.path.getmtime(fname) >= mtime, files)
-                except (OSError, IOError):
-                    pass
+                mtime = self._mtime(jobfile)
+                if mtime is not None:
+                    files = [f for f in files if self._mtime(f) >= mtime]
             return list(util.uniq(files))
         return []
     
@@ -120,12 +143,74 @@ class Results(plugin.DocumentPlugin):
         """
         jobfile = self.jobfile()
         if jobfile:
-            try:
-                return os.path.getmtime(filename) > os.path.getmtime(jobfile)
-            except (OSError, IOError):
-                pass
+            mtime, jobmtime = self._mtime(filename), self._mtime(jobfile)
+            if mtime is not None and jobmtime is not None:
+                return mtime > jobmtime
         return True
         
+    def refresh(self):
+        """Forgets the cached directory listings, so they are read again when needed."""
+        self._listings.clear()
+    
+    def _files(self, basenames, extension):
+        """(Internal) Yields filenames with the basenames and extension, like util.files()."""
+        for name in basenames:
+            directory, basename = os.path.split(name)
+            names = self._listing(directory)
+            basename = basename.replace('[', '[[]').replace('?', '[?]').replace('*', '[*]')
+            if not basename:
+                patterns = ((True, '*' + extension),)
+            else:
+                patterns = ((False, basename + extension),
+                            (True, basename + '-*[0-9]' + extension))
+            for dosort, pattern in patterns:
+                files = [os.path.join(directory, n) for n in fnmatch.filter(names, pattern)
+                         if pattern[0] == '.' or n[0] != '.']
+                if dosort:
+                    files.sort(key=util.naturalsort)
+                for f in files:
+                    yield f
+    
+    def _listing(self, directory):
+        """(Internal) Returns the cached set of the names in the directory."""
+        try:
+            return self._listings[directory]
+        except KeyError:
+            pass
+        try:
+            names = os.listdir(directory or os.curdir)
+        except (OSError, IOError):
+            names = []
+        listing = self._listings[directory] = set(names)
+        if directory and os.path.isdir(directory):
+            if self._watcher is None:
+                self._watcher = QFileSystemWatcher()
+                self._watcher.directoryChanged.connect(self._directoryChanged)
+            if directory not in self._watcher.directories():
+                self._watcher.addPath(directory)
+        return listing
+    
+    def _mtime(self, filename):
+        """(Internal) Returns the mtime of the file, or None if it does not exist.
+        
+        Files that are not in the cached listing of their directory are not
+        looked at.
+        
+        """
+        directory, name = os.path.split(filename)
+        listing = self._listing(directory)
+        if name in listing:
+            try:
+                return os.path.getmtime(filename)
+            except (OSError, IOError):
+                listing.discard(name)
+    
+    def _directoryChanged(self, directory):
+        """(Internal) Called when a watched directory changes, forgets its listing."""
+        for d in list(self._listings):
+            if os.path.normpath(d) == os.path.normpath(directory):
+                del self._listings[d]
+    
     def currentDirectory(self):
         """Returns the directory the document resides in.
         
@@ -25,28 +25,83 @@ from __future__ import unicode_literals
 
 import bisect
 import re
+import sre_parse
+import time
 import weakref
 
-from PyQt4.QtCore import Qt
+from PyQt4.QtCore import Qt, QTimer
 from PyQt4.QtGui import (
-    QAction, QApplication, QCheckBox, QGridLayout, QKeySequence, QLabel,
-    QLineEdit, QPalette, QPushButton, QStyle, QTextCursor, QToolButton, QWidget)
+    QAction, QApplication, QCheckBox, QComboBox, QGridLayout, QKeySequence,
+    QLabel, QLineEdit, QPalette, QPushButton, QStyle, QTextCursor, QToolButton,
+    QWidget)
+
+import ly.lex
+import ly.lex.lilypond
+import ly.lex.scheme
 
 import app
 import qutil
 import plugin
 import cursortools
+import positionlist
 import textformats
+import tokeniter
 import viewhighlighter
 import widgets.borderlayout
 
 
+# milliseconds to wait after the search text was changed before searching
+_SEARCH_DELAY = 100
+
+# seconds to search at a time before letting the application handle events
+_SEARCH_SLICE = 0.02
+
+# the token classes a search can be restricted to
+_scopes = (
+    (lambda: _("All Text"), None),
+    (lambda: _("Notes"), (
+        ly.lex.lilypond.Note,
+        ly.lex.lilypond.Octave,
+        ly.lex.lilypond.OctaveCheck,
+        ly.lex.lilypond.Accidental,
+    )),
+    (lambda: _("Durations"), ly.lex.lilypond.Duration),
+    (lambda: _("Markup"), (
+        ly.lex.lilypond.Markup,
+        ly.lex.lilypond.MarkupWord,
+    )),
+    (lambda: _("Lyrics"), ly.lex.lilypond.Lyric),
+    (lambda: _("Comments"), ly.lex.Comment),
+    (lambda: _("Strings"), ly.lex.String),
+    (lambda: _("Scheme"), (
+        ly.lex.lilypond.SchemeStart,
+        ly.lex.scheme.Scheme,
+        ly.lex.scheme.Number,
+        ly.lex.scheme.String,
+        ly.lex.scheme.Comment,
+    )),
+    (lambda: _("Commands"), (
+        ly.lex.lilypond.Command,
+        ly.lex.lilypond.Keyword,
+        ly.lex.lilypond.UserCommand,
+    )),
+)
+
+
 class Search(QWidget, plugin.MainWindowPlugin):
     def __init__(self, mainwindow):
         super(Search, self).__init__(mainwindow)
         self._currentView = None
-        self._positions = None
+        self._document = None   # the document we are connected to
+        self._revision = None   # the revision of that document
+        self._ranges = positionlist.RangeList()  # the (start, end) of the matches
+        self._found = None      # the ranges found by a running search
+        self._preview = None    # the ranges found in the visible region
+        self._matches = None    # iterator over the matches of a running search
         self._replace = False  # are we in replace mode?
+        self._searchTimer = QTimer(singleShot=True, interval=_SEARCH_DELAY,
+                                   timeout=self.slotSearchTimeout)
+        self._sliceTimer = QTimer(interval=0, timeout=self.searchSlice)
         
         mainwindow.currentViewChanged.connect(self.viewChanged)
         mainwindow.actionCollection.edit_find_next.triggered.connect(self.findNext)
@@ -65,6 +120,8 @@ class Search(QWidget, plugin.MainWindowPlugin):
         self.searchLabel = QLabel()
         self.caseCheck = QCheckBox(checked=True, focusPolicy=Qt.NoFocus)
         self.regexCheck = QCheckBox(focusPolicy=Qt.NoFocus)
+        self.scopeCombo = QComboBox(focusPolicy=Qt.NoFocus)
+        self.scopeCombo.addItems([''] * len(_scopes))
         self.countLabel = QLabel(alignment=Qt.AlignRight | Qt.AlignVCenter)
         self.countLabel.setMinimumWidth(QApplication.fontMetrics().width("9999"))
         self.closeButton = QToolButton(autoRaise=True, focusPolicy=Qt.NoFocus)
@@ -77,11 +134,13 @@ class Search(QWidget, plugin.MainWindowPlugin):
         grid.addWidget(self.searchEntry, 0, 1)
         grid.addWidget(self.caseCheck, 0, 2)
         grid.addWidget(self.regexCheck, 0, 3)
-        grid.addWidget(self.countLabel, 0, 4)
-        grid.addWidget(self.closeButton, 0, 5)
+        grid.addWidget(self.scopeCombo, 0, 4)
+        grid.addWidget(self.countLabel, 0, 5)
+        grid.addWidget(self.closeButton, 0, 6)
         
         self.caseCheck.toggled.connect(self.slotSearchChanged)
         self.regexCheck.toggled.connect(self.slotSearchChanged)
+        self.scopeCombo.currentIndexChanged.connect(self.slotSearchChanged)
         
         self.replaceEntry = QLineEdit()
         self.replaceLabel = QLabel()
@@ -103,6 +162,9 @@ class Search(QWidget, plugin.MainWindowPlugin):
         self.caseCheck.setToolTip(_("Case Sensitive"))
         self.regexCheck.setText(_("&Regex"))
         self.regexCheck.setToolTip(_("Regular Expression"))
+        for i, (title, classes) in enumerate(_scopes):
+            self.scopeCombo.setItemText(i, title())
+        self.scopeCombo.setToolTip(_("Only search in the text of these items"))
         self.countLabel.setToolTip(_("The total number of matches"))
         self.hideAction.setToolTip(_("Close"))
         self.replaceLabel.setText(_("Replace:"))
@@ -123,7 +185,15 @@ class Search(QWidget, plugin.MainWindowPlugin):
         return self._currentView and self._currentView()
     
     def setCurrentView(self, view):
+        # disconnect from the document even if the old view is already deleted
+        old = self._document and self._document()
+        if old:
+            old.contentsChange.disconnect(self.slotContentsChange)
         self._currentView = weakref.ref(view) if view else None
+        self._document = weakref.ref(view.document()) if view else None
+        if view:
+            self._revision = view.document().revision()
+            view.document().contentsChange.connect(self.slotContentsChange)
         
     def showWidget(self):
         if self.isVisible():
@@ -193,50 +263,198 @@ class Search(QWidget, plugin.MainWindowPlugin):
         focus.setFocus()
         
     def slotSearchChanged(self):
+        """Called when the search text or options change, searches soon."""
+        self._searchTimer.start()
+    
+    def slotSearchTimeout(self):
+        """Called shortly after the search text or options changed."""
         self.updatePositions()
-        viewhighlighter.highlighter(self.currentView()).highlight("search", self._positions, 1)
-
-    def updatePositions(self):
+        self.highlightMatches()
+    
+    def pattern(self):
+        """Returns the compiled regular expression to search for, or None."""
         search = self.searchEntry.text()
-        view = self.currentView()
-        document = view.document()
-        self._positions = []
         if search:
-            text = document.toPlainText()
             flags = re.MULTILINE | re.DOTALL
             if not self.caseCheck.isChecked():
                 flags |= re.IGNORECASE
             if not self.regexCheck.isChecked():
                 search = re.escape(search)
             try:
-                matches = re.finditer(search, text, flags)
+                return re.compile(search, flags)
             except re.error:
                 pass
+    
+    def scope(self):
+        """Returns the token classes to restrict the search to, or None."""
+        return _scopes[self.scopeCombo.currentIndex()][1]
+    
+    def finditer(self, pattern, start=0, end=None, text=None):
+        """Yields the (start, end) positions of the matches of the pattern in the current view.
+        
+        If text (the text of the document) is given, it is searched, so that
+        a match can span multiple blocks. Otherwise the document is searched
+        block by block, and None is yielded after every block, so that a
+        search can be interrupted while no matches are found.
+        
+        If the search is restricted to some token classes, only the text of
+        those tokens is searched.
+        
+        """
+        document = self.currentView().document()
+        if end is None:
+            end = document.characterCount() - 1
+        classes = self.scope()
+        if text is not None and not classes:
+            for m in pattern.finditer(text, start, end):
+                yield m.span()
+            return
+        block = document.findBlock(start)
+        while block.isValid() and block.position() < end:
+            pos = block.position()
+            if text is None:
+                source, offset = block.text(), pos
             else:
-                for m in matches:
-                    c = QTextCursor(document)
-                    c.setPosition(m.end())
-                    c.setPosition(m.start(), QTextCursor.KeepAnchor)
-                    self._positions.append(c)
-        self.countLabel.setText(unicode(len(self._positions)))
+                source, offset = text, 0
+            spans = tokeniter.spans(block, classes) if classes else ((0, block.length() - 1),)
+            for s, e in spans:
+                for m in pattern.finditer(source,
+                        max(start, pos + s) - offset, min(end, pos + e) - offset):
+                    yield m.start() + offset, m.end() + offset
+            yield None
+            block = block.next()
+    
+    def multiline(self):
+        """Returns True if a match may span multiple blocks.
+        
+        Only a regular expression can match a newline, a plain search text
+        can't contain one.
+        
+        """
+        return self.regexCheck.isChecked()
+    
+    def updatePositions(self):
+        """Starts searching the current view.
         
+        The visible region is searched first, the rest of the document is
+        searched in slices in the background. The matches are stored as
+        positions; QTextCursors are only created for highlighting visible
+        matches and for moving the text cursor.
+        
+        The document is searched block by block, only a regular expression
+        search uses one copy of the text of the document.
+        
+        """
+        self._searchTimer.stop()
+        self._sliceTimer.stop()
+        self._ranges = positionlist.RangeList()
+        self._found = self._preview = self._matches = None
+        view = self.currentView()
+        pattern = self.pattern()
+        if view and pattern:
+            text = view.document().toPlainText() if self.multiline() else None
+            start, end = cursortools.visible_range(view)
+            self._preview = [m for m in self.finditer(pattern, start, end, text) if m]
+            self._found = []
+            self._matches = self.finditer(pattern, text=text)
+            self.searchSlice()
+        else:
+            self.updateCount()
+    
+    def searchSlice(self):
+        """Searches for a short time, continues later if the search is not done."""
+        found = self._found
+        finish = time.time() + _SEARCH_SLICE
+        for m in self._matches:
+            if m:
+                found.append(m)
+            if time.time() > finish:
+                self._sliceTimer.start()
+                break
+        else:
+            self._sliceTimer.stop()
+            self._matches = self._preview = None
+        # combine the matches found until now with those in the visible region
+        if self._preview:
+            searched = found[-1][1] if found else 0
+            index = bisect.bisect_left(self._preview, (searched,))
+            self._ranges = positionlist.RangeList(found + self._preview[index:])
+        else:
+            self._ranges = positionlist.RangeList(found)
+        if not self._matches:
+            self._found = None
+        self.updateCount()
+        self.highlightMatches()
+    
+    def finishSearch(self):
+        """Completes a running search immediately."""
+        while self._matches:
+            self._sliceTimer.stop()
+            self.searchSlice()
+    
+    def updateCount(self):
+        """Shows the number of matches, followed by an ellipsis while searching."""
+        count = unicode(len(self._ranges))
+        self.countLabel.setText(count + "\u2026" if self._matches else count)
+    
+    def slotContentsChange(self, position, removed, added):
+        """Called when the document changes, keeps the match positions up-to-date.
+        
+        Matches that are touched by the change are removed, a running search
+        is started again. If the search is restricted to some token classes,
+        the change can alter the tokens after it, so then the search is
+        started again if the widget is visible.
+        
+        Formatting changes by the highlighter (that do not increase the
+        document's revision) are ignored.
+        
+        """
+        revision = self._document().revision()
+        if removed == added and revision == self._revision:
+            return
+        self._revision = revision
+        self._ranges.discard(position, removed, added)
+        if self._matches or (self.scope() and self.isVisible()):
+            self._sliceTimer.stop()
+            self._searchTimer.start()
+        else:
+            self.updateCount()
+    
+    def cursor(self, index):
+        """Returns a QTextCursor selecting the match, with the position at its start."""
+        start, end = self._ranges[index]
+        c = QTextCursor(self.currentView().document())
+        c.setPosition(end)
+        c.setPosition(start, QTextCursor.KeepAnchor)
+        return c
+    
+    def highlightMatches(self):
+        """Highlights the matches in the current view.
+        
+        The highlighter only creates ExtraSelections for the matches in
+        the visible region.
+        
+        """
+        view = self.currentView()
+        if view and self.isVisible():
+            viewhighlighter.highlighter(view).highlightRanges("search",
+                self._ranges, 1)
+    
     def findNext(self):
         view = self.currentView()
-        if view and self._positions:
-            positions = [c.position() for c in self._positions]
-            index = bisect.bisect_right(positions, view.textCursor().position())
-            if index < len(positions):
-                view.setTextCursor(self._positions[index])
+        if view and self._ranges:
+            index = self._ranges.bisect_right(view.textCursor().position())
+            if index < len(self._ranges):
+                view.setTextCursor(self.cursor(index))
             else:
-                view.setTextCursor(self._positions[0])
+                view.setTextCursor(self.cursor(0))
             view.ensureCursorVisible()
 
     def findPrevious(self):
         view = self.currentView()
-        positions = [c.position() for c in self._positions]
-        if view and positions:
-            index = bisect.bisect_left(positions, view.textCursor().position()) - 1
-            view.setTextCursor(self._positions[index])
+        if view and self._ranges:
+            index = self._ranges.bisect_left(view.textCursor().position()) - 1
+            view.setTextCursor(self.cursor(index))
             view.ensureCursorVisible()
 
     def keyPressEvent(self, ev):
@@ -245,7 +463,7 @@ class Search(QWidget, plugin.MainWindowPlugin):
             self.window().focusNextChild()
             return
         # if in search mode, Up and Down jump between search results
-        if not self._replace and self._positions and self.searchEntry.text() and not ev.modifiers():
+        if not self._replace and self._ranges and self.searchEntry.text() and not ev.modifiers():
             if ev.key() == Qt.Key_Up:
                 self.findPrevious()
                 return
@@ -280,32 +498,70 @@ class Search(QWidget, plugin.MainWindowPlugin):
         
     def slotReplace(self):
         view = self.currentView()
-        if view and self._positions:
-            positions = [c.position() for c in self._positions]
-            index = bisect.bisect_left(positions, view.textCursor().position())
-            if index >= len(positions):
+        if view and self._ranges:
+            index = self._ranges.bisect_left(view.textCursor().position())
+            if index >= len(self._ranges):
                 index = 0
-            if self.doReplace(self._positions[index]):
-                viewhighlighter.highlighter(view).highlight("search", self._positions, 1)
-                if index < len(positions) - 1:
-                    view.setTextCursor(self._positions[index+1])
-                else:
-                    view.setTextCursor(self._positions[0])
+            # the replaced match is removed from the positions by slotContentsChange()
+            if self.doReplace(self.cursor(index)):
+                self.highlightMatches()
+                if index < len(self._ranges):
+                    view.setTextCursor(self.cursor(index))
+                elif self._ranges:
+                    view.setTextCursor(self.cursor(0))
                 view.ensureCursorVisible()
     
     def slotReplaceAll(self):
+        """Replaces all matches in the document or the selection.
+        
+        The replacements are computed at once and then applied from the last
+        match to the first, with one QTextCursor, in one undo step. The text
+        between the matches is not touched, so QTextCursors (e.g. bookmarks)
+        in it keep their position.
+        
+        """
         view = self.currentView()
-        if view:
-            replaced = False
-            cursors = self._positions
-            if view.textCursor().hasSelection():
-                cursors = [cursor for cursor in cursors if cursortools.contains(view.textCursor(), cursor)]
-            view.textCursor().beginEditBlock()
-            for cursor in cursors:
-                if self.doReplace(cursor):
-                    replaced = True
-            view.textCursor().endEditBlock()
-            if replaced:
-                viewhighlighter.highlighter(view).highlight("search", self._positions, 1)
-
-
+        pattern = self.pattern()
+        if not view or not pattern:
+            return
+        self.finishSearch()
+        ranges = self._ranges
+        first, last = 0, len(ranges)
+        selection = view.textCursor()
+        if selection.hasSelection():
+            # the matches don't overlap, only one can end after the selection
+            first = ranges.bisect_left(selection.selectionStart())
+            last = ranges.bisect_right(selection.selectionEnd())
+            if last > first and ranges[last - 1][1] > selection.selectionEnd():
+                last -= 1
+        if first == last:
+            return
+        text = view.document().toPlainText()
+        replace = self.replaceEntry.text()
+        template = None
+        if self.regexCheck.isChecked():
+            # parse the replacement once, instead of for every match
+            try:
+                template = sre_parse.parse_template(replace, pattern)
+            except (re.error, IndexError):
+                return
+        edits = []
+        for s, e in (ranges[i] for i in range(first, last)):
+            if template is not None:
+                m = pattern.match(text, s, e)
+                if not m:
+                    continue
+                try:
+                    new = sre_parse.expand_template(template, m)
+                except (re.error, IndexError):
+                    return
+            else:
+                new = replace
+            if new != text[s:e]:
+                edits.append((s, e, new))
+        if edits:
+            # the replaced matches are gone, slotContentsChange() moves the others
+            ranges.remove(first, last)
+            cursortools.replace_ranges(QTextCursor(view.document()), edits)
+            self.updateCount()
+            self.highlightMatches()
@@ -385,29 +385,63 @@ class FallthroughParser(Parser):
 
 
 class Fridge(object):
-    """Stores frozen States under an integer number."""
+    """Stores frozen States under an integer number.
+    
+    A dictionary maps every frozen state to its number, so freezing and thawing
+    a state are both fast, regardless of the number of states in the Fridge.
+    
+    Numbers that are not in use anymore can be released using collect(), they
+    are then reused for newly frozen states.
+    
+    """
     def __init__(self, stateClass = State):
         self._stateClass = stateClass
         self._states = []
+        self._numbers = {}
+        self._free = []
     
     def freeze(self, state):
         """Stores a state and return an identifying integer."""
         frozen = state.freeze()
         try:
-            return self._states.index(frozen)
-        except ValueError:
-            i = len(self._states)
-            self._states.append(frozen)
-            return i
+            return self._numbers[frozen]
+        except KeyError:
+            if self._free:
+                num = self._free.pop()
+                self._states[num] = frozen
+            else:
+                num = len(self._states)
+                self._states.append(frozen)
+            self._numbers[frozen] = num
+            return num
 
     def thaw(self, num):
         """Returns the state stored under the specified number."""
         if 0 <= num < len(self._states):
-            return self._stateClass.thaw(self._states[num])
+            frozen = self._states[num]
+            if frozen is not None:
+                return self._stateClass.thaw(frozen)
 
     def count(self):
         """Returns the number of stored frozen states."""
-        return len(self._states)
+        return len(self._numbers)
+    
+    def collect(self, used):
+        """Releases all states whose number is not in the iterable used.
+        
+        The numbers of the released states will be reused by freeze().
+        Returns the number of states that were released.
+        
+        """
+        used = set(used)
+        released = 0
+        for num, frozen in enumerate(self._states):
+            if frozen is not None and num not in used:
+                del self._numbers[frozen]
+                self._states[num] = None
+                self._free.append(num)
+                released += 1
+        return released
 
 
 def uniq(iterable):
@@ -476,5 +510,9 @@ if __name__ == "__main__":
     s = f.thaw(n)
     for t in s.tokens('quoted string" in the middle'):
         print(t.__class__, t)
+    
+    # release the state
+    print('collect unused states:')
+    print(f.collect(()), f.count(), f.thaw(n))
 
 
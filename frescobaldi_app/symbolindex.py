@@ -0,0 +1,173 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2012 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+An index of the symbols defined in included files, shared by all documents.
+
+For every file the index knows the LilyPond identifiers and the markup
+commands it defines, and for every symbol the files that define it.
+The symbols of the whole include tree of a file are combined once and then
+kept until a file in the tree changes.
+
+The symbols of a file are taken from the factscache if the file did not change,
+so they are persistent across sessions. Only files that changed are read again.
+
+Use index() to get the global SymbolIndex instance.
+
+"""
+
+from __future__ import unicode_literals
+
+import factscache
+import fileinfo
+import includegraph
+import signals
+
+
+__all__ = ['index', 'SymbolIndex']
+
+
+# the maximum number of include trees to keep the combined symbols of
+MAXTREES = 100
+
+
+_index = None
+
+
+def index():
+    """Returns the global SymbolIndex instance."""
+    global _index
+    if _index is None:
+        _index = SymbolIndex()
+    return _index
+
+
+class SymbolIndex(object):
+    """Keeps the symbols defined by files and by their include trees.
+
+    The kind of a symbol is 'names' for LilyPond identifiers and
+    'markup_commands' for markup command definitions, like the FileInfo
+    methods of the same name.
+
+    The changed() signal is emitted with the filename when the symbols of a
+    file are forgotten because it changed on disk.
+
+    """
+    changed = signals.Signal()
+
+    kinds = ('names', 'markup_commands')
+
+    def __init__(self):
+        self._files = {}        # filename: {kind: tuple of symbols}
+        self._definitions = {}  # symbol: set of filenames that define it
+        self._trees = {}        # (filename, include_path, args): (files, {kind: frozenset})
+        graph = includegraph.graph()
+        graph.changed.connect(self.slotGraphChanged)
+        graph.fileChanged.connect(self.forget)
+
+    def symbols(self, filename, kind):
+        """Returns a tuple with the symbols of the given kind the file defines."""
+        return self._symbols(filename)[kind]
+
+    def definitions(self, symbol):
+        """Returns the set of filenames that are known to define the symbol.
+
+        Only files that were added or that are in an include tree that was
+        asked for are considered.
+
+        """
+        return set(self._definitions.get(symbol, ()))
+
+    def add(self, filenames):
+        """Adds the symbols of the files to the index, e.g. after a prescan."""
+        for filename in filenames:
+            self._symbols(filename)
+
+    def tree(self, filename, include_path=(), initial_args=None, kind='names'):
+        """Returns a frozenset with the symbols the include tree of the file defines.
+
+        The arguments are the same as for IncludeGraph.includefiles(); the
+        file itself is not included in the result. The result is cached until
+        one of the files changes.
+
+        """
+        key = (filename, tuple(include_path),
+               None if initial_args is None else tuple(initial_args))
+        try:
+            return self._trees[key][1][kind]
+        except KeyError:
+            pass
+        files = includegraph.graph().includefiles(filename, include_path, initial_args)
+        symbols = dict((k, set()) for k in self.kinds)
+        for path in files:
+            for k, values in self._symbols(path).items():
+                symbols[k].update(values)
+        if len(self._trees) >= MAXTREES:
+            self._trees.clear()
+        result = dict((k, frozenset(v)) for k, v in symbols.items())
+        self._trees[key] = (frozenset(files) | frozenset((filename,)), result)
+        return result[kind]
+
+    def forget(self, filename):
+        """Forgets the symbols of the file, they are looked up again when needed."""
+        symbols = self._files.pop(filename, None)
+        if symbols is not None:
+            for values in symbols.values():
+                for symbol in values:
+                    files = self._definitions.get(symbol)
+                    if files:
+                        files.discard(filename)
+                        if not files:
+                            del self._definitions[symbol]
+            self._forgetTrees(filename)
+            self.changed(filename)
+
+    def slotGraphChanged(self, filename):
+        """Called when the include graph changed, forgets the affected include trees.
+
+        If filename is None, all include trees are forgotten.
+
+        """
+        if filename is None:
+            self._trees.clear()
+        else:
+            self._forgetTrees(filename)
+
+    def _forgetTrees(self, filename):
+        """(Internal) Forgets the include trees the file is a part of."""
+        for key, (files, symbols) in list(self._trees.items()):
+            if filename in files:
+                del self._trees[key]
+
+    def _symbols(self, filename):
+        """(Internal) Returns the dictionary with the symbols of the file."""
+        try:
+            return self._files[filename]
+        except KeyError:
+            pass
+        facts = factscache.stored(filename)
+        if facts is None or any(k not in facts for k in self.kinds):
+            info = fileinfo.FileInfo.info(filename)
+            facts = dict((k, getattr(info, k)()) for k in self.kinds)
+        symbols = self._files[filename] = dict(
+            (k, tuple(map(unicode, facts[k]))) for k in self.kinds)
+        for values in symbols.values():
+            for symbol in values:
+                self._definitions.setdefault(symbol, set()).add(filename)
+        return symbols
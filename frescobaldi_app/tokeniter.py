@@ -22,8 +22,8 @@ Use this module to get the parsed tokens of a document.
 
 The tokens are created by the syntax highlighter, see highlighter.py.
 The core methods of this module are tokens() and state(). These access
-the token information from the highlighter, and also run the highlighter
-if it has not run yet.
+the token information from the highlighter, and also lex the blocks the
+highlighter has not processed yet.
 
 If you alter the document and directly after that need the new tokens,
 use update().
@@ -43,13 +43,24 @@ import highlighter
 def tokens(block):
     """Returns the tokens for the given block as a (possibly empty) tuple."""
     try:
-        return block.userData().tokens
+        tokens = block.userData().tokens
     except AttributeError:
-        highlighter.highlighter(block.document()).rehighlight()
-    try:
-        return block.userData().tokens
-    except AttributeError:
-        return ()
+        pass
+    else:
+        if not highlighter.deferred(block):
+            return tokens
+    return highlighter.highlighter(block.document()).tokens(block)
+
+
+def spans(block, classes):
+    """Returns a list of (start, end) ranges in the block of tokens of the classes.
+
+    classes is a class or tuple of classes, like for isinstance().
+    Adjacent tokens are combined into one range. This is faster than looking
+    at tokens() because the tokens need not be created.
+
+    """
+    return highlighter.highlighter(block.document()).spans(block, classes)
 
 
 def state(blockOrCursor):
@@ -62,9 +73,9 @@ def state(blockOrCursor):
         block = cursortools.block(blockOrCursor)
     else:
         block = blockOrCursor
-    if block.userState() == -1:
-        highlighter.highlighter(block.document()).rehighlight()
-    return highlighter.highlighter(block.document()).state(block)
+    h = highlighter.highlighter(block.document())
+    h.lexBlocks(block.previous())
+    return h.state(block)
 
 
 def update(block):
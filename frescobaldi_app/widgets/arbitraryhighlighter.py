@@ -20,24 +20,46 @@
 """
 Manages highlighting of arbitrary sections in a Q(Plain)TextEdit
 using QTextEdit.ExtraSelections.
+
+The highlighted sections are stored as lists of positions that are kept
+up-to-date when the document changes (see positionlist.RangeList).
+ExtraSelections are only created for the sections that are in or near the
+visible part of the textedit, so that Qt does not need to handle very many
+of them on every repaint, and they are reused until the textedit scrolls out
+of that part or the document changes.
 """
 
 import weakref
 
 from PyQt4.QtCore import QObject, QTimer
-from PyQt4.QtGui import QTextCharFormat, QTextEdit, QTextFormat
+from PyQt4.QtGui import QTextCharFormat, QTextCursor, QTextEdit, QTextFormat
+
+import cursortools
+import positionlist
+
+
+# the number of blocks above and below the visible part of the textedit
+# that are also highlighted, so that most scrolling needs no update
+MARGIN = 100
 
 
 class ArbitraryHighlighter(QObject):
     """Manages highlighting of arbitrary sections in a Q(Plain)TextEdit.
     
-    Stores and highlights lists of QTextCursors on a per-format basis.
+    Stores and highlights lists of ranges on a per-format basis.
     
     """
     def __init__(self, edit):
         """Initializes ourselves with a Q(Plain)TextEdit as parent."""
         super(ArbitraryHighlighter, self).__init__(edit)
         self._selections = {}
+        self._window = None     # the range that currently has ExtraSelections
+        self._extraSelections = {}  # the ExtraSelections in the window per format
+        self._revision = edit.document().revision()
+        self._updateTimer = QTimer(singleShot=True, timeout=self.update)
+        edit.document().contentsChange.connect(self.slotContentsChange)
+        edit.verticalScrollBar().valueChanged.connect(self.slotScrolled)
+        edit.verticalScrollBar().rangeChanged.connect(self.slotScrolled)
     
     def highlight(self, format, cursors, priority=0, msec=0):
         """Highlights the selection of an arbitrary list of QTextCursors.
@@ -48,14 +70,19 @@ class ArbitraryHighlighter(QObject):
         is drawn over highlighting with lower priority.
         msec, if > 0, removes the highlighting after that many milliseconds.
         
+        """
+        ranges = [(c.selectionStart(), c.selectionEnd()) for c in cursors]
+        self.highlightRanges(format, ranges, priority, msec)
+
+    def highlightRanges(self, format, ranges, priority=0, msec=0):
+        """Highlights an arbitrary list of (start, end) position tuples.
+        
+        The arguments are the same as for highlight(), but instead of
+        QTextCursors the positions are given; this is faster for many ranges.
+        
         """
         fmt = format if isinstance(format, QTextFormat) else self.textFormat(format)
-        selections = []
-        for cursor in cursors:
-            es = QTextEdit.ExtraSelection()
-            es.cursor = cursor
-            es.format = fmt
-            selections.append(es)
+        ranges = positionlist.RangeList(ranges)
         if msec:
             def clear(selfref=weakref.ref(self)):
                 self = selfref()
@@ -63,9 +90,10 @@ class ArbitraryHighlighter(QObject):
                     self.clear(format)
             timer = QTimer(timeout=clear, singleShot=True)
             timer.start(msec)
-            self._selections[format] = (priority, selections, timer)
+            self._selections[format] = (priority, fmt, ranges, timer)
         else:
-            self._selections[format] = (priority, selections)
+            self._selections[format] = (priority, fmt, ranges)
+        self._extraSelections.pop(format, None)
         self.update()
 
     def clear(self, format):
@@ -75,26 +103,82 @@ class ArbitraryHighlighter(QObject):
         except KeyError:
             pass
         else:
+            self._extraSelections.pop(format, None)
             self.update()
 
     def textFormat(self, name):
         """Implement this to return a QTextCharFormat for the given name."""
         raise NotImplementedError
 
+    def slotContentsChange(self, position, removed, added):
+        """(Internal) Called when the document changes, adjusts the ranges.
+        
+        Formatting changes by the highlighter (that do not increase the
+        document's revision) are ignored.
+        
+        """
+        revision = self.parent().document().revision()
+        if removed == added and revision == self._revision:
+            return
+        self._revision = revision
+        for s in self._selections.values():
+            s[2].adjust(position, removed, added)
+        self._window = None
+        self._extraSelections.clear()
+        self._updateTimer.start()
+
+    def slotScrolled(self):
+        """(Internal) Called when the textedit scrolls, updates if needed."""
+        window = self._window
+        if window is None:
+            return
+        start, end = cursortools.visible_range(self.parent())
+        if start < window[0] or end > window[1]:
+            self.update()
+
     def update(self):
         """(Internal) Called whenever the arbitrary highlighting changes."""
         textedit = self.parent()
         if textedit:
-            textedit.setExtraSelections(
-                sum((s[1] for s in sorted(self._selections.values())), []))
+            self._updateTimer.stop()
+            doc = textedit.document()
+            start, end = cursortools.visible_range(textedit)
+            first = doc.findBlock(start).blockNumber() - MARGIN
+            last = doc.findBlock(end).blockNumber() + MARGIN
+            first = doc.findBlockByNumber(max(0, first))
+            last = doc.findBlockByNumber(min(doc.blockCount() - 1, last))
+            window = first.position(), last.position() + last.length() - 1
+            if window != self._window:
+                self._window = window
+                self._extraSelections.clear()
+            selections = []
+            for format, s in sorted(self._selections.items(), key=lambda i: i[1][0]):
+                try:
+                    extra = self._extraSelections[format]
+                except KeyError:
+                    extra = self._extraSelections[format] = self.extraSelections(
+                        s[1], s[2].ranges(*window))
+                selections.extend(extra)
+            textedit.setExtraSelections(selections)
+    
+    def extraSelections(self, format, ranges):
+        """(Internal) Returns a list of ExtraSelections for the (start, end) ranges."""
+        doc = self.parent().document()
+        selections = []
+        for start, end in ranges:
+            es = QTextEdit.ExtraSelection()
+            es.cursor = cursor = QTextCursor(doc)
+            cursor.setPosition(start)
+            cursor.setPosition(end, QTextCursor.KeepAnchor)
+            es.format = format
+            selections.append(es)
+        return selections
 
     def reload(self):
         """Reloads the named formats in the highlighting (e.g. in case of settings change)."""
-        for format in self._selections:
+        for format, s in self._selections.items():
             if not isinstance(format, QTextFormat):
-                fmt = self.textFormat(format)
-                for es in self._selections[format][1]:
-                    es.format = fmt
+                self._selections[format] = (s[0], self.textFormat(format)) + s[2:]
+        self._extraSelections.clear()
         self.update()
 
-
@@ -0,0 +1,39 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2012 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Makes the frescobaldi_app modules available to the tests.
+
+Most tests in this directory test modules that do not need PyQt4; the tests
+that do need it are skipped if it is not installed. They are run from the
+toplevel Frescobaldi directory, e.g.:
+
+python -m unittest discover tests
+
+"""
+
+from __future__ import unicode_literals
+
+import os
+import sys
+
+
+# make the frescobaldi_app modules available as toplevel modules
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'frescobaldi_app'))
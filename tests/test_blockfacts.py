@@ -0,0 +1,93 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2012 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Tests for documentinfo.BlockFacts with deferred highlighting.
+
+These tests need PyQt4, they are skipped if it is not installed.
+"""
+
+from __future__ import unicode_literals
+
+import unittest
+
+import apppath
+
+try:
+    from PyQt4.QtGui import QTextCursor
+except ImportError:
+    QTextCursor = None
+else:
+    import app          # creates the QApplication
+    import document
+    import documentinfo
+    import highlighter
+
+
+@unittest.skipIf(QTextCursor is None, "PyQt4 is not installed")
+class TestDeferredBlockFacts(unittest.TestCase):
+
+    def setUp(self):
+        self.doc = document.Document()
+        self.doc.setPlainText('\\version "2.16.0"\n{ c d }\n\\include "a.ly"\n')
+        self.highlighter = h = highlighter.highlighter(self.doc)
+        h._background = False
+        h.rehighlight()
+        self.facts = documentinfo.BlockFacts.instance(self.doc)
+
+    def tearDown(self):
+        self.doc.close()
+
+    def includes(self):
+        return list(self.facts.facts('include'))
+
+    def defer(self, position, text):
+        """Inserts text, with the highlighter deferring the changed block."""
+        h = self.highlighter
+        h._background = True
+        h._burstEnd = 0.0   # the slice budget is used up
+        cursor = QTextCursor(self.doc)
+        cursor.setPosition(position)
+        cursor.insertText(text)
+        h._backgroundTimer.stop()
+        h._background = False
+        h._burstEnd = None
+
+    def test_deferred_block_lexed_later(self):
+        self.assertEqual(self.includes(), ['a.ly'])
+        block = self.doc.findBlockByNumber(1)
+        self.defer(block.position(), '%{ ')
+        # the block was postponed, Qt did not go on with the following blocks
+        self.assertTrue(highlighter.postponed(block))
+        self.assertFalse(highlighter.postponed(block.next()))
+        # finish lexing in the background, the include is commented out now
+        self.highlighter._process()
+        self.assertEqual(self.includes(), [])
+
+    def test_deferred_block_lexed_on_demand(self):
+        self.assertEqual(self.includes(), ['a.ly'])
+        self.defer(0, '%{ ')
+        # getting the facts lexes the blocks following the deferred one
+        self.assertEqual(self.includes(), [])
+        self.defer(self.doc.findBlockByNumber(1).position(), '%} ')
+        self.assertEqual(self.includes(), ['a.ly'])
+
+
+if __name__ == '__main__':
+    unittest.main()
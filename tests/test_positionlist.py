@@ -0,0 +1,270 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2012 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Tests for the positionlist module.
+"""
+
+from __future__ import unicode_literals
+
+import bisect
+import random
+import unittest
+
+import apppath
+
+from positionlist import PositionList, RangeList, change_ranges
+
+
+class PositionListTest(unittest.TestCase):
+    def assertList(self, p, expected):
+        self.assertEqual(p.positions(), expected)
+        self.assertEqual(list(p), expected)
+        self.assertEqual(len(p), len(expected))
+        self.assertEqual([p[i] for i in range(len(p))], expected)
+        if expected:
+            self.assertEqual(p[-1], expected[-1])
+
+    def test_shift(self):
+        p = PositionList([1, 5, 9, 12])
+        p.shift(2, 10)
+        self.assertList(p, [1, 5, 19, 22])
+        p.shift(1, -2)
+        self.assertList(p, [1, 3, 17, 20])
+        p.shift(4, 100)
+        self.assertList(p, [1, 3, 17, 20])
+        p.shift(0, 1)
+        self.assertList(p, [2, 4, 18, 21])
+
+    def test_replace(self):
+        p = PositionList([1, 5, 9, 12])
+        p.shift(2, 10)
+        p.replace(1, 3)
+        self.assertList(p, [1, 22])
+        p.insert(1, 7)
+        self.assertList(p, [1, 7, 22])
+        p.replace(0, 2, [3, 3, 3])
+        self.assertList(p, [3, 3, 3, 22])
+
+    def test_bisect(self):
+        p = PositionList([1, 5, 5, 9, 12])
+        p.shift(3, 3)   # [1, 5, 5, 12, 15]
+        for pos in range(-1, 18):
+            expected = [1, 5, 5, 12, 15]
+            self.assertEqual(p.bisect_left(pos), bisect.bisect_left(expected, pos))
+            self.assertEqual(p.bisect_right(pos), bisect.bisect_right(expected, pos))
+
+    def test_change(self):
+        p = PositionList([1, 5, 9, 12])
+        # insert at a position
+        p.change(5, 0, 3)
+        self.assertList(p, [1, 8, 12, 15])
+        # remove text containing positions
+        p.change(7, 6, 2)
+        self.assertList(p, [1, 9, 9, 11])
+        # formatting-like change of the same length
+        p.change(0, 2, 2)
+        self.assertList(p, [2, 9, 9, 11])
+
+    def test_random_change(self):
+        """Compares change() with moving the positions like QTextCursors."""
+        rnd = random.Random(0)
+        for run in range(50):
+            ref = sorted(rnd.randrange(1000) for i in range(rnd.randrange(30)))
+            p = PositionList(ref)
+            for step in range(100):
+                position = rnd.randrange(1100)
+                removed = rnd.choice((0, 0, 1, 3, 20))
+                added = rnd.choice((0, 0, 1, 3, 20))
+                p.change(position, removed, added)
+                ref = [r if r < position else
+                       position + added if r <= position + removed else
+                       r + added - removed for r in ref]
+                self.assertEqual(p.positions(), ref)
+
+    def test_random(self):
+        """Compares a PositionList with a plain list after many random operations."""
+        rnd = random.Random(0)
+        for run in range(50):
+            ref = sorted(rnd.randrange(1000) for i in range(rnd.randrange(30)))
+            p = PositionList(ref)
+            for step in range(200):
+                op = rnd.randrange(3)
+                index = rnd.randrange(len(ref) + 1)
+                if op == 0:
+                    # shift, keeping the list sorted
+                    low = ref[index - 1] if index else -1000
+                    high = ref[index] if index < len(ref) else low
+                    delta = rnd.randint(low - high, 50)
+                    p.shift(index, delta)
+                    ref[index:] = [r + delta for r in ref[index:]]
+                elif op == 1:
+                    end = rnd.randrange(index, len(ref) + 1)
+                    low = ref[index - 1] if index else -1000
+                    high = ref[end] if end < len(ref) else low + 100
+                    new = sorted(rnd.randint(low, high) for i in range(rnd.randrange(4)))
+                    p.replace(index, end, new)
+                    ref[index:end] = new
+                else:
+                    pos = rnd.randint(-1100, 2000)
+                    self.assertEqual(p.bisect_left(pos), bisect.bisect_left(ref, pos))
+                    self.assertEqual(p.bisect_right(pos), bisect.bisect_right(ref, pos))
+                self.assertEqual(p.positions(), ref)
+
+
+class RangeListTest(unittest.TestCase):
+    def test_discard(self):
+        r = RangeList([(10, 15), (0, 3), (20, 22)])
+        self.assertEqual(list(r), [(0, 3), (10, 15), (20, 22)])
+        # insert before a range and at its end
+        self.assertEqual(r.discard(10, 0, 2), 0)
+        self.assertEqual(list(r), [(0, 3), (12, 17), (22, 24)])
+        self.assertEqual(r.discard(17, 0, 1), 0)
+        self.assertEqual(list(r), [(0, 3), (12, 17), (23, 25)])
+        # insert inside a range
+        self.assertEqual(r.discard(1, 0, 1), 1)
+        self.assertEqual(list(r), [(13, 18), (24, 26)])
+        # remove text touching a range
+        self.assertEqual(r.discard(10, 4, 0), 1)
+        self.assertEqual(list(r), [(20, 22)])
+        # replace a range by text of the same length
+        self.assertEqual(r.discard(20, 2, 2), 1)
+        self.assertEqual(list(r), [])
+
+    def test_remove(self):
+        r = RangeList([(0, 3), (10, 15), (20, 22), (30, 31)])
+        r.discard(5, 0, 2)
+        r.remove(1, 3)
+        self.assertEqual(list(r), [(0, 3), (32, 33)])
+        self.assertEqual(r.discard(12, 6, 0), 0)
+        self.assertEqual(list(r), [(0, 3), (26, 27)])
+
+    def test_bisect(self):
+        r = RangeList([(0, 3), (10, 15), (20, 22)])
+        self.assertEqual(r.bisect_left(10), 1)
+        self.assertEqual(r.bisect_right(10), 2)
+        self.assertEqual(r[-1], (20, 22))
+
+    def test_adjust(self):
+        r = RangeList([(0, 3), (10, 15), (20, 22)])
+        # insert at the end of a range and before a range
+        r.adjust(3, 0, 2)
+        self.assertEqual(list(r), [(0, 5), (12, 17), (22, 24)])
+        # remove text containing the start of a range
+        r.adjust(10, 4, 1)
+        self.assertEqual(list(r), [(0, 5), (11, 14), (19, 21)])
+        # remove text containing a whole range
+        r.adjust(18, 5, 0)
+        self.assertEqual(list(r), [(0, 5), (11, 14), (18, 18)])
+
+    def test_ranges(self):
+        r = RangeList([(0, 30), (10, 15), (20, 22), (40, 41)])
+        self.assertEqual(r.ranges(16, 20), [(0, 30), (20, 22)])
+        self.assertEqual(r.ranges(35), [(40, 41)])
+        self.assertEqual(r.ranges(), list(r))
+
+    def test_random_adjust(self):
+        """Compares adjust() and ranges() with a plain computation."""
+        rnd = random.Random(0)
+        for run in range(50):
+            ranges = []
+            for i in range(rnd.randrange(30)):
+                start = rnd.randrange(1000)
+                ranges.append((start, start + rnd.randrange(50)))
+            r = RangeList(ranges)
+            ref = sorted(ranges)
+            for step in range(100):
+                position = rnd.randrange(1100)
+                removed = rnd.choice((0, 0, 1, 3, 20))
+                added = rnd.choice((0, 0, 1, 3, 20))
+                def move(pos):
+                    if pos < position:
+                        return pos
+                    elif pos <= position + removed:
+                        return position + added
+                    return pos + added - removed
+                r.adjust(position, removed, added)
+                ref = [(move(s), move(e)) for s, e in ref]
+                self.assertEqual(sorted(r), sorted(ref))
+                start = rnd.randrange(1100)
+                end = rnd.choice((None, start + rnd.randrange(100)))
+                self.assertEqual(sorted(r.ranges(start, end)), sorted(
+                    (s, e) for s, e in ref
+                    if e >= start and (end is None or s <= end)))
+
+    def test_random(self):
+        """Compares discard() with a plain computation after many random changes."""
+        rnd = random.Random(0)
+        for run in range(50):
+            ranges = []
+            for i in range(rnd.randrange(30)):
+                start = rnd.randrange(1000)
+                ranges.append((start, start + rnd.randrange(20)))
+            r = RangeList(ranges)
+            ref = sorted(ranges)
+            for step in range(100):
+                position = rnd.randrange(1100)
+                removed = rnd.choice((0, 0, 1, 3, 20))
+                added = rnd.choice((0, 0, 1, 3, 20))
+                end = position + removed
+                expected = []
+                for s, e in ref:
+                    if s < end and e > position:
+                        continue
+                    elif s >= end:
+                        s, e = s + added - removed, e + added - removed
+                    expected.append((s, e))
+                self.assertEqual(r.discard(position, removed, added),
+                                 len(ref) - len(expected))
+                ref = sorted(expected)
+                self.assertEqual(list(r), ref)
+                pos = rnd.randrange(1100)
+                self.assertEqual(r.bisect_left(pos),
+                                 bisect.bisect_left([s for s, e in ref], pos))
+
+
+class ChangeRangesTest(unittest.TestCase):
+    def test_change_ranges(self):
+        ranges = change_ranges([(0, 2), (5, 6), (10, 12)], 5, 7, 9)
+        self.assertEqual(ranges, [(5, 9), (0, 2), (12, 14)])
+        ranges = change_ranges(ranges, 1, 13, 1)
+        self.assertEqual(sorted(ranges), [(0, 2)])
+
+    def test_random(self):
+        """Compares the blocks in the ranges with a set of block numbers."""
+        rnd = random.Random(0)
+        for run in range(200):
+            ranges, blocks = [], set()
+            for step in range(20):
+                first = rnd.randrange(100)
+                oldlast = first + rnd.randrange(5)
+                last = first + rnd.randrange(5)
+                delta = last - oldlast
+                blocks = set(b for b in blocks if b < first) | set(
+                    b + delta for b in blocks if b > oldlast) | set(
+                    range(first, last + 1))
+                ranges = change_ranges(ranges, first, oldlast, last)
+                covered = set()
+                for start, end in ranges:
+                    covered.update(range(start, end + 1))
+                self.assertEqual(covered, blocks)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2012 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Tests for ly.util.words2regexp().
+"""
+
+from __future__ import unicode_literals
+
+import random
+import re
+import unittest
+
+import apppath
+
+import ly.util
+import ly.words
+
+
+def plain(words):
+    """Returns a regular expression matching the words, the longest first."""
+    return '|'.join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+
+
+class Words2RegexpTest(unittest.TestCase):
+    def assertSameMatches(self, words, texts):
+        """Checks that words2regexp() finds the same as the plain expression."""
+        tree = re.compile(ly.util.words2regexp(words))
+        simple = re.compile(plain(words))
+        self.assertEqual(tree.groups, 0)
+        for text in texts:
+            self.assertEqual(
+                [m.span() for m in tree.finditer(text)],
+                [m.span() for m in simple.finditer(text)], text)
+
+    def test_words(self):
+        words = ['ab', 'abc', 'abd', 'b', 'ba', 'c-d', '[x]', 'a.b']
+        self.assertSameMatches(words, words + ['abcabdba', 'xabc-d[x]a.bab', 'aXb'])
+        for word in words:
+            self.assertTrue(re.match('(?:{0})$'.format(ly.util.words2regexp(words)), word))
+
+    def test_empty(self):
+        self.assertIsNone(re.match(ly.util.words2regexp([]), 'abc'))
+
+    def test_lilypond_words(self):
+        words = ly.words.lilypond_keywords + ly.words.lilypond_music_commands
+        text = ' '.join(words[::-1]) + ' ' + ''.join(words[::3])
+        self.assertSameMatches(words, [text])
+
+    def test_random(self):
+        rnd = random.Random(0)
+        for run in range(200):
+            words = set(''.join(rnd.choice('abc.') for i in range(rnd.randrange(1, 5)))
+                        for j in range(rnd.randrange(1, 15)))
+            texts = [''.join(rnd.choice('abcd.') for i in range(30)) for j in range(5)]
+            self.assertSameMatches(words, texts)
+
+
+if __name__ == '__main__':
+    unittest.main()